@@ -0,0 +1,246 @@
+"""釣魚機器人事件紀錄的離線分析。
+
+讀取 main.py 的 EventLog 寫出的分段檔 (events/*.evt)，以 NumPy 逐段掃描並彙總：
+
+- 每小時、每個稀有度釣魚賺進的金錢
+- 玩家從第一次出現到買下各魚竿的時間
+- 魚餌的投資報酬率
+- 各魚竿的上鉤率與每次拋竿的收入
+
+    python analytics.py events/
+    python analytics.py events/ --json
+
+分段檔以 np.memmap 讀取，不會整段載入記憶體；每段處理完只留下彙總值，
+記憶體用量與事件總數無關 (只和玩家數有關)。
+"""
+import argparse
+import json
+import os
+import struct
+import sys
+import time
+
+import numpy as np
+
+# 格式與 main.py 的 EVENT_STRUCT / EVENT_HEADER 相同
+EVENT_DTYPE = np.dtype([
+    ('ts', '<f8'),
+    ('user', '<u8'),
+    ('price', '<i4'),
+    ('weight', '<f4'),
+    ('species', '<u2'),
+    ('rod', '<u2'),
+    ('kind', 'u1'),
+    ('rarity', 'u1'),
+    ('bait', 'u1'),
+    ('reserved', 'u1'),
+])
+EVENT_HEADER = struct.Struct('<8sIIQ')
+EVENT_HEADER_SIZE = 64
+EVENT_MAGIC = b'FISHEVT1'
+EVENT_CATCH, EVENT_MISS, EVENT_BUY, EVENT_RESET = 1, 2, 3, 4
+NO_RARITY = 255
+SECONDS_PER_HOUR = 3600
+
+assert EVENT_DTYPE.itemsize == 32
+
+
+def list_segments(directory):
+    """依檔名排序列出分段檔路徑。"""
+    return sorted(
+        os.path.join(directory, name) for name in os.listdir(directory) if name.endswith('.evt')
+    )
+
+
+def read_segment(path):
+    """回傳 (事件陣列 (memmap), 名稱對照)。只包含檔頭記錄為已寫入的事件。"""
+    with open(path, 'rb') as source:
+        magic, record_size, _, count = EVENT_HEADER.unpack(source.read(EVENT_HEADER.size))
+    if magic != EVENT_MAGIC or record_size != EVENT_DTYPE.itemsize:
+        raise ValueError(f'{path} 不是事件分段檔')
+    names_path = path[:-4] + '.names.json'
+    names = {'fish': [], 'items': [], 'rarities': []}
+    if os.path.exists(names_path):
+        with open(names_path, encoding='utf-8') as source:
+            names = json.load(source)
+    if count == 0:
+        return np.empty(0, dtype=EVENT_DTYPE), names
+    return np.memmap(path, dtype=EVENT_DTYPE, mode='r', offset=EVENT_HEADER_SIZE, shape=(count,)), names
+
+
+class Aggregates:
+    """跨分段累積的彙總值。ID 只在同一個分段內有意義，所以累積時一律轉成名稱。"""
+
+    def __init__(self):
+        self.events = 0
+        self.minted = {}        # (小時, 稀有度名稱) -> 金錢
+        self.rod_casts = {}     # 魚竿名稱 -> [拋竿數, 上鉤數, 收入]
+        self.bait = np.zeros((2, 3))  # [沒用魚餌 / 用魚餌] x [拋竿數, 上鉤數, 收入]
+        self.bait_spent = [0, 0]      # [購買魚餌的次數, 花費]
+        self.first_seen = []    # 各分段的 (玩家, 最早時間)
+        self.rod_purchases = {}  # 魚竿名稱 -> [(玩家, 最早購買時間), ...]
+
+    def add_segment(self, events, names):
+        if len(events) == 0:
+            return
+        self.events += len(events)
+        kind = events['kind']
+        rarities = names.get('rarities') or []
+        items = names.get('items') or []
+
+        casts = (kind == EVENT_CATCH) | (kind == EVENT_MISS)
+        catches = kind == EVENT_CATCH
+
+        # 每小時、每個稀有度的收入：以 (小時, 稀有度) 組合鍵做一次 bincount
+        if catches.any():
+            caught = events[catches]
+            hours = (caught['ts'] // SECONDS_PER_HOUR).astype(np.int64)
+            first_hour = int(hours.min())
+            rarity_ids = np.minimum(caught['rarity'].astype(np.int64), NO_RARITY)
+            keys = (hours - first_hour) * (NO_RARITY + 1) + rarity_ids
+            sums = np.bincount(keys, weights=caught['price'])
+            for key in np.flatnonzero(sums):
+                hour, rarity_id = divmod(int(key), NO_RARITY + 1)
+                rarity = rarities[rarity_id] if rarity_id < len(rarities) else str(rarity_id)
+                slot = (first_hour + hour, rarity)
+                self.minted[slot] = self.minted.get(slot, 0) + int(sums[key])
+
+        # 魚竿與魚餌：拋竿數、上鉤數、收入
+        rods = events['rod'].astype(np.int64)
+        revenue = np.where(catches, events['price'], 0)
+        size = int(rods.max()) + 1
+        rod_casts = np.bincount(rods, weights=casts, minlength=size)
+        rod_catches = np.bincount(rods, weights=catches, minlength=size)
+        rod_revenue = np.bincount(rods, weights=revenue, minlength=size)
+        for rod_id in np.flatnonzero(rod_casts):
+            name = items[rod_id] if rod_id < len(items) else str(rod_id)
+            stats = self.rod_casts.setdefault(name, [0, 0, 0])
+            stats[0] += int(rod_casts[rod_id])
+            stats[1] += int(rod_catches[rod_id])
+            stats[2] += int(rod_revenue[rod_id])
+        bait = events['bait'].astype(np.int64)
+        self.bait[:, 0] += np.bincount(bait, weights=casts, minlength=2)[:2]
+        self.bait[:, 1] += np.bincount(bait, weights=catches, minlength=2)[:2]
+        self.bait[:, 2] += np.bincount(bait, weights=revenue, minlength=2)[:2]
+
+        # 購買：魚餌花費，以及每位玩家各魚竿的最早購買時間
+        buys = events[kind == EVENT_BUY]
+        if len(buys):
+            species = buys['species'].astype(np.int64)
+            for item_id in np.unique(species):
+                name = items[item_id] if item_id < len(items) else str(item_id)
+                selected = buys[species == item_id]
+                if name == '魚餌':
+                    self.bait_spent[0] += len(selected)
+                    self.bait_spent[1] -= int(selected['price'].sum())
+                elif '魚竿' in name:
+                    self.rod_purchases.setdefault(name, []).append(_first_per_user(selected['user'], selected['ts']))
+
+        # 同一個分段由單一程序依時間順序寫入，每位玩家第一次出現的位置就是最早的時間
+        users, first_index = np.unique(events['user'], return_index=True)
+        self.first_seen.append((users, events['ts'][first_index]))
+
+    def report(self):
+        cast_counts, revenue = self.bait[:, 0], self.bait[:, 2]
+        per_cast = np.divide(revenue, cast_counts, out=np.zeros(2), where=cast_counts > 0)
+        bait_cost = self.bait_spent[1] / self.bait_spent[0] if self.bait_spent[0] else None
+        bait_roi = None
+        if bait_cost:
+            bait_roi = (per_cast[1] - per_cast[0] - bait_cost) / bait_cost
+
+        first_users, first_times = _merge_first(self.first_seen)
+        upgrades = {}
+        for name, parts in self.rod_purchases.items():
+            users, times = _merge_first(parts)
+            seen = first_times[np.searchsorted(first_users, users)]
+            hours = (times - seen) / SECONDS_PER_HOUR
+            upgrades[name] = {
+                'buyers': int(len(users)),
+                'median_hours_to_buy': round(float(np.median(hours)), 3),
+                'p90_hours_to_buy': round(float(np.percentile(hours, 90)), 3),
+            }
+
+        minted_by_hour = {}
+        for (hour, rarity), money in sorted(self.minted.items()):
+            minted_by_hour.setdefault(time.strftime('%Y-%m-%d %H:00', time.gmtime(hour * SECONDS_PER_HOUR)), {})[rarity] = money
+        return {
+            'events': self.events,
+            'players': int(len(first_users)),
+            'minted_per_hour': minted_by_hour,
+            'rods': {
+                name: {
+                    'casts': casts,
+                    'catch_rate': round(catches / casts, 4) if casts else None,
+                    'revenue_per_cast': round(revenue / casts, 3) if casts else None,
+                }
+                for name, (casts, catches, revenue) in sorted(self.rod_casts.items())
+            },
+            'rod_upgrades': upgrades,
+            'bait': {
+                'casts_without': int(cast_counts[0]),
+                'casts_with': int(cast_counts[1]),
+                'revenue_per_cast_without': round(float(per_cast[0]), 3),
+                'revenue_per_cast_with': round(float(per_cast[1]), 3),
+                'cost_per_bait': bait_cost,
+                'roi': None if bait_roi is None else round(float(bait_roi), 4),
+            },
+        }
+
+
+def _first_per_user(users, times):
+    """(玩家陣列, 時間陣列) -> 依玩家排序、每位玩家只留最早時間的 (玩家, 時間)。"""
+    order = np.lexsort((times, users))
+    users = np.asarray(users)[order]
+    times = np.asarray(times)[order]
+    keep = np.ones(len(users), dtype=bool)
+    keep[1:] = users[1:] != users[:-1]
+    return users[keep], times[keep]
+
+
+def _merge_first(parts):
+    if not parts:
+        return np.empty(0, dtype=np.uint64), np.empty(0)
+    return _first_per_user(np.concatenate([p[0] for p in parts]), np.concatenate([p[1] for p in parts]))
+
+
+def scan(directory):
+    """掃描目錄下所有分段檔，回傳 Aggregates。"""
+    aggregates = Aggregates()
+    for path in list_segments(directory):
+        events, names = read_segment(path)
+        aggregates.add_segment(events, names)
+    return aggregates
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='釣魚機器人事件紀錄分析')
+    parser.add_argument('directory', nargs='?', default=os.environ.get('FISHING_EVENT_LOG_DIR', 'events'))
+    parser.add_argument('--json', action='store_true', help='輸出 JSON')
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    report = scan(args.directory).report()
+    elapsed = time.perf_counter() - started
+    report['scan_seconds'] = round(elapsed, 3)
+    report['events_per_second'] = round(report['events'] / elapsed) if elapsed > 0 else None
+    if args.json:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+        return
+
+    print(f"事件數: {report['events']}，玩家數: {report['players']}，掃描 {elapsed:.2f} 秒 ({report['events_per_second']} 事件/秒)")
+    print("\n每小時釣魚收入 (依稀有度):")
+    for hour, by_rarity in report['minted_per_hour'].items():
+        print(f"  {hour}  " + "  ".join(f"{rarity}: {money}" for rarity, money in by_rarity.items()))
+    print("\n魚竿:")
+    for name, stats in report['rods'].items():
+        print(f"  {name}: 拋竿 {stats['casts']} 次，上鉤率 {stats['catch_rate']}，每次拋竿收入 {stats['revenue_per_cast']}")
+    print("\n升級魚竿的時間 (從第一次出現起算):")
+    for name, stats in report['rod_upgrades'].items():
+        print(f"  {name}: {stats['buyers']} 人，中位數 {stats['median_hours_to_buy']} 小時，P90 {stats['p90_hours_to_buy']} 小時")
+    bait = report['bait']
+    print(f"\n魚餌: 每次拋竿收入 {bait['revenue_per_cast_with']} (有) vs {bait['revenue_per_cast_without']} (無)，"
+          f"每個魚餌 {bait['cost_per_bait']}，投資報酬率 {bait['roi']}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
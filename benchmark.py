@@ -0,0 +1,1672 @@
+"""釣魚機器人的離線壓力測試與效能基準。
+
+不需要 Discord 連線：以替身 Interaction 直接呼叫斜線指令的處理函數，
+依設定的指令比例重播合成的工作負載，並回報各指令的延遲 (p50/p99)、吞吐量與記憶體。
+
+    python benchmark.py --users 100000 --ops 200000 --mix fish=6,buy=1,bag=3
+    python benchmark.py --scenario storage --ops 50000
+    python benchmark.py --scenario leaderboard --users 1000000
+    python benchmark.py --scenario http --ops 5000
+    python benchmark.py --scenario outbound --ops 300
+    python benchmark.py --scenario sampler --ops 1000000
+    python benchmark.py --scenario cluster --workers 4 --ops 20000
+    python benchmark.py --scenario bulk --users 1000000
+    python benchmark.py --scenario events --events 100000000
+    python benchmark.py --scenario startup
+    python benchmark.py --scenario autocomplete --catalog-items 5000
+    python benchmark.py --scenario cache --users 1000000 --ops 200000
+    python benchmark.py --scenario profiling --ops 50000
+    python benchmark.py --scenario casts --casts 10000
+"""
+import os
+
+# 基準測試預設不寫資料庫與事件紀錄、不等待拋竿動畫、不限制送出速率；要測這些部分時可以自行覆寫環境變數
+os.environ.setdefault('FISHING_STORAGE', 'memory')
+os.environ.setdefault('FISHING_CAST_DELAY', '0')
+os.environ.setdefault('FISHING_OUTBOUND_RATE', '0')
+os.environ.setdefault('FISHING_EVENT_LOG', '0')
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import random
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+import main
+
+
+# --- 替身 Discord 物件 ---
+class FakeUser:
+    def __init__(self, user_id):
+        self.id = user_id
+        self.display_name = f'player{user_id}'
+        self.mention = f'<@{user_id}>'
+
+
+class FakeResponse:
+    def __init__(self, interaction):
+        self._interaction = interaction
+        self.done = False
+
+    async def send_message(self, content=None, **kwargs):
+        self.done = True
+        self._interaction.record('send_message', content, kwargs)
+
+    async def defer(self, **kwargs):
+        self.done = True
+        self._interaction.record('defer', None, kwargs)
+
+
+class FakeFollowup:
+    def __init__(self, interaction):
+        self._interaction = interaction
+
+    async def send(self, content=None, **kwargs):
+        self._interaction.record('followup', content, kwargs)
+
+
+class FakeChannel:
+    def __init__(self, channel_id):
+        self.id = channel_id
+
+
+class FakeMessage:
+    def __init__(self, user_id, channel_id, content):
+        self.author = FakeUser(user_id)
+        self.author.bot = False
+        self.channel = FakeChannel(channel_id)
+        self.content = content
+
+
+class FakeAttachment:
+    def __init__(self, filename, data):
+        self.filename = filename
+        self._data = data
+
+    async def read(self):
+        return self._data
+
+
+class FakeInteraction:
+    """記錄所有回應 (send / defer / edit / followup) 的 Interaction 替身。"""
+    _ids = iter(range(1, 1 << 62))
+
+    def __init__(self, user_id, channel_id=0):
+        self.id = next(self._ids)
+        self.user = FakeUser(user_id)
+        self.channel = channel_id
+        self.channel_id = channel_id
+        self.response = FakeResponse(self)
+        self.followup = FakeFollowup(self)
+        self.calls = []
+
+    def record(self, kind, content, kwargs):
+        self.calls.append((kind, content, kwargs))
+
+    async def edit_original_response(self, content=None, **kwargs):
+        self.record('edit', content, kwargs)
+
+
+# --- 工作負載 ---
+def _op_fish(user_id):
+    return main.fish_command.callback(FakeInteraction(user_id))
+
+
+def _op_fish_multi(user_id):
+    return main.fish_command.callback(FakeInteraction(user_id), casts=10)
+
+
+def _op_buy(user_id):
+    item_name = random.choice([name for name in main.game_data['items'] if name != '基本魚竿'])
+    return main.buy_command.callback(FakeInteraction(user_id), item_name=item_name)
+
+
+def _op_fish_item(user_id):
+    rod_name = random.choice([name for name in main.game_data['items'] if '魚竿' in name])
+    return main.fish_item_command.callback(FakeInteraction(user_id), rod_name=rod_name)
+
+
+def _op_bag(user_id):
+    return main.bag_command.callback(FakeInteraction(user_id))
+
+
+def _op_shop(user_id):
+    return main.shop_command.callback(FakeInteraction(user_id))
+
+
+def _op_game(user_id):
+    return main.game_command.callback(FakeInteraction(user_id))
+
+
+def _op_leaderboard(user_id):
+    return main.leaderboard_command.callback(FakeInteraction(user_id))
+
+
+def _op_rank(user_id):
+    return main.rank_command.callback(FakeInteraction(user_id))
+
+
+def _op_save(user_id):
+    return main.save_command.callback(FakeInteraction(user_id))
+
+
+async def _op_load(user_id):
+    data = main.export_user(user_id).encode('utf-8')
+    attachment = FakeAttachment(f'fishing_data_{user_id}.json', data)
+    await main.load_command.callback(FakeInteraction(user_id), file=attachment)
+
+
+_channel_ids = iter(range(1, 1 << 62))
+
+
+async def _op_new_game(user_id):
+    # 每次使用不同的頻道，同一位玩家同時進行的確認才不會互相取代
+    channel_id = next(_channel_ids)
+    command = asyncio.ensure_future(main.new_game_command.callback(FakeInteraction(user_id, channel_id)))
+    while (user_id, channel_id) not in main.pending_confirmations._pending:
+        if command.done():
+            return await command
+        await asyncio.sleep(0)
+    await main.on_confirmation_message(FakeMessage(user_id, channel_id, '確認重置'))
+    await command
+
+
+OPERATIONS = {
+    'fish': _op_fish,
+    'fish_multi': _op_fish_multi,
+    'buy': _op_buy,
+    'fish_item': _op_fish_item,
+    'bag': _op_bag,
+    'shop': _op_shop,
+    'game': _op_game,
+    'leaderboard': _op_leaderboard,
+    'rank': _op_rank,
+    'save': _op_save,
+    'load': _op_load,
+    'new_game': _op_new_game,
+}
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise SystemExit(f'未知的指令: {name} (可用: {", ".join(OPERATIONS)})')
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[int(q * (len(sorted_values) - 1))]
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    # Linux 回報 KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def current_rss_mb():
+    """目前 (不是峰值) 的常駐記憶體。"""
+    try:
+        with open('/proc/self/statm') as source:
+            return int(source.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except OSError:
+        return None
+
+
+def check_invariants(users=None):
+    """每位玩家的金錢與道具不可為負，總釣魚次數必須等於收藏的總數。"""
+    errors = 0
+    for user_id, user_data in main.game_data['users'].items() if users is None else users:
+        if user_data.money < 0 or any(count < 0 for count in user_data.items):
+            errors += 1
+        elif user_data.total_catches != sum(user_data.fish):
+            errors += 1
+    return errors
+
+
+async def run(args):
+    mix = parse_mix(args.mix)
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    latencies = {name: [] for name in names}
+
+    all_fish = [name for fish_map in main.game_data['fish_data'].values() for name in fish_map]
+    for user_id in range(args.users):
+        user_data = main.get_user_data(user_id)
+        user_data.money = args.start_money
+        if args.full_collection:
+            # 大量收藏的玩家：用來量測 /bag 的繪製成本
+            for name in all_fish:
+                user_data.add_fish(name, 1000)
+            user_data.total_catches = 1000 * len(all_fish)
+            for name in main.game_data['items']:
+                user_data.add_item(name, 10)
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def one(name, user_id):
+        async with semaphore:
+            started = time.perf_counter()
+            await OPERATIONS[name](user_id)
+            latencies[name].append(time.perf_counter() - started)
+
+    plan = random.choices(names, weights=weights, k=args.ops)
+    started = time.perf_counter()
+    for offset in range(0, args.ops, args.concurrency * 4):
+        await asyncio.gather(*(
+            one(name, random.randrange(args.users))
+            for name in plan[offset:offset + args.concurrency * 4]
+        ))
+    # 單次 /fish 的收竿由 cast_scheduler 在背景結算，還沒到期的也算進這次的工作量
+    main.cast_scheduler.flush()
+    elapsed = time.perf_counter() - started
+    # 寫回延後到計時結束：SQLite 時量測剩下的髒資料一次寫入要多久
+    flush_started = time.perf_counter()
+    await main.flush_dirty_users()
+    final_flush_ms = (time.perf_counter() - flush_started) * 1000
+
+    report = {
+        'storage': main.STORAGE_BACKEND,
+        'users': args.users,
+        'ops': args.ops,
+        'concurrency': args.concurrency,
+        'elapsed_s': round(elapsed, 3),
+        'throughput_ops_s': round(args.ops / elapsed, 1),
+        'final_flush_ms': round(final_flush_ms, 3),
+        'peak_rss_mb': peak_rss_mb(),
+        'users_in_memory': len(main.game_data['users']),
+        'invariant_errors': check_invariants(),
+        'commands': {},
+    }
+    for name in names:
+        values = sorted(latencies[name])
+        report['commands'][name] = {
+            'count': len(values),
+            'p50_ms': round(percentile(values, 0.50) * 1000, 3),
+            'p99_ms': round(percentile(values, 0.99) * 1000, 3),
+            'max_ms': round((values[-1] if values else 0.0) * 1000, 3),
+        }
+    return report
+
+
+def bench_leaderboard(args):
+    """以 args.users 位合成玩家量測排行榜的重建、增量更新、名次查詢與前 K 名。"""
+    users = {
+        str(user_id): main.UserRecord(money=random.randrange(10 ** 6), total_catches=random.randrange(10 ** 4))
+        for user_id in range(args.users)
+    }
+    board = main.Leaderboard('money', 'money', lambda user_data: user_data.money)
+
+    started = time.perf_counter()
+    board.rebuild(users)
+    rebuild_s = time.perf_counter() - started
+
+    user_ids = list(users)
+    timings = {}
+
+    started = time.perf_counter()
+    for _ in range(args.ops):
+        user_id = random.choice(user_ids)
+        users[user_id].money += random.randrange(-500, 500)
+        board.update(user_id, users[user_id])
+    timings['update_us'] = (time.perf_counter() - started) / args.ops * 1e6
+
+    started = time.perf_counter()
+    for _ in range(args.ops):
+        board.rank(random.choice(user_ids))
+    timings['rank_us'] = (time.perf_counter() - started) / args.ops * 1e6
+
+    started = time.perf_counter()
+    for _ in range(args.ops):
+        board.top(main.LEADERBOARD_SIZE)
+    timings['top_k_us'] = (time.perf_counter() - started) / args.ops * 1e6
+
+    return {
+        'users': args.users,
+        'ops': args.ops,
+        'rebuild_s': round(rebuild_s, 3),
+        **{name: round(value, 2) for name, value in timings.items()},
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def _legacy_cast(success_rate, rare_bonus):
+    """改寫前的單次拋竿：每次重算稀有度機率、線性累加掃描，再建立魚名清單。"""
+    if random.random() > success_rate:
+        return None
+    rates = main.compute_rarity_rates(rare_bonus)
+    rand = random.random()
+    cumulative = 0
+    rarity = 'common'
+    for name, rate in rates.items():
+        cumulative += rate
+        if rand <= cumulative:
+            rarity = name
+            break
+    if not main.game_data['fish_data'].get(rarity):
+        rarity = 'common'
+    fish_name = random.choice(list(main.game_data['fish_data'][rarity].keys()))
+    fish_info = main.game_data['fish_data'][rarity][fish_name]
+    weight = round(random.uniform(*fish_info['weight_range']), 2)
+    return rarity, fish_name, weight, int(weight * fish_info['price_per_kg'])
+
+
+def bench_sampler(args):
+    """每秒可結算的拋竿數：改寫前的逐次計算、預先編譯的 alias 表，以及 NumPy 批次抽樣 (args.ops 次拋竿)。"""
+    items = main.game_data['items']
+    bait = items['魚餌']
+    # 所有魚竿 (有無魚餌) 的組合輪流使用，和實際玩家的分布無關，只是讓每張表都被用到
+    combos = []
+    for name, info in items.items():
+        if '魚竿' in name:
+            combos.append((min(0.95, 0.7 * info['catch_bonus']), info['rare_bonus']))
+            combos.append((min(0.95, 0.7 * info['catch_bonus'] * bait['catch_bonus']), info['rare_bonus'] + bait['rare_bonus']))
+    plan = [combos[i % len(combos)] for i in range(args.ops)]
+
+    report = {'casts': args.ops, 'rare_bonus_tables': len(main.possible_rare_bonuses())}
+    for label, cast in (('legacy', _legacy_cast), ('alias', lambda rate, bonus: main._draw_catches_python(1, rate, bonus))):
+        started = time.perf_counter()
+        for success_rate, rare_bonus in plan:
+            cast(success_rate, rare_bonus)
+        elapsed = time.perf_counter() - started
+        report[f'{label}_casts_s'] = round(args.ops / elapsed)
+        report[f'{label}_us_per_cast'] = round(elapsed / args.ops * 1e6, 3)
+    if main.np is not None:
+        per_combo = args.ops // len(combos)
+        started = time.perf_counter()
+        for success_rate, rare_bonus in combos:
+            main._draw_catches_numpy(per_combo, success_rate, rare_bonus)
+        elapsed = time.perf_counter() - started
+        report['numpy_batch_casts_s'] = round(per_combo * len(combos) / elapsed)
+        report['numpy_batch_us_per_cast'] = round(elapsed / (per_combo * len(combos)) * 1e6, 3)
+    report['alias_speedup'] = round(report['alias_casts_s'] / report['legacy_casts_s'], 2)
+    return report
+
+
+async def _bench_instrumentation(args):
+    async def handler(interaction):
+        return None
+
+    wrapped = main.instrument('benchmark', handler)
+    interaction = FakeInteraction(1)
+    timings = {}
+    for label, func in (('raw_us', handler), ('instrumented_us', wrapped)):
+        started = time.perf_counter()
+        for _ in range(args.ops):
+            await func(interaction)
+        timings[label] = (time.perf_counter() - started) / args.ops * 1e6
+    started = time.perf_counter()
+    main.render_metrics()
+    timings['render_metrics_ms'] = (time.perf_counter() - started) * 1000
+    return {name: round(value, 3) for name, value in timings.items()}
+
+
+def bench_instrumentation(args):
+    """監控包裝本身的額外成本：空的指令處理函數，包裝前後各呼叫 args.ops 次。"""
+    report = asyncio.run(_bench_instrumentation(args))
+    report['overhead_us'] = round(report['instrumented_us'] - report['raw_us'], 3)
+    return report
+
+
+def _flask_app():
+    """改寫前 main.py 的 Flask 路由 (同樣的 / 與 /health 回應)。"""
+    from datetime import datetime
+    from flask import Flask, jsonify
+
+    app = Flask('benchmark')
+
+    @app.route('/')
+    def home():
+        return jsonify({"status": "Bot is running", "timestamp": datetime.now().isoformat()})
+
+    @app.route('/health')
+    def health():
+        return jsonify({"status": "healthy"})
+
+    return app
+
+
+async def _http_load(port, paths, args):
+    """對每個路徑送出 args.ops 個請求 (最多 args.concurrency 個同時進行)，同時記錄執行緒數的峰值。"""
+    import aiohttp
+
+    report = {}
+    peak_threads = threading.active_count()
+    running = True
+
+    async def watch_threads():
+        nonlocal peak_threads
+        while running:
+            peak_threads = max(peak_threads, threading.active_count())
+            await asyncio.sleep(0.001)
+
+    watcher = asyncio.ensure_future(watch_threads())
+    async with aiohttp.ClientSession() as session:
+        for path in paths:
+            latencies = []
+            semaphore = asyncio.Semaphore(args.concurrency)
+
+            async def one():
+                async with semaphore:
+                    started = time.perf_counter()
+                    async with session.get(f'http://127.0.0.1:{port}{path}') as response:
+                        await response.read()
+                    latencies.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(one() for _ in range(args.ops)))
+            elapsed = time.perf_counter() - started
+            latencies.sort()
+            report[path] = {
+                'requests_s': round(args.ops / elapsed, 1),
+                'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+                'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+            }
+    running = False
+    await watcher
+    report['threads_peak'] = peak_threads
+    return report
+
+
+async def _http_child(args):
+    """http 基準的子程序：只啟動一種伺服器，記憶體與執行緒數才不會互相影響。"""
+    rss_before = current_rss_mb()
+    threads_before = threading.active_count()
+    if args.http_server == 'flask':
+        from werkzeug.serving import make_server
+
+        # 和 app.run() 相同：threaded=True，每個連線一個執行緒，伺服器本身在背景執行緒
+        server = make_server('127.0.0.1', 0, _flask_app(), threaded=True)
+        port = server.port
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        paths = ('/', '/health')
+    else:
+        from aiohttp import web
+
+        runner = web.AppRunner(main.create_http_app(), access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        paths = ('/', '/health', '/metrics')
+    report = {
+        'threads_idle': threading.active_count(),
+        'server_threads_idle': threading.active_count() - threads_before,
+        'server_rss_mb': round(current_rss_mb() - rss_before, 2),
+    }
+    report.update(await _http_load(port, paths, args))
+    if args.http_server == 'flask':
+        server.shutdown()
+        thread.join()
+    else:
+        await runner.cleanup()
+    report['rss_mb'] = round(current_rss_mb(), 1)
+    report['peak_rss_mb'] = peak_rss_mb()
+    return report
+
+
+def bench_http(args):
+    """aiohttp (在事件迴圈上) 與改寫前的 Flask 執行緒各在一個子程序中啟動，比較延遲、吞吐量、執行緒數與記憶體。
+
+    兩者的負載都由同一個程序裡事件迴圈上的 aiohttp 用戶端產生，和機器人的事件迴圈與 HTTP 伺服器共用一個程序的情形相同。
+    沒有安裝 Flask 時只量測 aiohttp。
+    """
+    import importlib.util
+    import subprocess
+
+    if args.http_server:
+        return asyncio.run(_http_child(args))
+
+    report = {'ops_per_path': args.ops, 'concurrency': args.concurrency}
+    servers = ['aiohttp']
+    if importlib.util.find_spec('flask') is not None:
+        servers.append('flask')
+    else:
+        report['flask'] = 'not installed'
+    for server in servers:
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--scenario', 'http', '--http-server', server,
+             '--ops', str(args.ops), '--concurrency', str(args.concurrency)],
+            capture_output=True, text=True, check=True
+        ).stdout
+        report[server] = json.loads(output[output.rfind('\n{\n') + 1:])
+    return report
+
+
+async def _bench_confirmations(args):
+    registry = main.PendingConfirmations()
+    futures = [registry.open(user_id, 0, timeout=30.0) for user_id in range(args.users)]
+    messages = [(random.randrange(args.users * 10), 0, 'hello') for _ in range(args.ops)]
+
+    started = time.perf_counter()
+    for user_id, channel_id, content in messages:
+        registry.dispatch(user_id, channel_id, content)
+    registry_us = (time.perf_counter() - started) / args.ops * 1e6
+
+    # 對照：bot.wait_for 的做法，每則訊息都要跑過所有等待中的 check
+    checks = [
+        (lambda message, user_id=user_id: message[0] == user_id and message[1] == 0)
+        for user_id in range(args.users)
+    ]
+    sample = messages[:max(1, args.ops // 100)]
+    started = time.perf_counter()
+    for message in sample:
+        for check in checks:
+            check(message)
+    wait_for_us = (time.perf_counter() - started) / len(sample) * 1e6
+
+    started = time.perf_counter()
+    for _ in range(main.CONFIRM_WHEEL_SLOTS):
+        registry.advance()
+    expiry_ms = (time.perf_counter() - started) * 1000
+    for future in futures:
+        future.exception() if future.done() else future.cancel()
+    return {
+        'open_confirmations': args.users,
+        'messages': args.ops,
+        'registry_dispatch_us': round(registry_us, 3),
+        'wait_for_dispatch_us': round(wait_for_us, 3),
+        'expire_all_ms': round(expiry_ms, 3),
+    }
+
+
+
+def bench_confirmations(args):
+    """args.users 個等待中的確認時，每則訊息的分派成本，並與 bot.wait_for 的逐一檢查比較。"""
+    return asyncio.run(_bench_confirmations(args))
+
+
+# 假的 Discord webhook 端點：每個互動 token 一個路由額度，另有全域額度，超過時回 429
+FAKE_ROUTE_LIMIT = 5
+FAKE_ROUTE_PERIOD = 2.0
+FAKE_GLOBAL_LIMIT = 50
+FAKE_CAST_DELAY = 0.2
+
+
+def _fake_discord_app(stats):
+    from aiohttp import web
+
+    routes = {}
+    global_window = [0.0, 0]
+
+    def take(window, limit, period, now):
+        if now >= window[0]:
+            window[0], window[1] = now + period, 0
+        if window[1] >= limit:
+            return window[0] - now
+        window[1] += 1
+        return 0.0
+
+    async def handle(request):
+        token = request.match_info['token']
+        now = time.monotonic()
+        stats['requests'] += 1
+        retry_after = take(global_window, FAKE_GLOBAL_LIMIT, 1.0, now)
+        is_global = retry_after > 0
+        window = routes.setdefault(token, [0.0, 0])
+        if not is_global:
+            retry_after = take(window, FAKE_ROUTE_LIMIT, FAKE_ROUTE_PERIOD, now)
+        if retry_after > 0:
+            stats['429'] += 1
+            return web.json_response({'retry_after': retry_after, 'global': is_global}, status=429)
+        body = await request.json()
+        if request.method == 'PATCH':
+            stats['messages'][token] = body['content']
+        return web.json_response({}, headers={
+            'X-RateLimit-Limit': str(FAKE_ROUTE_LIMIT),
+            'X-RateLimit-Remaining': str(FAKE_ROUTE_LIMIT - window[1]),
+            'X-RateLimit-Reset-After': str(round(window[0] - now, 3)),
+            'X-RateLimit-Bucket': token,
+        })
+
+    app = web.Application()
+    app.router.add_route('PATCH', '/webhooks/{token}/messages/@original', handle)
+    app.router.add_route('POST', '/webhooks/{token}', handle)
+    return app
+
+
+async def _bench_outbound(args):
+    """args.ops 個 /fish 同時開始：各送一次進度編輯，FAKE_CAST_DELAY 秒後送結果編輯。"""
+    import aiohttp
+    from aiohttp import web
+
+    report = {'casts': args.ops}
+    for mode in ('direct', 'scheduler'):
+        stats = {'requests': 0, '429': 0, 'messages': {}}
+        runner = web.AppRunner(_fake_discord_app(stats), access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        base = f'http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}'
+
+        async with aiohttp.ClientSession() as session:
+            async def send(kind, target, kwargs):
+                token = target.id
+                method, path = ('PATCH', f'/webhooks/{token}/messages/@original') if kind == 'edit' else ('POST', f'/webhooks/{token}')
+                async with session.request(method, base + path, json=kwargs) as response:
+                    if response.status == 429:
+                        body = await response.json()
+                        raise main.RateLimited(body['retry_after'], body['global'])
+                    return response.headers
+
+            async def send_direct(kind, target, kwargs):
+                # 對照組：收到 429 才等待重試 (沒有合併、沒有優先順序)
+                while True:
+                    try:
+                        return await send(kind, target, kwargs)
+                    except main.RateLimited as e:
+                        await asyncio.sleep(e.retry_after)
+
+            # 全域額度設得比假端點略低，留一點餘裕
+            scheduler = main.OutboundScheduler(send, rate=FAKE_GLOBAL_LIMIT * 0.9)
+            latencies = []
+
+            async def cast(index):
+                target = FakeInteraction(index)
+                target.id = str(index)
+                if mode == 'direct':
+                    progress = asyncio.ensure_future(send_direct('edit', target, {'content': 'progress'}))
+                else:
+                    scheduler.edit(target, 'progress', priority=main.PRIORITY_PROGRESS)
+                await asyncio.sleep(FAKE_CAST_DELAY)
+                started = time.perf_counter()
+                if mode == 'direct':
+                    # 直接送出時兩個編輯沒有先後保證，必須等進度送完才能送結果
+                    await progress
+                    await send_direct('edit', target, {'content': f'result {index}'})
+                else:
+                    await scheduler.edit(target, f'result {index}')
+                latencies.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            await asyncio.gather(*(cast(index) for index in range(args.ops)))
+            elapsed = time.perf_counter() - started
+        await runner.cleanup()
+
+        latencies.sort()
+        wrong = sum(1 for index in range(args.ops) if stats['messages'].get(str(index)) != f'result {index}')
+        report[mode] = {
+            'elapsed_s': round(elapsed, 3),
+            'http_requests': stats['requests'],
+            'http_429': stats['429'],
+            'coalesced': scheduler.coalesced,
+            'result_p50_ms': round(percentile(latencies, 0.50) * 1000, 1),
+            'result_p99_ms': round(percentile(latencies, 0.99) * 1000, 1),
+            'wrong_final_state': wrong,
+        }
+    return report
+
+
+def bench_outbound(args):
+    """對照直接送出與經由 OutboundScheduler 送出，在有速率限制的假 Discord 端點上的表現。
+
+    args.ops 是同時進行的 /fish 數；每個都要等假端點的速率限制，預設只有 300 (見 SCENARIO_OPS)。
+    """
+    return asyncio.run(_bench_outbound(args))
+
+
+def _synthetic_user(index, all_fish, all_items):
+    """舊格式的玩家資料：買過幾樣道具、釣過大部分的魚。"""
+    return {
+        'money': 1000 + index,
+        'items': {name: 1 + index % 3 for name in all_items},
+        'current_rod': '中級魚竿',
+        'fish_caught': {name: 1 + (index + offset) % 50 for offset, name in enumerate(all_fish)},
+        'total_catches': 500 + index % 100
+    }
+
+
+def bench_memory(args):
+    """比較舊 dict 格式與 UserRecord 每位玩家佔用的記憶體，並推算到 100 萬名玩家。"""
+    import tracemalloc
+
+    all_fish = [name for fish_map in main.game_data['fish_data'].values() for name in fish_map]
+    all_items = list(main.game_data['items'])
+    report = {'users': args.users}
+    for label, build in (
+        ('dict', lambda index: _synthetic_user(index, all_fish, all_items)),
+        ('user_record', lambda index: main.UserRecord.from_dict(_synthetic_user(index, all_fish, all_items))),
+    ):
+        tracemalloc.start()
+        users = {str(index): build(index) for index in range(args.users)}
+        size, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        # 扣掉外層 users dict 和 user_id 字串，只算玩家紀錄本身
+        per_user = (size - sum(len(user_id) + 49 for user_id in users) - sys.getsizeof(users)) / args.users
+        report[f'{label}_bytes_per_user'] = round(per_user, 1)
+        del users
+    saved = report['dict_bytes_per_user'] - report['user_record_bytes_per_user']
+    report['saved_bytes_per_user'] = round(saved, 1)
+    report['saved_mb_at_1m_users'] = round(saved * 1_000_000 / 2 ** 20, 1)
+    return report
+
+
+CLUSTER_CROSS_SHARD = 0.1  # 跨分片指令的預設比例 (--cross-shard)
+
+
+async def _cluster_worker(args):
+    """叢集基準的工作程序：透過 /buy 為隨機玩家購買魚餌，回報每位玩家成功購買的次數。"""
+    main.flush_loop.start()
+    main.lease_maintenance.start()
+    purchases = {}
+    busy_retries = 0
+    remaining = args.ops
+
+    async def client():
+        # 固定 args.concurrency 個客戶端輪流下指令：不必讓上萬個協程排在同一個 Semaphore 上，
+        # 等待移交的時間較長時，喚醒排隊者的成本不會被算進指令本身
+        nonlocal busy_retries, remaining
+        while remaining > 0:
+            remaining -= 1
+            # 玩家大多只在同一個分片 (工作程序) 的伺服器下指令，少部分會跨分片
+            if random.random() < args.cross_shard:
+                user_id = str(random.randrange(args.users))
+            else:
+                user_id = str(random.randrange(main.WORKER_ID, args.users, args.workers))
+            while True:
+                interaction = FakeInteraction(user_id)
+                try:
+                    await main.buy_command.callback(interaction, item_name='魚餌')
+                    break
+                except main.UserBusyError:
+                    busy_retries += 1
+            if interaction.calls[-1][1].startswith('✅'):
+                purchases[user_id] = purchases.get(user_id, 0) + 1
+
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    await asyncio.gather(*(client() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+    cpu = time.process_time() - cpu_started
+    main.lease_maintenance.cancel()
+    main.flush_loop.cancel()
+    await main.release_owned_users(list(main.owned_users))
+    return {'elapsed_s': elapsed, 'cpu_s': cpu, 'busy_retries': busy_retries, 'purchases': purchases}
+
+
+def bench_cluster(args):
+    """K 個工作程序共用一個 SQLite 資料庫，以租約協調玩家所有權；驗證沒有遺失或重複的購買。"""
+    import subprocess
+    import tempfile
+
+    if args.cluster_worker:
+        if args.seed is None:
+            random.seed(os.getpid())
+        return asyncio.run(_cluster_worker(args))
+
+    report = {'users': args.users, 'ops': args.ops, 'cross_shard': args.cross_shard}
+    workers = 1
+    while workers <= args.workers:
+        with tempfile.TemporaryDirectory() as directory:
+            db_path = os.path.join(directory, 'cluster.db')
+            seed_storage = main.SQLiteStorage(db_path)
+            seed_storage.write_batch([
+                (str(user_id), json.dumps(main.UserRecord.new().to_dict() | {'money': args.start_money}, ensure_ascii=False))
+                for user_id in range(args.users)
+            ])
+
+            started = time.perf_counter()
+            processes = [
+                subprocess.Popen(
+                    [sys.executable, os.path.abspath(__file__), '--scenario', 'cluster', '--cluster-worker',
+                     '--users', str(args.users), '--ops', str(args.ops // workers), '--workers', str(workers),
+                     '--concurrency', str(args.concurrency), '--cross-shard', str(args.cross_shard)],
+                    env=dict(os.environ, FISHING_STORAGE='sqlite', FISHING_DB_PATH=db_path, FISHING_WORKER_ID=str(worker_id)),
+                    stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+                )
+                for worker_id in range(workers)
+            ]
+            # main 可能先印出其他訊息 (例如啟動分析)，報告是最後一段以 '{' 開頭的輸出
+            outputs = [process.communicate()[0] for process in processes]
+            results = [json.loads(output[output.rfind('\n{\n') + 1:]) for output in outputs]
+            elapsed = time.perf_counter() - started
+
+            expected = {}
+            for result in results:
+                for user_id, count in result['purchases'].items():
+                    expected[user_id] = expected.get(user_id, 0) + count
+            errors = 0
+            for user_id, data in seed_storage.load_all().items():
+                record = main.UserRecord.from_dict(data)
+                count = expected.get(user_id, 0)
+                if record.money != args.start_money - 50 * count or record.item_count('魚餌') != count:
+                    errors += 1
+            seed_storage.close()
+
+        report[f'workers_{workers}'] = {
+            'ops_s': round(args.ops / max(result['elapsed_s'] for result in results), 1),
+            # 每個 CPU 秒完成的指令數：機器的核心數少於工作程序數時，ops_s 反映的是分時而不是協調成本
+            'ops_per_cpu_s': round(args.ops / sum(result['cpu_s'] for result in results), 1),
+            'wall_s': round(elapsed, 2),
+            'busy_retries': sum(result['busy_retries'] for result in results),
+            'purchases': sum(expected.values()),
+            'invariant_errors': errors,
+        }
+        workers *= 2
+    return report
+
+
+async def _bench_bulk(args):
+    import tempfile
+
+    all_fish = [name for fish_map in main.game_data['fish_data'].values() for name in fish_map]
+    all_items = list(main.game_data['items'])
+    users = main.game_data['users']
+    for index in range(args.users):
+        users[str(index)] = main.UserRecord.from_dict(_synthetic_user(index, all_fish, all_items))
+    report = {'users': args.users, 'codec': 'orjson' if main.orjson is not None else 'json'}
+
+    with tempfile.TemporaryDirectory() as directory:
+        for compress in (False, True):
+            label = 'export_gzip' if compress else 'export'
+            path = os.path.join(directory, label)
+            peak_before = peak_rss_mb()
+            started = time.perf_counter()
+            with open(path, 'wb') as output:
+                async for chunk in main.iter_export_chunks(compress):
+                    output.write(chunk)
+            elapsed = time.perf_counter() - started
+            report[label] = {
+                'users_s': round(args.users / elapsed, 1),
+                'mb': round(os.path.getsize(path) / 2 ** 20, 1),
+                'peak_rss_growth_mb': round(peak_rss_mb() - peak_before, 1),
+            }
+
+        expected = {user_id: record.to_dict() for user_id, record in list(users.items())[:1000]}
+        users.clear()
+        main.dirty_users.clear()
+        peak_before = peak_rss_mb()
+
+        async def read_chunks():
+            with open(os.path.join(directory, 'export_gzip'), 'rb') as source:
+                while chunk := source.read(64 * 1024):
+                    yield chunk
+
+        started = time.perf_counter()
+        result = await main.import_ndjson(read_chunks())
+        elapsed = time.perf_counter() - started
+        report['import_gzip'] = {
+            'users_s': round(result['imported'] / elapsed, 1),
+            'imported': result['imported'],
+            'failed': result['failed'],
+            'mismatched': sum(1 for user_id, data in expected.items() if users[user_id].to_dict() != data),
+            'peak_rss_growth_mb': round(peak_rss_mb() - peak_before, 1),
+        }
+
+    # 對照：舊做法一次組出整份 JSON 字串。記憶體和玩家數成正比，只取一部分玩家量測再按比例推算
+    sample = dict(list(users.items())[:BULK_BLOB_SAMPLE])
+    scale = len(users) / len(sample)
+    peak_before = peak_rss_mb()
+    started = time.perf_counter()
+    blob = json.dumps({user_id: record.to_dict() for user_id, record in sample.items()}, indent=4, ensure_ascii=False)
+    report['single_json_blob_estimated'] = {
+        'users_s': round(len(sample) / (time.perf_counter() - started), 1),
+        'mb': round(len(blob.encode('utf-8')) * scale / 2 ** 20, 1),
+        'peak_rss_growth_mb': round((peak_rss_mb() - peak_before) * scale, 1),
+    }
+    return report
+
+
+BULK_BLOB_SAMPLE = 100000
+
+
+def bench_bulk(args):
+    """以 args.users 位玩家量測全體匯出 (NDJSON / gzip) 與匯入的吞吐量和記憶體峰值增量，並和單一 JSON 字串比較。"""
+    return asyncio.run(_bench_bulk(args))
+
+
+async def _bench_catalog(args):
+    import tempfile
+
+    with open(main.CATALOG_PATH, encoding='utf-8') as source:
+        original = source.read()
+    for user_id in range(args.users):
+        main.get_user_data(user_id).money = args.start_money
+
+    with tempfile.TemporaryDirectory() as directory:
+        main.CATALOG_PATH = os.path.join(directory, 'catalog.json5')
+        # 交替寫入兩個版本 (小魚的價格不同)，每次重新載入都是真的換了內容
+        versions = [original, original.replace('price_per_kg: 10,', 'price_per_kg: 11,', 1)]
+
+        timings = []
+        for index in range(CATALOG_RELOADS):
+            with open(main.CATALOG_PATH, 'w', encoding='utf-8') as output:
+                output.write(versions[index % 2])
+            timings.append(await main.reload_catalog())
+        report = {
+            'reload_ms_p50': round(percentile(sorted(t['seconds'] for t in timings), 0.5) * 1000, 3),
+            'install_us_p50': round(percentile(sorted(t['install_seconds'] for t in timings), 0.5) * 1e6, 1),
+            'install_us_max': round(max(t['install_seconds'] for t in timings) * 1e6, 1),
+        }
+
+        async def workload(reloading):
+            latencies = []
+            lag = []
+            stop = asyncio.Event()
+
+            async def reloader():
+                index = 0
+                while not stop.is_set():
+                    with open(main.CATALOG_PATH, 'w', encoding='utf-8') as output:
+                        output.write(versions[index % 2])
+                    await main.reload_catalog()
+                    index += 1
+                    await asyncio.sleep(CATALOG_RELOAD_INTERVAL)
+
+            async def probe():
+                while not stop.is_set():
+                    started = time.perf_counter()
+                    await asyncio.sleep(0.001)
+                    lag.append(time.perf_counter() - started - 0.001)
+
+            semaphore = asyncio.Semaphore(args.concurrency)
+
+            async def one():
+                async with semaphore:
+                    started = time.perf_counter()
+                    await _op_fish(str(random.randrange(args.users)))
+                    latencies.append(time.perf_counter() - started)
+
+            reloads_before = main.catalog_reloads
+            background = [asyncio.ensure_future(probe())]
+            if reloading:
+                background.append(asyncio.ensure_future(reloader()))
+            for offset in range(0, args.ops, args.concurrency * 4):
+                await asyncio.gather(*(one() for _ in range(min(args.concurrency * 4, args.ops - offset))))
+            stop.set()
+            await asyncio.gather(*background)
+            latencies.sort()
+            lag.sort()
+            return {
+                'fish_p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+                'fish_p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+                'fish_max_ms': round(latencies[-1] * 1000, 3),
+                'loop_lag_max_ms': round(lag[-1] * 1000, 3),
+                'reloads': main.catalog_reloads - reloads_before,
+            }
+
+        report['steady'] = await workload(False)
+        report['reloading'] = await workload(True)
+    return report
+
+
+CATALOG_RELOADS = 50
+CATALOG_RELOAD_INTERVAL = 0.25
+
+
+def bench_catalog(args):
+    """量測目錄重新載入的耗時 (其中在事件迴圈上替換的部分)，並比較重新載入期間 /fish 的延遲與事件迴圈延遲。"""
+    return asyncio.run(_bench_catalog(args))
+
+
+def _synthetic_catalog(extra_items):
+    """在目前的目錄加上 extra_items 個隨機名稱的道具 (約一半是魚竿)，用來看索引在大目錄下的表現。"""
+    rng = random.Random(0)
+    alphabet = '金銀銅鐵木石風火水雷光暗龍虎鷹鯨星月日雲海山林竹梅蘭菊'
+    items = dict(main.game_data['items'])
+    while len(items) < len(main.game_data['items']) + extra_items:
+        stem = ''.join(rng.choice(alphabet) for _ in range(rng.randint(2, 4)))
+        name = stem + ('魚竿' if rng.random() < 0.5 else '魚餌')
+        items.setdefault(name, {'price': rng.randint(10, 5000), 'catch_bonus': 1.0, 'rare_bonus': 0.0, 'description': name})
+    return {'fish_data': main.game_data['fish_data'], 'items': items, 'rarity_rates': main.game_data['rarity_rates']}
+
+
+def _linear_lookup(item_name):
+    """改用索引之前 buy_item 的查詢方式，作為比較基準。"""
+    normalized_input_name = item_name.lower().replace(' ', '')
+    for key in main.game_data['items']:
+        if key.lower().replace(' ', '') == normalized_input_name:
+            return key
+    return None
+
+
+async def _bench_autocomplete(args):
+    report = {}
+    if args.catalog_items:
+        catalog = _synthetic_catalog(args.catalog_items)
+        started = time.perf_counter()
+        compiled = main.compile_catalog(catalog)
+        report['index_build_ms'] = round((time.perf_counter() - started) * 1000, 2)
+        main.install_catalog(catalog, compiled)
+    names = [name for name in main.game_data['items'] if name != '基本魚竿']
+    rods = [name for name in names if '魚竿' in name]
+    report['items'] = len(names)
+    for user_id in range(args.users):
+        user_data = main.get_user_data(str(user_id))
+        user_data.money = args.start_money
+        for rod in random.sample(rods, min(5, len(rods))):
+            user_data.add_item(rod)
+
+    # 最終查詢：線性掃描 vs 索引
+    lookups = [random.choice(names) for _ in range(10000)]
+    for label, lookup in (('linear', _linear_lookup), ('indexed', main._shop_index.resolve)):
+        started = time.perf_counter()
+        for name in lookups:
+            lookup(name)
+        report[f'{label}_lookup_us'] = round((time.perf_counter() - started) / len(lookups) * 1e6, 3)
+
+    # 每個「打字」工作階段對名稱的每個前綴各觸發一次自動完成，同時有 /fish 在跑
+    latencies = []
+
+    async def type_name(user_id):
+        interaction = FakeInteraction(user_id)
+        if random.random() < 0.5:
+            name, callback = random.choice(names), main.item_name_autocomplete
+        else:
+            name, callback = random.choice(rods), main.rod_name_autocomplete
+        for end in range(1, len(name) + 1):
+            started = time.perf_counter()
+            choices = await callback(interaction, name[:end])
+            latencies.append(time.perf_counter() - started)
+            assert len(choices) <= main.AUTOCOMPLETE_LIMIT
+
+    started = time.perf_counter()
+    for offset in range(0, args.ops, args.concurrency):
+        batch = min(args.concurrency, args.ops - offset)
+        await asyncio.gather(
+            *(type_name(random.randrange(args.users)) for _ in range(batch)),
+            *(_op_fish(str(random.randrange(args.users))) for _ in range(batch // 4)),
+        )
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    report['autocomplete'] = {
+        'calls': len(latencies),
+        'calls_per_s': round(len(latencies) / elapsed),
+        'p50_us': round(percentile(latencies, 0.5) * 1e6, 2),
+        'p99_us': round(percentile(latencies, 0.99) * 1e6, 2),
+        'max_ms': round(latencies[-1] * 1000, 3),
+    }
+    return report
+
+
+def bench_autocomplete(args):
+    """/buy 與 /fish_item 的自動完成：每次按鍵的延遲 (與 /fish 同時執行)，以及最終查詢線性掃描 vs 索引。"""
+    return asyncio.run(_bench_autocomplete(args))
+
+
+async def _cache_child(args):
+    """cache 基準的子程序：以目前的 FISHING_USER_CACHE_SIZE 啟動，跑 Zipf 分布的指令。"""
+    import numpy as np
+
+    started = time.perf_counter()
+    main.load_persisted_users()
+    load_s = time.perf_counter() - started
+    rss_loaded = current_rss_mb()
+
+    # 名次 k 的玩家被選中的機率與 1 / k^s 成正比；名次隨機對應到 user_id
+    rng = np.random.default_rng(args.seed or 0)
+    cdf = np.cumsum(1.0 / np.arange(1, args.users + 1) ** args.zipf)
+    user_ids = rng.permutation(args.users)[np.searchsorted(cdf / cdf[-1], rng.random(args.ops))].tolist()
+    mix = parse_mix(args.mix)
+    plan = random.choices(list(mix), weights=list(mix.values()), k=args.ops)
+    latencies = {'hit': [], 'miss': []}
+    users = main.game_data['users']
+
+    async def one(name, user_id):
+        user_id = str(user_id)
+        kind = 'hit' if user_id in users else 'miss'
+        started = time.perf_counter()
+        await OPERATIONS[name](user_id)
+        latencies[kind].append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for offset in range(0, args.ops, args.concurrency):
+        await asyncio.gather(*(
+            one(name, user_id)
+            for name, user_id in zip(plan[offset:offset + args.concurrency], user_ids[offset:offset + args.concurrency])
+        ))
+    elapsed = time.perf_counter() - started
+    await main.flush_dirty_users()
+    everything = sorted(latencies['hit'] + latencies['miss'])
+    for values in latencies.values():
+        values.sort()
+    return {
+        'startup_load_s': round(load_s, 2),
+        'rss_after_load_mb': round(rss_loaded, 1),
+        'rss_steady_mb': round(current_rss_mb(), 1),
+        'users_in_memory': len(users),
+        'throughput_ops_s': round(args.ops / elapsed, 1),
+        'p50_ms': round(percentile(everything, 0.5) * 1000, 3),
+        'p99_ms': round(percentile(everything, 0.99) * 1000, 3),
+        'hit_p99_ms': round(percentile(latencies['hit'], 0.99) * 1000, 3),
+        'miss_p50_ms': round(percentile(latencies['miss'], 0.5) * 1000, 3),
+        'miss_p99_ms': round(percentile(latencies['miss'], 0.99) * 1000, 3),
+        'hit_ratio': round(users.hits / max(1, users.hits + users.misses), 4),
+        'misses': users.misses,
+        'evictions': users.evictions,
+        # 包含被淘汰到資料庫的玩家
+        'invariant_errors': check_invariants(users.iter_all()),
+    }
+
+
+def bench_cache(args):
+    """args.users 位玩家存在 SQLite，比較不限制記憶體與 LRU 快取 (--cache-size) 的記憶體與延遲 (Zipf 分布)。"""
+    import subprocess
+    import tempfile
+
+    if args.cache_child:
+        return asyncio.run(_cache_child(args))
+
+    report = {'users': args.users, 'ops': args.ops, 'zipf_s': args.zipf}
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = os.path.join(directory, 'cache.db')
+        seed_storage = main.SQLiteStorage(db_path)
+        for start in range(0, args.users, 100000):
+            seed_storage.write_batch([
+                (str(user_id), json.dumps(main.UserRecord.new().to_dict() | {'money': args.start_money}, ensure_ascii=False))
+                for user_id in range(start, min(args.users, start + 100000))
+            ])
+        seed_storage.close()
+        for label, size in (('unbounded', 0), (f'lru_{args.cache_size}', args.cache_size)):
+            output = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--scenario', 'cache', '--cache-child',
+                 '--users', str(args.users), '--ops', str(args.ops), '--concurrency', str(args.concurrency),
+                 '--mix', args.mix, '--zipf', str(args.zipf)],
+                env=dict(os.environ, FISHING_STORAGE='sqlite', FISHING_DB_PATH=db_path, FISHING_USER_CACHE_SIZE=str(size)),
+                capture_output=True, text=True, check=True
+            ).stdout
+            report[label] = json.loads(output[output.rfind('\n{\n') + 1:])
+    return report
+
+
+def bench_storage(args):
+    """同一組 commands 工作負載分別以記憶體與 SQLite (預寫寫回) 儲存執行，比較各指令的延遲與吞吐量。"""
+    import subprocess
+    import tempfile
+
+    command = [
+        sys.executable, os.path.abspath(__file__), '--scenario', 'commands',
+        '--users', str(args.users), '--ops', str(args.ops), '--concurrency', str(args.concurrency),
+        '--mix', args.mix, '--start-money', str(args.start_money), '--seed', str(args.seed or 0),
+    ]
+    report = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for backend in ('memory', 'sqlite'):
+            env = dict(os.environ, FISHING_STORAGE=backend, FISHING_DB_PATH=os.path.join(directory, 'storage.db'))
+            output = subprocess.run(command, env=env, capture_output=True, text=True, check=True).stdout
+            report[backend] = json.loads(output[output.rfind('\n{\n') + 1:])
+    memory, sqlite = report['memory'], report['sqlite']
+    report['sqlite_vs_memory'] = {
+        'throughput_ratio': round(sqlite['throughput_ops_s'] / memory['throughput_ops_s'], 3),
+        **{
+            name: {
+                'p50_ms_delta': round(stats['p50_ms'] - memory['commands'][name]['p50_ms'], 3),
+                'p99_ms_delta': round(stats['p99_ms'] - memory['commands'][name]['p99_ms'], 3),
+            }
+            for name, stats in sqlite['commands'].items()
+        },
+    }
+    return report
+
+
+def _write_synthetic_segments(directory, events, segment_events, users):
+    """直接以 NumPy 產生分段檔：一天內的拋竿、少量購買，時間依序遞增。"""
+    import numpy as np
+    import analytics
+
+    fish_names = list(main.FISH_IDS.names)
+    item_names = list(main.ITEM_IDS.names)
+    rods = [main.ITEM_IDS.id_of(name) for name in item_names if '魚竿' in name]
+    bait_id = main.ITEM_IDS.id_of('魚餌')
+    rng = np.random.default_rng(0)
+    start = time.time() - 86400
+    written = 0
+    index = 0
+    while written < events:
+        count = min(segment_events, events - written)
+        block = np.zeros(count, dtype=analytics.EVENT_DTYPE)
+        block['ts'] = start + (written + np.arange(count)) * (86400 / events)
+        block['user'] = rng.integers(0, users, count)
+        kind = rng.choice([main.EVENT_CATCH, main.EVENT_MISS, main.EVENT_BUY], count, p=[0.6, 0.38, 0.02])
+        block['kind'] = kind
+        block['rod'] = rng.choice(rods, count)
+        block['bait'] = rng.random(count) < 0.2
+        catches = kind == main.EVENT_CATCH
+        block['rarity'] = np.where(catches, rng.integers(0, len(main.KNOWN_RARITIES), count), main.NO_RARITY)
+        block['species'] = np.where(catches, rng.integers(0, len(fish_names), count), 0)
+        block['weight'] = np.where(catches, rng.random(count) * 10, 0)
+        block['price'] = np.where(catches, rng.integers(1, 2000, count), 0)
+        buys = kind == main.EVENT_BUY
+        block['species'][buys] = rng.choice(rods + [bait_id], int(buys.sum()))
+        block['price'][buys] = -50
+        path = os.path.join(directory, f'synthetic-{index:06d}.evt')
+        with open(path, 'wb') as output:
+            output.write(main.EVENT_HEADER.pack(main.EVENT_MAGIC, main.EVENT_STRUCT.size, 0, count).ljust(main.EVENT_HEADER_SIZE, b'\0'))
+            output.write(block.tobytes())
+        with open(path[:-4] + '.names.json', 'w', encoding='utf-8') as output:
+            json.dump({'fish': fish_names, 'items': item_names, 'rarities': main.KNOWN_RARITIES}, output, ensure_ascii=False)
+        written += count
+        index += 1
+
+
+async def _bench_events_hot_path(args, directory):
+    """/fish 的延遲：沒有事件紀錄 vs 記錄到緩衝區 (含背景寫入分段檔)。"""
+    report = {}
+    for user_id in range(args.users):
+        main.get_user_data(user_id).money = args.start_money
+    for label, log in (('without_log', None), ('with_log', main.EventLog(directory, 'bench'))):
+        main.event_log = log
+        started = time.perf_counter()
+        for offset in range(0, args.ops, args.concurrency):
+            await asyncio.gather(*(
+                _op_fish(str(random.randrange(args.users))) for _ in range(min(args.concurrency, args.ops - offset))
+            ))
+        main.cast_scheduler.flush()
+        elapsed = time.perf_counter() - started
+        report[f'{label}_fish_us'] = round(elapsed / args.ops * 1e6, 2)
+        if log is not None:
+            flush_started = time.perf_counter()
+            await log.flush()
+            report['flush_ms'] = round((time.perf_counter() - flush_started) * 1000, 2)
+            report['events_logged'] = log.events
+            log.close()
+    main.event_log = None
+
+    record_started = time.perf_counter()
+    log = main.EventLog(directory, 'record')
+    for _ in range(EVENT_RECORD_SAMPLES):
+        log.record(main.EVENT_CATCH, '123456789012345678', price=120, weight=1.5, species=3, rod=1, rarity=0)
+    report['record_us'] = round((time.perf_counter() - record_started) / EVENT_RECORD_SAMPLES * 1e6, 3)
+    write_started = time.perf_counter()
+    log.close()
+    report['write_mb_s'] = round(EVENT_RECORD_SAMPLES * main.EVENT_STRUCT.size / 2 ** 20 / (time.perf_counter() - write_started), 1)
+    return report
+
+
+EVENT_RECORD_SAMPLES = 200000
+STARTUP_RUNS = 5
+
+
+def _cold_import(env):
+    """在新的程序中匯入 main，回傳 (總時間, startup_marks)。"""
+    import subprocess
+    code = (
+        'import time, json; started = time.perf_counter(); import main; '
+        'print(json.dumps({"total": time.perf_counter() - started, "marks": main.startup_marks}))'
+    )
+    output = subprocess.run([sys.executable, '-c', code], env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def _import_breakdown(env, top):
+    """python -X importtime 的結果中，main 直接匯入的模組依累計時間排序。"""
+    import subprocess
+    stderr = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import main'], env=env, capture_output=True, text=True, check=True
+    ).stderr
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line.split('|')
+        # 欄位前有一個分隔空白；再縮排兩格 = 由 main 直接匯入
+        if not name.startswith('   ') or name.startswith('    '):
+            continue
+        modules[name.strip()] = int(cumulative) / 1000
+    return dict(sorted(modules.items(), key=lambda item: -item[1])[:top])
+
+
+async def _bench_command_sync(directory):
+    """模擬兩次啟動與一次重新連線，計算實際呼叫 tree.sync() 的次數。"""
+    calls = []
+
+    async def fake_sync(*args, **kwargs):
+        calls.append(time.perf_counter())
+        return main.bot.tree.get_commands()
+
+    original_sync, original_storage = main.bot.tree.sync, main.storage
+    main.bot.tree.sync = fake_sync
+    report = {}
+    try:
+        started = time.perf_counter()
+        for _ in range(100):
+            main.command_tree_hash(1234)
+        report['hash_us'] = round((time.perf_counter() - started) / 100 * 1e6, 1)
+        results = []
+        for restart in range(2):
+            # 每次「重新啟動」都重新開啟資料庫，雜湊只能從磁碟讀回
+            main.storage = main.SQLiteStorage(os.path.join(directory, 'sync.db'))
+            main.startup_marks.pop('ready', None)
+            main.startup_marks.pop('commands_synced', None)
+            await main.on_ready()
+            await main.on_ready()  # 重新連線
+            results.append(await main.sync_command_tree())
+            main.storage.close()
+        report['sync_calls'] = len(calls)
+        report['results'] = results
+    finally:
+        main.bot.tree.sync, main.storage = original_sync, original_storage
+    return report
+
+
+def bench_startup(args):
+    """冷啟動：匯入 main 的時間與各階段、各模組的匯入時間，以及指令同步被略過的情形。"""
+    import tempfile
+
+    env = dict(os.environ)
+    env.pop('FISHING_CATALOG_CACHE', None)
+    runs = [_cold_import(env) for _ in range(STARTUP_RUNS)]
+    no_cache = _cold_import(dict(env, FISHING_CATALOG_CACHE=''))
+    best = min(runs, key=lambda run: run['total'])
+    report = {
+        'import_main_ms': {
+            'best': round(best['total'] * 1000, 1),
+            'median': round(sorted(run['total'] for run in runs)[len(runs) // 2] * 1000, 1),
+            'without_catalog_cache': round(no_cache['total'] * 1000, 1),
+        },
+        'phases_ms': {phase: round(elapsed * 1000, 1) for phase, elapsed in best['marks'].items()},
+        'top_imports_ms': _import_breakdown(env, 8),
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        report['command_sync'] = asyncio.run(_bench_command_sync(directory))
+    return report
+
+
+def bench_events(args):
+    """事件紀錄：熱路徑的額外成本、寫入速度，以及 analytics.py 掃描 args.events 筆事件的吞吐量。"""
+    import tempfile
+    import analytics
+
+    with tempfile.TemporaryDirectory() as directory:
+        report = asyncio.run(_bench_events_hot_path(args, os.path.join(directory, 'live')))
+        synthetic = os.path.join(directory, 'synthetic')
+        os.makedirs(synthetic)
+        started = time.perf_counter()
+        _write_synthetic_segments(synthetic, args.events, main.EVENT_SEGMENT_EVENTS, args.users)
+        report['generate_s'] = round(time.perf_counter() - started, 2)
+
+        started = time.perf_counter()
+        result = analytics.scan(synthetic).report()
+        elapsed = time.perf_counter() - started
+        report['scan'] = {
+            'events': result['events'],
+            'players': result['players'],
+            'seconds': round(elapsed, 2),
+            'events_per_s': round(result['events'] / elapsed),
+            'gb_per_s': round(result['events'] * analytics.EVENT_DTYPE.itemsize / 2 ** 30 / elapsed, 2),
+        }
+        report['sample_bait'] = result['bait']
+    return report
+
+
+BENCH_CAST_DELAY = 2.0
+
+
+class TimedInteraction(FakeInteraction):
+    """記錄拋竿 (defer) 與結果 (不是「釣魚中...」進度) 編輯送達的時間。"""
+
+    def __init__(self, user_id):
+        super().__init__(str(user_id))
+        self.cast_at = None
+        self.done_at = None
+
+    def record(self, kind, content, kwargs):
+        # 不保留送出的內容，記憶體量測才不會算到替身留住的嵌入訊息
+        if kind == 'defer':
+            self.cast_at = time.perf_counter()
+        elif kind == 'edit' and kwargs.get('embed') is not None and kwargs['embed'].title != '🎣 釣魚中...':
+            self.done_at = time.perf_counter()
+
+
+async def _legacy_fish(interaction):
+    """改成 cast_scheduler 之前的單次 /fish：處理函數自己睡到收竿，再取得玩家鎖結算。"""
+    user_id = str(interaction.user.id)
+    await interaction.response.defer(ephemeral=False)
+    async with main.user_locks.hold(user_id):
+        cast = main.start_cast(user_id)
+    progress = main.discord.Embed(title="🎣 釣魚中...", description="正在準備魚竿和魚餌...", color=0xffff00)
+    progress.add_field(name="使用道具", value=cast['rod'], inline=True)
+    main.outbound.edit(interaction, priority=main.PRIORITY_PROGRESS, embed=progress)
+    await asyncio.sleep(main.CAST_DELAY)
+    async with main.user_locks.hold(user_id):
+        result = main.finish_cast(user_id, cast)
+    await main.outbound.edit(interaction, embed=main.build_cast_embed(result))
+
+
+async def _scheduled_fish(interaction):
+    await main.fish_command.callback(interaction)
+
+
+def _lateness_ms(values):
+    values = sorted(values)
+    return {
+        'p50': round(percentile(values, 0.50) * 1000, 1),
+        'p99': round(percentile(values, 0.99) * 1000, 1),
+        'max': round(values[-1] * 1000, 1),
+    }
+
+
+async def _cast_wave(handler, casts, measure_memory):
+    """casts 位玩家同時 /fish 一次。
+
+    回傳等待收竿期間的任務數與記憶體、收竿期間的任務數與事件迴圈延遲，
+    以及結算時間 / 結果送達時間比預定 (拋竿時間 + CAST_DELAY) 晚多久。
+    """
+    import tracemalloc
+
+    interactions = [TimedInteraction(user_id) for user_id in range(casts)]
+    resolved_at = {}
+    apply_cast_result = main.apply_cast_result
+
+    def stamped(user_id, cast, catch):
+        resolved_at[user_id] = time.perf_counter()
+        return apply_cast_result(user_id, cast, catch)
+
+    stats = {'peak_tasks': 0, 'max_loop_lag_ms': 0.0}
+    stop = asyncio.Event()
+
+    async def probe():
+        while not stop.is_set():
+            stats['peak_tasks'] = max(stats['peak_tasks'], len(asyncio.all_tasks()))
+            started = time.perf_counter()
+            await asyncio.sleep(0.005)
+            stats['max_loop_lag_ms'] = max(stats['max_loop_lag_ms'], (time.perf_counter() - started - 0.005) * 1000)
+
+    main.apply_cast_result = stamped
+    try:
+        if measure_memory:
+            tracemalloc.start()
+            baseline = tracemalloc.get_traced_memory()[0]
+        for interaction in interactions:
+            asyncio.ensure_future(handler(interaction))
+        # 所有拋竿都在等待收竿的時間點；之後才開始量測收竿期間的任務數與事件迴圈延遲
+        await asyncio.sleep(main.CAST_DELAY / 2)
+        waiting = {'tasks': len(asyncio.all_tasks())}
+        if measure_memory:
+            waiting['memory_mb'] = round((tracemalloc.get_traced_memory()[0] - baseline) / 2 ** 20, 2)
+            tracemalloc.stop()
+        prober = asyncio.ensure_future(probe())
+        while any(interaction.done_at is None for interaction in interactions):
+            await asyncio.sleep(0.05)
+        stop.set()
+        await prober
+    finally:
+        main.apply_cast_result = apply_cast_result
+
+    return {
+        'waiting': waiting,
+        'resolving': {'peak_tasks': stats['peak_tasks'], 'max_loop_lag_ms': round(stats['max_loop_lag_ms'], 1)},
+        'resolve_late_ms': _lateness_ms([
+            resolved_at[interaction.user.id] - interaction.cast_at - main.CAST_DELAY for interaction in interactions
+        ]),
+        'deliver_late_ms': _lateness_ms([
+            interaction.done_at - interaction.cast_at - main.CAST_DELAY for interaction in interactions
+        ]),
+    }
+
+
+async def _bench_casts(args):
+    main.CAST_DELAY = BENCH_CAST_DELAY
+    for user_id in range(args.casts):
+        main.get_user_data(str(user_id))
+    report = {'casts': args.casts, 'cast_delay_s': main.CAST_DELAY, 'tick_s': main.cast_scheduler.tick}
+    for label, handler in (('sleep_per_cast', _legacy_fish), ('scheduler', _scheduled_fish)):
+        await _cast_wave(handler, min(args.casts, 1000), False)  # 暖身
+        timing = await _cast_wave(handler, args.casts, False)
+        timing['waiting']['memory_mb'] = (await _cast_wave(handler, args.casts, True))['waiting']['memory_mb']
+        report[label] = timing
+    report['scheduler_batches'] = main.cast_scheduler.batches
+    report['invariant_errors'] = check_invariants()
+    return report
+
+
+def bench_casts(args):
+    """args.casts 次單次 /fish 同時拋竿：每次拋竿一個睡眠中的協程 vs cast_scheduler 批次收竿。"""
+    return asyncio.run(_bench_casts(args))
+
+
+def _block_loop(seconds):
+    """模擬不小心在事件迴圈上執行的同步運算。"""
+    deadline = time.perf_counter() + seconds
+    spins = 0
+    while time.perf_counter() < deadline:
+        spins += 1
+    return spins
+
+
+async def _bench_profiling(args):
+    report = {'throughput_ops_s': {}}
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log):
+        await run(argparse.Namespace(**{**vars(args), 'ops': max(1, args.ops // 4)}))  # 暖身
+
+        # 1. 額外成本：關閉、開啟追蹤 (門檻設高，不印出)、取樣剖析中
+        for mode in ('off', 'trace', 'profile'):
+            if mode == 'trace':
+                main.set_tracing(True, slow_ms=60000)
+            elif mode == 'profile':
+                main.set_tracing(False)
+                main.profiler.start()
+            result = await run(args)
+            report['throughput_ops_s'][mode] = result['throughput_ops_s']
+            if mode == 'trace':
+                report['loop_blocks_during_workload'] = main.loop_blocks.blocks
+        samples = main.profiler.stop()
+        summary = main.summarize_samples(samples, limit=5)
+        report['profile'] = {
+            'samples': summary['samples'],
+            'idle': summary['idle'],
+            'top_self': [[name, count] for name, count in summary['top']],
+            'main_py_share': round(sum(
+                count for key, count in samples.items()
+                if key != main.IDLE_STACK and any(code.co_filename == main.__file__ for code in key)
+            ) / max(1, summary['samples']), 3),
+        }
+
+        # 2. 慢指令分析：門檻設為 0，每個指令都產生各階段的耗時 (先暖身，避免量到第一次載入 NumPy)
+        await main.fish_command.callback(FakeInteraction(1), casts=main.MAX_CASTS_PER_COMMAND)
+        main.set_tracing(True, slow_ms=0)
+        await main.fish_command.callback(FakeInteraction(1), casts=main.MAX_CASTS_PER_COMMAND)
+        report['slow_trace_fish_multi'] = main.slow_tracer.recent[-1]
+        await main.save_command.callback(FakeInteraction(1))
+        report['slow_trace_save'] = main.slow_tracer.recent[-1]
+
+        # 3. 阻塞偵測：在事件迴圈上執行 200 ms 的同步運算
+        main.set_tracing(True, slow_ms=60000, block_ms=50)
+        blocks_before = main.loop_blocks.blocks
+        for _ in range(3):
+            _block_loop(0.2)
+            await asyncio.sleep(0.1)
+        detected = list(main.loop_blocks.recent)[-(main.loop_blocks.blocks - blocks_before):] if main.loop_blocks.blocks > blocks_before else []
+        report['loop_block'] = {
+            'injected': 3,
+            'detected': len(detected),
+            'blocked_ms': [record['blocked_ms'] for record in detected],
+            'culprit_found': sum('_block_loop' in record['stack'] for record in detected),
+        }
+        main.set_tracing(False)
+
+    off = report['throughput_ops_s']['off']
+    report['overhead_pct'] = {
+        mode: round((off - value) / off * 100, 1) for mode, value in report['throughput_ops_s'].items() if mode != 'off'
+    }
+    report['overhead_us_per_command'] = {
+        mode: round(1e6 / value - 1e6 / off, 1) for mode, value in report['throughput_ops_s'].items() if mode != 'off'
+    }
+    report['log_lines'] = log.getvalue().count('\n')
+    return report
+
+
+def bench_profiling(args):
+    """效能分析工具：開啟追蹤 / 取樣剖析時指令吞吐量的變化、慢指令的分析內容，以及阻塞偵測能否找到元兇。"""
+    return asyncio.run(_bench_profiling(args))
+
+
+# 每個操作成本較高的基準另有較小的 --ops 預設值
+DEFAULT_OPS = 100000
+SCENARIO_OPS = {
+    'http': 5000,
+    'outbound': 300,  # 每次 /fish 都要等假端點的速率限制，指令數就是同時進行的互動數
+}
+
+SCENARIOS = {
+    'commands': lambda args: asyncio.run(run(args)),
+    'storage': bench_storage,
+    'leaderboard': bench_leaderboard,
+    'sampler': bench_sampler,
+    'instrumentation': bench_instrumentation,
+    'http': bench_http,
+    'memory': bench_memory,
+    'cluster': bench_cluster,
+    'confirmations': bench_confirmations,
+    'outbound': bench_outbound,
+    'bulk': bench_bulk,
+    'catalog': bench_catalog,
+    'events': bench_events,
+    'startup': bench_startup,
+    'autocomplete': bench_autocomplete,
+    'cache': bench_cache,
+    'profiling': bench_profiling,
+    'casts': bench_casts,
+}
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description='釣魚機器人離線效能基準')
+    parser.add_argument('--scenario', choices=SCENARIOS, default='commands', help='要執行的基準項目')
+    parser.add_argument('--users', type=int, default=10000, help='模擬的玩家數')
+    parser.add_argument('--ops', type=int, default=None, help='總指令數 (預設 100000，部分基準見 SCENARIO_OPS)')
+    parser.add_argument('--concurrency', type=int, default=256, help='同時執行中的指令數')
+    parser.add_argument('--mix', default='fish=6,buy=1,bag=3', help='指令比例，例如 fish=6,buy=1,bag=3')
+    parser.add_argument('--start-money', type=int, default=10000, help='每位玩家的初始金錢')
+    parser.add_argument('--full-collection', action='store_true', help='每位玩家預先擁有所有魚種與道具')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--catalog-items', type=int, default=0, help='autocomplete 基準額外加入的道具數')
+    parser.add_argument('--events', type=int, default=10_000_000, help='events 基準要產生並掃描的事件數')
+    parser.add_argument('--workers', type=int, default=4, help='cluster 基準的最大工作程序數 (1, 2, 4, ...)')
+    parser.add_argument('--cross-shard', type=float, default=CLUSTER_CROSS_SHARD, help='cluster 基準中跨分片 (需要移交租約) 的指令比例')
+    parser.add_argument('--cluster-worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--cache-size', type=int, default=50000, help='cache 基準的 LRU 容量')
+    parser.add_argument('--zipf', type=float, default=1.1, help='cache 基準中玩家活躍度的 Zipf 指數')
+    parser.add_argument('--cache-child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--casts', type=int, default=10000, help='casts 基準同時進行的單次拋竿數')
+    parser.add_argument('--http-server', choices=('aiohttp', 'flask'), default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.ops is None:
+        args.ops = SCENARIO_OPS.get(args.scenario, DEFAULT_OPS)
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    report = SCENARIOS[args.scenario](args)
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main_cli()
@@ -1,232 +1,3627 @@
+import time
+_STARTUP_STARTED = time.perf_counter()  # 啟動分析的起點，必須在其他匯入之前
+import aiohttp
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord import app_commands
+_STARTUP_DISCORD_IMPORTED = time.perf_counter()
 import json
 import random
 import asyncio
-from flask import Flask, jsonify, request
-import threading
 import os
 from datetime import datetime
 import io
+import sys
+from array import array
+import contextlib
+import math
+import contextvars
+import functools
+import bisect
+from collections import OrderedDict, deque
+import sqlite3
+import signal
+import threading
+import heapq
+import zlib
+import struct
+import mmap
+import hashlib
+import hmac
+import unicodedata
+import importlib.util
+
+
+def lazy_import(name):
+    """回傳第一次存取屬性時才真正載入的模組；沒有安裝時回傳 None。
+
+    只在部分指令或啟動後才用到的重量級套件 (NumPy、aiohttp.web) 以此延後載入，縮短冷啟動。
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        return None
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+# 嘗試載入 python-dotenv，如果沒有安裝就跳過
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    pass
+
+# NumPy 用於連續拋竿的批次結算，沒有安裝時退回逐次計算；第一次連續拋竿時才載入
+np = lazy_import('numpy')
+# HTTP 伺服器在 setup_hook 才啟動
+web = lazy_import('aiohttp.web')
+# JSON5 只在目錄檔改變 (解析快取失效) 時才需要
+json5 = lazy_import('json5')
+
+# orjson 用於全體玩家的批次匯出/匯入，沒有安裝時使用標準的 json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# --- 啟動分析 ---
+# 記錄各階段第一次完成的時間 (從開始匯入 main.py 起算)，on_ready 時印出，並匯出到 /metrics。
+# 更細的匯入時間可以用 python -X importtime main.py 查看 (見 benchmark.py --scenario startup)。
+startup_marks = {'import_discord': _STARTUP_DISCORD_IMPORTED - _STARTUP_STARTED}
+
+
+def mark_startup(phase):
+    """記錄階段完成的時間；只有第一次有效 (重新連線不會覆寫)，回傳是否為第一次。"""
+    if phase in startup_marks:
+        return False
+    startup_marks[phase] = time.perf_counter() - _STARTUP_STARTED
+    return True
+
+
+def format_startup_report():
+    lines = []
+    previous = 0.0
+    for phase, elapsed in startup_marks.items():
+        lines.append(f"  {phase:<16} {elapsed * 1000:8.1f} ms  (+{(elapsed - previous) * 1000:.1f} ms)")
+        previous = elapsed
+    return '\n'.join(lines)
+
+
+mark_startup('imports')
+
+# Discord Bot 設定
+intents = discord.Intents.default()
+intents.message_content = True
+
+# 分片與叢集設定
+# 單一程序時使用 AutoShardedBot 自動決定分片數；叢集模式 (FISHING_CLUSTER_WORKERS > 1) 下
+# 主程序只負責分配分片並啟動工作程序，每個工作程序以 FISHING_WORKER_ID / FISHING_SHARD_IDS 執行。
+SHARD_COUNT = int(os.environ['FISHING_SHARD_COUNT']) if os.environ.get('FISHING_SHARD_COUNT') else None
+SHARD_IDS = [int(shard_id) for shard_id in os.environ['FISHING_SHARD_IDS'].split(',')] if os.environ.get('FISHING_SHARD_IDS') else None
+CLUSTER_WORKERS = int(os.environ.get('FISHING_CLUSTER_WORKERS', 1))
+WORKER_ID = int(os.environ['FISHING_WORKER_ID']) if os.environ.get('FISHING_WORKER_ID') else None
+
+
+class FishingBot(commands.AutoShardedBot):
+    async def setup_hook(self):
+        # 在開始處理指令前，先從資料庫恢復玩家資料
+        load_persisted_users()
+        flush_loop.start()
+        loop_lag_monitor.start()
+        confirmation_wheel.start()
+        if CATALOG_WATCH:
+            catalog_watcher.start()
+        if leases is not None:
+            lease_maintenance.start()
+        if event_log is not None:
+            event_flush_loop.start()
+        await start_http_server()
+        if TRACE_ON_START:
+            set_tracing(True)
+        mark_startup('setup_hook')
+        # Render 等平台以 SIGTERM 停止服務，收到時走正常關閉流程以寫回資料
+        try:
+            self.loop.add_signal_handler(signal.SIGTERM, lambda: asyncio.ensure_future(self.close()))
+        except (NotImplementedError, RuntimeError):
+            pass
+
+    async def close(self):
+        # 關閉流程中的寫回不算阻塞，也不需要再追蹤
+        set_tracing(False)
+        # 還沒收竿的拋竿立刻結算，結果和其他排隊中的訊息一起送完，之後 HTTP 連線就會關閉
+        cast_scheduler.flush()
+        await outbound.drain(OUTBOUND_DRAIN_TIMEOUT)
+        flush_loop.cancel()
+        await flush_dirty_users()
+        if leases is not None:
+            lease_maintenance.cancel()
+            await release_owned_users(list(owned_users))
+        if event_log is not None:
+            event_flush_loop.cancel()
+            await event_log.flush()
+        await stop_http_server()
+        await super().close()
+
+
+bot = FishingBot(command_prefix='/', intents=intents, shard_ids=SHARD_IDS, shard_count=SHARD_COUNT)
+
+# --- 遊戲目錄 (catalog.json5) ---
+# 魚類、商店道具與稀有度機率放在外部的 JSON5 檔，可以在執行中重新載入 (見 reload_catalog)。
+CATALOG_PATH = os.environ.get('FISHING_CATALOG_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'catalog.json5'))
+KNOWN_RARITIES = ('common', 'rare', 'epic', 'legendary', 'junk')
+REQUIRED_RARITIES = ('common', 'rare', 'epic', 'legendary')  # compute_rarity_rates 直接使用這幾個稀有度
+REQUIRED_ITEMS = ('基本魚竿', '魚餌')
+
+
+class CatalogError(ValueError):
+    """目錄檔格式錯誤；訊息列出所有找到的問題。"""
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def validate_catalog(catalog):
+    """檢查目錄內容並正規化 (weight_range 轉為 tuple)；有錯誤時拋出 CatalogError。"""
+    if not isinstance(catalog, dict):
+        raise CatalogError('目錄必須是一個物件')
+    errors = [f'缺少 {key}' for key in ('fish_data', 'items', 'rarity_rates') if not isinstance(catalog.get(key), dict)]
+    if errors:
+        raise CatalogError('\n'.join(errors))
+
+    rates = catalog['rarity_rates']
+    for rarity, rate in rates.items():
+        if rarity not in KNOWN_RARITIES:
+            errors.append(f'rarity_rates: 未知的稀有度 {rarity}')
+        elif not _is_number(rate) or rate < 0:
+            errors.append(f'rarity_rates.{rarity}: 機率必須是非負數')
+    errors += [f'rarity_rates: 缺少 {rarity}' for rarity in REQUIRED_RARITIES if rarity not in rates]
+    if not errors and sum(rates.values()) <= 0:
+        errors.append('rarity_rates: 機率總和必須大於 0')
+
+    for rarity, fish_map in catalog['fish_data'].items():
+        if rarity not in rates:
+            errors.append(f'fish_data.{rarity}: 沒有對應的 rarity_rates')
+        if not isinstance(fish_map, dict):
+            errors.append(f'fish_data.{rarity}: 必須是「魚名: 資料」的物件')
+            continue
+        for name, info in fish_map.items():
+            where = f'fish_data.{rarity}.{name}'
+            if not isinstance(info, dict):
+                errors.append(f'{where}: 必須是物件')
+                continue
+            weight_range = info.get('weight_range')
+            if (isinstance(weight_range, (list, tuple)) and len(weight_range) == 2
+                    and all(_is_number(value) for value in weight_range) and 0 < weight_range[0] <= weight_range[1]):
+                info['weight_range'] = tuple(weight_range)
+            else:
+                errors.append(f'{where}: weight_range 必須是 [最小, 最大] 且 0 < 最小 <= 最大')
+            if not _is_number(info.get('price_per_kg')) or info['price_per_kg'] <= 0:
+                errors.append(f'{where}: price_per_kg 必須是正數')
+            if not isinstance(info.get('emoji', ''), str):
+                errors.append(f'{where}: emoji 必須是字串')
+    if not catalog['fish_data'].get('common'):
+        errors.append('fish_data.common: 至少要有一種魚')
+
+    for name, info in catalog['items'].items():
+        where = f'items.{name}'
+        if not isinstance(info, dict):
+            errors.append(f'{where}: 必須是物件')
+            continue
+        if isinstance(info.get('price'), bool) or not isinstance(info.get('price'), int) or info['price'] < 0:
+            errors.append(f'{where}: price 必須是非負整數')
+        if not _is_number(info.get('catch_bonus')) or info['catch_bonus'] <= 0:
+            errors.append(f'{where}: catch_bonus 必須是正數')
+        if not _is_number(info.get('rare_bonus')) or info['rare_bonus'] < 0:
+            errors.append(f'{where}: rare_bonus 必須是非負數')
+        if not isinstance(info.get('description'), str):
+            errors.append(f'{where}: description 必須是字串')
+    errors += [f'items: 缺少必要道具 {name}' for name in REQUIRED_ITEMS if name not in catalog['items']]
+
+    if errors:
+        raise CatalogError('\n'.join(errors))
+    return {key: catalog[key] for key in ('fish_data', 'items', 'rarity_rates')}
+
+
+# JSON5 解析器是純 Python，比標準 json 慢兩個數量級；解析結果以檔案內容的 SHA-256 為鍵
+# 快取成標準 JSON，目錄沒有改變時啟動只需要 json.loads。設為空字串可停用。
+CATALOG_CACHE_PATH = os.environ.get('FISHING_CATALOG_CACHE', CATALOG_PATH + '.cache.json')
+
+
+def _read_catalog_cache(digest):
+    if not CATALOG_CACHE_PATH:
+        return None
+    try:
+        with open(CATALOG_CACHE_PATH, encoding='utf-8') as source:
+            cached = json.load(source)
+    except (OSError, ValueError):
+        return None
+    return cached.get('catalog') if isinstance(cached, dict) and cached.get('sha256') == digest else None
+
+
+def _write_catalog_cache(digest, catalog):
+    if not CATALOG_CACHE_PATH:
+        return
+    try:
+        with open(CATALOG_CACHE_PATH + '.tmp', 'w', encoding='utf-8') as output:
+            json.dump({'sha256': digest, 'catalog': catalog}, output, ensure_ascii=False)
+        os.replace(CATALOG_CACHE_PATH + '.tmp', CATALOG_CACHE_PATH)
+    except OSError as e:
+        # 快取只是加速用，寫不進去 (例如唯讀的部署目錄) 就每次重新解析
+        print(f"無法寫入目錄解析快取 {CATALOG_CACHE_PATH}: {e}")
+
+
+def load_catalog_file(path):
+    try:
+        with open(path, 'rb') as source:
+            raw = source.read()
+    except OSError as e:
+        raise CatalogError(f'無法讀取目錄檔 {path}: {e}') from e
+    digest = hashlib.sha256(raw).hexdigest()
+    catalog = _read_catalog_cache(digest)
+    if catalog is not None:
+        return validate_catalog(catalog)
+    try:
+        catalog = json5.loads(raw.decode('utf-8'))
+    except ValueError as e:
+        raise CatalogError(f'無法讀取目錄檔 {path}: {e}') from e
+    catalog = validate_catalog(catalog)
+    _write_catalog_cache(digest, catalog)
+    return catalog
+
+
+# 遊戲資料 (全局變數)
+# 'users' 在儲存層建立後換成 UserCache：最近用到的玩家在記憶體，其餘在資料庫 (見下方「玩家快取」)，
+# 並由寫回式儲存層定期批次寫入 (見下方「持久化儲存」)；
+# 'fish_data' / 'items' / 'rarity_rates' 來自目錄檔，重新載入時整份換掉 (見 install_catalog)
+game_data = {
+    'users': {}, # 這是會動態改變的部分
+    **load_catalog_file(CATALOG_PATH)
+}
+mark_startup('catalog')
+
+# --- 輔助函數：資料相關 ---
+class CatalogIds:
+    """名稱 -> 整數 ID 的對照表，只會新增不會刪除，所以目錄改版後舊 ID 仍然有效。"""
+
+    def __init__(self, names=()):
+        self.names = []
+        self.ids = {}
+        for name in names:
+            self.id_of(name)
+
+    def id_of(self, name):
+        index = self.ids.get(name)
+        if index is None:
+            # 共用同一個字串物件，玩家紀錄裡的 current_rod 不會各自保存一份
+            name = sys.intern(name)
+            index = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return index
+
+
+FISH_IDS = CatalogIds(name for fish_map in game_data['fish_data'].values() for name in fish_map)
+ITEM_IDS = CatalogIds(game_data['items'])
+
+
+class UserRecord:
+    """精簡的玩家資料。
+
+    魚和道具的數量存在以目錄 ID 為索引的整數陣列裡 (0 代表沒有)，
+    不再每位玩家各存一份以中文名稱為鍵的 dict。to_dict() / from_dict()
+    與舊的 dict/JSON 格式互相轉換，/save 與 /load 的檔案格式不變：目錄裡沒有的名稱也會配一個 ID 保留下來，
+    不認得的欄位放在 extra。數量為 0 的項目和沒有這個項目相同 (遊戲邏輯都以數量判斷)，to_dict() 不會輸出。
+    """
+
+    __slots__ = ('money', 'current_rod', 'total_catches', 'fish', 'items', 'extra')
+
+    def __init__(self, money=100, current_rod='基本魚竿', total_catches=0):
+        self.money = money
+        self.current_rod = current_rod
+        self.total_catches = total_catches
+        self.fish = array('i')
+        self.items = array('i')
+        self.extra = None  # 舊格式裡不認得的欄位，原樣保留
+
+    @classmethod
+    def new(cls):
+        """新玩家 (或 /new_game 重置後) 的初始資料。"""
+        record = cls(current_rod=ITEM_IDS.names[ITEM_IDS.id_of('基本魚竿')])
+        record.add_item('基本魚竿')
+        return record
+
+    @staticmethod
+    def _counts_from(mapping, ids):
+        """名稱 -> 數量的 dict 轉成數量陣列。負數視為 0；超過 32 位元整數時丟出 OverflowError。"""
+        indexed = [(ids.id_of(name), int(count)) for name, count in mapping.items()]
+        counts = array('i', [0]) * (max((index for index, _ in indexed), default=-1) + 1)
+        for index, count in indexed:
+            counts[index] += count
+        for index, count in enumerate(counts):
+            if count < 0:
+                counts[index] = 0
+        return counts
+
+    @staticmethod
+    def _add(counts, index, delta):
+        if index >= len(counts):
+            counts.extend([0] * (index + 1 - len(counts)))
+        counts[index] += delta
+        return counts[index]
+
+    @staticmethod
+    def _as_dict(counts, ids):
+        return {ids.names[index]: count for index, count in enumerate(counts) if count}
+
+    # 道具
+    def item_count(self, name):
+        index = ITEM_IDS.ids.get(name)
+        if index is None or index >= len(self.items):
+            return 0
+        return self.items[index]
+
+    def add_item(self, name, delta=1):
+        """增減道具數量；數量歸零時視為沒有這個道具。"""
+        count = self._add(self.items, ITEM_IDS.id_of(name), delta)
+        if count < 0:
+            self.items[ITEM_IDS.ids[name]] = 0
+            count = 0
+        return count
+
+    def item_dict(self):
+        return self._as_dict(self.items, ITEM_IDS)
+
+    def item_total(self):
+        return sum(self.items)
+
+    # 魚
+    def fish_count(self, name):
+        index = FISH_IDS.ids.get(name)
+        if index is None or index >= len(self.fish):
+            return 0
+        return self.fish[index]
+
+    def add_fish(self, name, delta=1):
+        return self._add(self.fish, FISH_IDS.id_of(name), delta)
+
+    def fish_dict(self):
+        return self._as_dict(self.fish, FISH_IDS)
+
+    def fish_species_count(self):
+        return sum(1 for count in self.fish if count)
+
+    # 與舊格式互轉
+    def to_dict(self):
+        data = {
+            'money': self.money,
+            'items': self.item_dict(),
+            'current_rod': self.current_rod,
+            'fish_caught': self.fish_dict(),
+            'total_catches': self.total_catches
+        }
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+    @classmethod
+    def from_dict(cls, data):
+        """由舊的 dict 格式建立；缺少的欄位使用新玩家的預設值。"""
+        record = cls(
+            money=data.get('money', 100),
+            current_rod=data.get('current_rod', '基本魚竿'),
+            total_catches=data.get('total_catches', 0)
+        )
+        record.current_rod = ITEM_IDS.names[ITEM_IDS.id_of(record.current_rod)]
+        record.items = cls._counts_from(data.get('items', {'基本魚竿': 1}), ITEM_IDS)
+        record.fish = cls._counts_from(data.get('fish_caught', {}), FISH_IDS)
+        extra = {key: value for key, value in data.items() if key not in USER_RECORD_FIELDS}
+        record.extra = extra or None
+        return record
+
+
+USER_RECORD_FIELDS = ('money', 'items', 'current_rod', 'fish_caught', 'total_catches')
+
+
+def new_user_record():
+    return UserRecord.new()
+
+
+def get_user_data(user_id):
+    """獲取或創建用戶資料。"""
+    user_id = str(user_id)
+    user_data = game_data['users'].get(user_id)
+    if user_data is None:
+        user_data = game_data['users'][user_id] = new_user_record()
+        update_leaderboards(user_id)
+    return user_data
+
+# --- 每位玩家的指令序列化 ---
+class UserLockTable:
+    """每位玩家一把 asyncio.Lock，不同玩家之間完全平行。
+
+    鎖在沒有任何持有者或等待者時立即回收，所以表的大小只跟「正在執行指令的玩家數」有關。
+    修改玩家資料時一律在鎖內重新呼叫 get_user_data，避免沿用 await 之前拿到、
+    可能已被 /load 或 /new_game 換掉的舊紀錄。
+    叢集模式下取得鎖時也會取得這位玩家的跨程序所有權 (見 ensure_owned)。
+    """
+
+    def __init__(self):
+        self._locks = {}  # user_id -> [asyncio.Lock, 持有與等待的數量]
+
+    @contextlib.asynccontextmanager
+    async def hold(self, user_id):
+        user_id = str(user_id)
+        entry = self._locks.get(user_id)
+        if entry is None:
+            entry = self._locks[user_id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                if leases is not None:
+                    await ensure_owned(user_id)
+                await game_data['users'].prefetch(user_id)
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[user_id]
+
+    def __len__(self):
+        return len(self._locks)
+
+    def is_held(self, user_id):
+        return user_id in self._locks
+
+
+user_locks = UserLockTable()
+
+# --- 持久化儲存 (寫回式，批次寫入) ---
+# 指令只把玩家標記為「已變更」，由計時器或累積數量觸發批次寫入，避免每個指令都寫一次磁碟。
+# 部署到 Render 時，容器的檔案系統在每次重新部署或重新啟動後都會清空：預設的相對路徑 fishing_data.db
+# 同樣會遺失。請加掛 Persistent Disk (例如掛在 /var/data)，並設定 FISHING_DB_PATH=/var/data/fishing_data.db；
+# 資料庫不在另外掛載的磁碟上時，啟動時會印出警告 (見 warn_if_ephemeral)。
+STORAGE_BACKEND = os.environ.get('FISHING_STORAGE', 'sqlite')  # 'sqlite' 或 'memory'
+DB_PATH = os.environ.get('FISHING_DB_PATH', 'fishing_data.db')
+FLUSH_INTERVAL = float(os.environ.get('FISHING_FLUSH_INTERVAL', 5.0))
+FLUSH_BATCH_SIZE = int(os.environ.get('FISHING_FLUSH_BATCH_SIZE', 500))
+
+
+class MemoryStorage:
+    """不寫入任何地方，保留舊版「只在記憶體中」的行為。"""
+
+    def __init__(self):
+        self.meta = {}
+
+    def load_all(self):
+        return {}
+
+    def load_page(self, after_user_id, limit):
+        return []
+
+    def load_user(self, user_id):
+        return None
+
+    def write_batch(self, rows):
+        pass
+
+    def get_meta(self, key):
+        return self.meta.get(key)
+
+    def set_meta(self, key, value):
+        self.meta[key] = value
+
+    def close(self):
+        pass
+
+
+class SQLiteStorage:
+    """以 SQLite (WAL 模式) 保存玩家資料，每位玩家一列 JSON。"""
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        # 連線會在事件迴圈和寫入執行緒之間共用，同一時間只允許一個執行緒使用
+        self._lock = threading.Lock()
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS users ('
+            'user_id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)'
+        )
+        # 機器人本身的狀態 (例如已同步的指令樹雜湊)
+        self.conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+        self.conn.commit()
+        # 讀回冷玩家用獨立的連線：WAL 模式下讀取不必等寫入執行緒的批次交易完成
+        self.read_conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._read_lock = threading.Lock()
+
+    def load_all(self):
+        users = {}
+        with self._lock:
+            rows = self.conn.execute('SELECT user_id, data FROM users').fetchall()
+        for user_id, data in rows:
+            try:
+                users[user_id] = json.loads(data)
+            except json.JSONDecodeError:
+                print(f"略過損壞的玩家資料: {user_id}")
+        return users
+
+    def load_page(self, after_user_id, limit):
+        """依 user_id 順序讀取 after_user_id 之後的最多 limit 位玩家：[(user_id, json 字串, 更新時間), ...]。
+
+        每頁只短暫持有連線，逐頁讀完整個資料表時寫入執行緒仍然可以穿插寫入。
+        """
+        with self._read_lock:
+            return self.read_conn.execute(
+                'SELECT user_id, data, updated_at FROM users WHERE user_id > ? ORDER BY user_id LIMIT ?',
+                (after_user_id, limit)
+            ).fetchall()
+
+    def load_user(self, user_id):
+        with self._read_lock:
+            row = self.read_conn.execute('SELECT data FROM users WHERE user_id = ?', (user_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def write_batch(self, rows):
+        """rows 為 [(user_id, json 字串), ...]，在單一交易中寫入。"""
+        now = time.time()
+        with self._lock, self.conn:
+            self.conn.executemany(
+                'INSERT INTO users (user_id, data, updated_at) VALUES (?, ?, ?) '
+                'ON CONFLICT(user_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at',
+                [(user_id, data, now) for user_id, data in rows]
+            )
+
+    def get_meta(self, key):
+        with self._lock:
+            row = self.conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value):
+        with self._lock, self.conn:
+            self.conn.execute(
+                'INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value',
+                (key, value)
+            )
+
+    def close(self):
+        self.read_conn.close()
+        self.conn.close()
+
+
+def mount_point(path):
+    """path 所在的檔案系統的掛載點 (path 本身不必存在)。"""
+    directory = os.path.dirname(os.path.abspath(path))
+    while not os.path.ismount(directory):
+        directory = os.path.dirname(directory)
+    return directory
+
+
+def warn_if_ephemeral(path):
+    """在 Render 上 (有 RENDER 環境變數)，資料庫和容器根目錄在同一個檔案系統時警告：重新部署後資料會全部遺失。"""
+    if not os.environ.get('RENDER') or mount_point(path) != '/':
+        return False
+    print(
+        "⚠️" * 20 + "\n"
+        f"警告：資料庫 {os.path.abspath(path)} 不在 Persistent Disk 上，重新部署或重新啟動後所有玩家資料都會遺失！\n"
+        "請在 Render 加掛 Persistent Disk，並把 FISHING_DB_PATH 指到掛載目錄下 (例如 /var/data/fishing_data.db)。\n"
+        + "⚠️" * 20
+    )
+    return True
+
+
+def create_storage():
+    if STORAGE_BACKEND == 'memory':
+        return MemoryStorage()
+    warn_if_ephemeral(DB_PATH)
+    return SQLiteStorage(DB_PATH)
+
+
+storage = create_storage()
+mark_startup('storage')
+dirty_users = set()
+user_versions = {}  # user_id -> 版本號，每次 mark_dirty 遞增
+_flush_lock = asyncio.Lock()
+_early_flush = None  # mark_dirty 提早觸發的寫入工作，同一時間只排一個
+
+
+# --- 玩家快取 (熱資料在記憶體，冷資料在資料庫) ---
+# game_data['users'] 只保留最近用到的 USER_CACHE_SIZE 位玩家 (LRU)，被淘汰的玩家只留在資料庫，
+# 下次下指令時由 user_locks.hold 在執行緒中讀回。尚未寫回或正在執行指令的玩家不會被淘汰，
+# 所以淘汰時不需要額外寫入。記憶體儲存 (FISHING_STORAGE=memory) 沒有地方放冷資料，不做淘汰。
+USER_CACHE_SIZE = int(os.environ.get('FISHING_USER_CACHE_SIZE', 100000))  # 0 表示不限制
+USER_PAGE_SIZE = 5000  # 逐頁讀取所有玩家時每頁的數量
+
+
+def _decode_user_row(user_id, data):
+    try:
+        return UserRecord.from_dict(json.loads(data))
+    except (ValueError, TypeError, AttributeError, OverflowError):
+        print(f"略過損壞的玩家資料: {user_id}")
+        return None
+
+
+def iter_stored_users():
+    """逐頁讀出資料庫裡所有玩家：(user_id, UserRecord, 更新時間)。"""
+    after = ''
+    while True:
+        rows = storage.load_page(after, USER_PAGE_SIZE)
+        if not rows:
+            return
+        after = rows[-1][0]
+        for user_id, data, updated_at in rows:
+            record = _decode_user_row(user_id, data)
+            if record is not None:
+                yield user_id, record, updated_at
+
+
+def forget_derived(user_id):
+    """玩家離開記憶體 (淘汰或釋放租約) 時，丟掉以版本號為鍵的衍生資料。
+
+    版本號只用於 /bag 的嵌入訊息快取，兩者一起丟掉，重新載入後從 0 開始也不會誤用舊的嵌入訊息。
+    """
+    user_versions.pop(user_id, None)
+    _bag_embed_cache.pop(user_id, None)
+
+
+class UserCache:
+    """game_data['users'] 的實作。一般的 dict 操作 (in、len、items、pop...) 只看記憶體中的玩家；
+    get() / [] 找不到時會從資料庫讀回，iter_all() 則包含所有玩家。
+
+    hits / misses 以指令為單位 (prefetch)：指令開始時玩家已在記憶體中算命中，需要讀資料庫算未命中。
+    prefetch 在資料庫裡找不到的玩家 (第一次玩的人) 記在 _absent，之後的 get() 不再讀資料庫；
+    玩家一放入快取就移除。
+    """
+
+    def __init__(self, capacity):
+        self._hot = OrderedDict()
+        self._absent = set()
+        self.capacity = 0 if isinstance(storage, MemoryStorage) else capacity
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._hot)
+
+    def __iter__(self):
+        return iter(self._hot)
+
+    def __contains__(self, user_id):
+        return user_id in self._hot
+
+    def __getitem__(self, user_id):
+        record = self.get(user_id)
+        if record is None:
+            raise KeyError(user_id)
+        return record
+
+    def __setitem__(self, user_id, record):
+        self._absent.discard(user_id)
+        self._hot[user_id] = record
+        self._hot.move_to_end(user_id)
+        # 剛放入的玩家通常下一步才 mark_dirty (例如批次匯入沒有持有玩家鎖)，不能在這裡就被淘汰
+        self.trim(keep=user_id)
+
+    def items(self):
+        return self._hot.items()
+
+    def peek(self, user_id):
+        """只看記憶體，不更新 LRU 順序。"""
+        return self._hot.get(user_id)
+
+    def pop(self, user_id, default=None):
+        """只從記憶體移除；資料庫裡的資料不受影響。"""
+        # 叢集模式下釋放租約後其他程序可能建立這位玩家，不能再認定資料庫裡沒有
+        self._absent.discard(user_id)
+        return self._hot.pop(user_id, default)
+
+    def clear(self):
+        self._hot.clear()
+        self._absent.clear()
+
+    def get(self, user_id, default=None):
+        record = self._hot.get(user_id)
+        if record is not None:
+            self._hot.move_to_end(user_id)
+            return record
+        if not self.capacity or user_id in self._absent:
+            return default
+        # 不經過 user_locks 的讀取才會走到這裡，直接在事件迴圈上讀；每次按鍵都會呼叫的路徑 (自動完成) 請用 peek
+        record = self._load(user_id, storage.load_user(user_id))
+        return default if record is None else record
+
+    def _load(self, user_id, data):
+        if data is None:
+            return None
+        self.misses += 1
+        record = UserRecord.from_dict(data)
+        self[user_id] = record
+        return record
+
+    async def prefetch(self, user_id):
+        """指令開始前把冷玩家從資料庫讀回 (在執行緒中讀取，不阻塞事件迴圈)。"""
+        if user_id in self._hot:
+            self.hits += 1
+            self._hot.move_to_end(user_id)
+            return
+        if not self.capacity or user_id in self._absent:
+            return
+        data = await asyncio.to_thread(storage.load_user, user_id)
+        # 讀取期間可能已被其他路徑載入，記憶體中的版本優先
+        if user_id in self._hot:
+            return
+        if data is None:
+            # 只看過排行榜之類、從沒建立紀錄的人也會留在這裡；太多時整個清掉，頂多多讀一次資料庫
+            if len(self._absent) >= self.capacity:
+                self._absent.clear()
+            self._absent.add(user_id)
+        else:
+            self._load(user_id, data)
+
+    def trim(self, keep=None):
+        """淘汰最久沒用到的玩家直到不超過容量。略過尚未寫回、正在執行指令的玩家，以及 keep。"""
+        if not self.capacity:
+            return
+        skipped = 0
+        while len(self._hot) > self.capacity and skipped < len(self._hot):
+            user_id = next(iter(self._hot))
+            if user_id == keep or user_id in dirty_users or user_locks.is_held(user_id):
+                self._hot.move_to_end(user_id)
+                skipped += 1
+                continue
+            del self._hot[user_id]
+            forget_derived(user_id)
+            self.evictions += 1
+
+    def _with_hot(self, user_id, record, seen):
+        hot = self._hot.get(user_id)
+        if hot is None:
+            return record
+        seen.add(user_id)
+        return hot
+
+    def iter_all(self):
+        """所有玩家 (user_id, UserRecord)，含只在資料庫裡的；記憶體中的版本優先，讀出的玩家不放入快取。"""
+        seen = set()
+        for user_id, record, _ in iter_stored_users():
+            yield user_id, self._with_hot(user_id, record, seen)
+        for user_id, record in list(self._hot.items()):
+            if user_id not in seen:
+                yield user_id, record
+
+    async def iter_all_async(self):
+        """同 iter_all，但資料庫在執行緒中逐頁讀取，頁與頁之間事件迴圈照常處理指令。"""
+        seen = set()
+        after = ''
+        while True:
+            rows = await asyncio.to_thread(storage.load_page, after, USER_PAGE_SIZE)
+            if not rows:
+                break
+            after = rows[-1][0]
+            for user_id, data, _ in rows:
+                record = _decode_user_row(user_id, data)
+                if record is not None:
+                    yield user_id, self._with_hot(user_id, record, seen)
+        for user_id, record in list(self._hot.items()):
+            if user_id not in seen:
+                yield user_id, record
+
+
+game_data['users'] = UserCache(USER_CACHE_SIZE)
+
+
+def load_persisted_users():
+    """啟動時由資料庫建立排行榜，並預先載入最近更新的玩家 (最多 USER_CACHE_SIZE 位)。
+
+    WAL 會自動回滾未完成的交易，因此讀到的一定是最後一次完整寫入。
+    """
+    users = game_data['users']
+    recent = []  # (更新時間, user_id, UserRecord) 的最小堆積
+    total = 0
+
+    def restored():
+        nonlocal total
+        for user_id, record, updated_at in iter_stored_users():
+            total += 1
+            # 叢集模式：玩家在取得所有權時才載入，這裡只用資料庫內容建立排行榜
+            if leases is None:
+                if not users.capacity or len(recent) < users.capacity:
+                    heapq.heappush(recent, (updated_at, user_id, record))
+                elif updated_at > recent[0][0]:
+                    heapq.heapreplace(recent, (updated_at, user_id, record))
+            yield user_id, record
+
+    rebuild_leaderboards(restored())
+    # 依更新時間由舊到新放入，最近更新的玩家在 LRU 的尾端
+    for _, user_id, record in sorted(recent, key=lambda entry: entry[:2]):
+        users[user_id] = record
+    print(f"已從資料庫恢復 {total} 位玩家的資料 ({len(users)} 位載入記憶體)。")
+
+
+def mark_dirty(user_id):
+    """標記玩家資料已變更，累積到一定數量時提早觸發寫入。
+
+    任何修改玩家資料的地方都必須呼叫這個函數：它同時遞增玩家的版本號，
+    讓以版本號為鍵的快取 (例如 /bag 的嵌入訊息) 失效，並更新排行榜。
+    """
+    global _early_flush
+    user_id = str(user_id)
+    user_versions[user_id] = user_versions.get(user_id, 0) + 1
+    update_leaderboards(user_id)
+    dirty_users.add(user_id)
+    # 批次收竿時一次會有上百位玩家變更，工作開始執行 (取得鎖) 之前不要重複建立
+    if len(dirty_users) >= FLUSH_BATCH_SIZE and (_early_flush is None or _early_flush.done()):
+        _early_flush = asyncio.get_running_loop().create_task(flush_dirty_users())
+
+
+def _snapshot_dirty_users():
+    # 在事件迴圈執行緒上序列化，寫入執行緒只接觸字串，不會和指令同時讀寫同一份 dict
+    rows = []
+    for user_id in dirty_users:
+        record = game_data['users'].peek(user_id)
+        if record is not None:
+            rows.append((user_id, json.dumps(record.to_dict(), ensure_ascii=False)))
+    dirty_users.clear()
+    return rows
+
+
+async def flush_dirty_users():
+    async with _flush_lock:
+        if not dirty_users:
+            return
+        rows = _snapshot_dirty_users()
+        try:
+            await asyncio.to_thread(storage.write_batch, rows)
+        except Exception as e:
+            print(f"寫入資料庫失敗: {e}")
+            # 寫入失敗就留到下一輪再試
+            dirty_users.update(user_id for user_id, _ in rows)
+            return
+        # 寫回後這些玩家可以被淘汰了
+        game_data['users'].trim()
+
+
+def flush_dirty_users_sync():
+    """事件迴圈已停止時 (程式結束前) 使用的同步版本。"""
+    rows = _snapshot_dirty_users()
+    if rows:
+        storage.write_batch(rows)
+
+
+@tasks.loop(seconds=FLUSH_INTERVAL)
+async def flush_loop():
+    await flush_dirty_users()
+
+# --- 叢集模式：玩家所有權 (跨程序租約) ---
+# 同一位玩家可能在不同分片 (也就是不同工作程序) 的伺服器下指令。每位玩家在資料庫中有一筆租約，
+# 只有持有租約的程序能把玩家載入記憶體並修改；其他程序需要時會請求移交，
+# 持有者在玩家閒置 (沒有指令正在執行) 時寫回資料並釋放租約。
+LEASE_TTL = float(os.environ.get('FISHING_LEASE_TTL', 30.0))            # 租約有效秒數，程序當機後最多這麼久可被接手
+LEASE_IDLE_RELEASE = float(os.environ.get('FISHING_LEASE_IDLE', 60.0))  # 玩家閒置多久後主動釋放
+LEASE_WAIT = float(os.environ.get('FISHING_LEASE_WAIT', 2.0))           # 等待其他程序移交的上限 (需小於 Discord 的 3 秒回應期限)
+# 重試取得租約、以及檢查其他程序的移交請求的間隔：移交的延遲大約是兩者相加，指令會卡在這段時間
+LEASE_POLL = float(os.environ.get('FISHING_LEASE_POLL', 0.02))
+LEASE_MAINTENANCE_INTERVAL = LEASE_POLL
+LEASE_IDLE_CHECK = 1.0  # 掃描閒置玩家 (需走訪所有持有的玩家) 的間隔
+
+
+class UserBusyError(Exception):
+    """玩家正由另一個工作程序處理，且沒有在時限內移交。"""
+
+
+class UserLeases:
+    def __init__(self, path, owner):
+        self.owner = owner
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._lock = threading.Lock()
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        # 租約每次取得都是一筆交易；程序當機後租約本來就會在 TTL 後失效，不需要每筆都等 fsync
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS leases ('
+            'user_id TEXT PRIMARY KEY, owner TEXT NOT NULL, expires REAL NOT NULL, requested INTEGER NOT NULL DEFAULT 0)'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS leases_owner ON leases (owner)')
+        self.conn.commit()
+
+    def try_acquire(self, user_ids):
+        """在一次交易中取得一批租約 (沒有人持有、已過期或本來就是自己的)，回傳取得的 user_id 集合；
+        其餘玩家留下移交請求。"""
+        now = time.time()
+        acquired = set()
+        with self._lock, self.conn:
+            for user_id in user_ids:
+                cursor = self.conn.execute(
+                    'INSERT INTO leases (user_id, owner, expires, requested) VALUES (?, ?, ?, 0) '
+                    'ON CONFLICT(user_id) DO UPDATE SET owner = excluded.owner, expires = excluded.expires, requested = 0 '
+                    'WHERE leases.owner = excluded.owner OR leases.expires < ?',
+                    (user_id, self.owner, now + LEASE_TTL, now)
+                )
+                if cursor.rowcount == 1:
+                    acquired.add(user_id)
+            self.conn.executemany(
+                'UPDATE leases SET requested = 1 WHERE user_id = ?',
+                [(user_id,) for user_id in user_ids if user_id not in acquired]
+            )
+        return acquired
+
+    def renew(self, user_ids):
+        with self._lock, self.conn:
+            self.conn.executemany(
+                'UPDATE leases SET expires = ? WHERE user_id = ? AND owner = ?',
+                [(time.time() + LEASE_TTL, user_id, self.owner) for user_id in user_ids]
+            )
+
+    def requested(self):
+        with self._lock:
+            rows = self.conn.execute('SELECT user_id FROM leases WHERE owner = ? AND requested = 1', (self.owner,)).fetchall()
+        return [row[0] for row in rows]
+
+    def release(self, user_ids):
+        with self._lock, self.conn:
+            self.conn.executemany(
+                'DELETE FROM leases WHERE user_id = ? AND owner = ?',
+                [(user_id, self.owner) for user_id in user_ids]
+            )
+
+    def close(self):
+        self.conn.close()
+
+
+leases = UserLeases(DB_PATH, f'worker-{WORKER_ID}-{os.getpid()}') if WORKER_ID is not None and STORAGE_BACKEND == 'sqlite' else None
+owned_users = {}  # user_id -> 最後一次使用的時間 (monotonic)
+# 同一輪事件迴圈中要取得租約的玩家合併成一筆交易 (見 _acquire_batches)，不同玩家之間不互相等待
+_acquire_waiters = {}  # user_id -> Future，結果為 (是否取得, 資料庫中的玩家資料)
+_acquire_task = None
+# 正在寫回並釋放的玩家：同一位玩家的「釋放」和「重新取得」不能交錯，重新取得前要等釋放完成
+_releasing = {}  # user_id -> asyncio.Event
+
+
+def _acquire_and_load(user_ids):
+    """在執行緒中取得一批租約，並讀回取得的玩家：前一個持有者釋放前已經寫回，資料庫裡就是最新狀態。"""
+    return {user_id: storage.load_user(user_id) for user_id in leases.try_acquire(user_ids)}
+
+
+async def _acquire_batches():
+    global _acquire_task
+    try:
+        while _acquire_waiters:
+            batch = dict(_acquire_waiters)
+            _acquire_waiters.clear()
+            try:
+                loaded = await asyncio.to_thread(_acquire_and_load, list(batch))
+            except Exception as e:
+                for future in batch.values():
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for user_id, future in batch.items():
+                if not future.done():
+                    future.set_result((user_id in loaded, loaded.get(user_id)))
+            # 等待中被取消的指令不會記錄所有權，取得的租約要還回去，否則要等 TTL 過期才能被接手
+            abandoned = [user_id for user_id in loaded if batch[user_id].cancelled()]
+            if abandoned:
+                await asyncio.to_thread(leases.release, abandoned)
+    finally:
+        _acquire_task = None
+
+
+async def ensure_owned(user_id):
+    """確保這個程序持有玩家的租約；剛取得時從資料庫載入最新資料。由 user_locks.hold 呼叫。"""
+    if user_id in owned_users:
+        owned_users[user_id] = time.monotonic()
+        return
+    global _acquire_task
+    deadline = time.monotonic() + LEASE_WAIT
+    while True:
+        while user_id in _releasing:
+            await _releasing[user_id].wait()
+        future = _acquire_waiters.get(user_id)
+        if future is None:
+            future = _acquire_waiters[user_id] = asyncio.get_running_loop().create_future()
+        if _acquire_task is None:
+            _acquire_task = asyncio.create_task(_acquire_batches())
+        acquired, data = await future
+        if acquired:
+            break
+        if time.monotonic() > deadline:
+            raise UserBusyError(user_id)
+        await asyncio.sleep(LEASE_POLL)
+    if data is not None:
+        game_data['users'][user_id] = UserRecord.from_dict(data)
+    else:
+        game_data['users'].pop(user_id, None)
+    # 換上資料庫的版本等同一次變更 (不需要寫回)：遞增版本號，讓舊的嵌入訊息失效
+    user_versions[user_id] = user_versions.get(user_id, 0) + 1
+    owned_users[user_id] = time.monotonic()
+    update_leaderboards(user_id)
+
+
+async def release_owned_users(user_ids):
+    """寫回並釋放玩家；正在執行指令或寫回失敗的玩家保留到下一輪。"""
+    await flush_dirty_users()
+    releasable = [
+        user_id for user_id in user_ids
+        if user_id in owned_users and user_id not in _releasing
+        and not user_locks.is_held(user_id) and user_id not in dirty_users
+    ]
+    if not releasable:
+        return
+    done = asyncio.Event()
+    for user_id in releasable:
+        owned_users.pop(user_id, None)
+        game_data['users'].pop(user_id, None)
+        # 釋放後其他程序可能修改這位玩家，重新取得時不能沿用這裡的嵌入訊息
+        forget_derived(user_id)
+        _releasing[user_id] = done
+    try:
+        await asyncio.to_thread(leases.release, releasable)
+    finally:
+        for user_id in releasable:
+            del _releasing[user_id]
+        done.set()
+
+
+@tasks.loop(seconds=LEASE_MAINTENANCE_INTERVAL)
+async def lease_maintenance():
+    tick = lease_maintenance.current_loop
+    to_release = set(await asyncio.to_thread(leases.requested)) & set(owned_users)
+    # 移交請求每一輪都要處理；閒置掃描與續約只需要低頻率，避免每輪走訪所有持有的玩家
+    if tick % max(1, int(LEASE_IDLE_CHECK / LEASE_MAINTENANCE_INTERVAL)) == 0:
+        now = time.monotonic()
+        to_release.update(user_id for user_id, last_used in owned_users.items() if now - last_used > LEASE_IDLE_RELEASE)
+    if to_release:
+        await release_owned_users(list(to_release))
+    # 續約的頻率只需要遠高於 TTL
+    if owned_users and tick % max(1, int(LEASE_TTL / 3 / LEASE_MAINTENANCE_INTERVAL)) == 0:
+        await asyncio.to_thread(leases.renew, list(owned_users))
+
+# --- 遊戲邏輯：拋竿機率 (稀有度抽樣表由 compute_rarity_rates 編譯) ---
+def calculate_catch_probability(user_data):
+    rod = user_data.current_rod
+    rod_info = game_data['items'].get(rod, game_data['items']['基本魚竿'])
+
+    catch_bonus = rod_info['catch_bonus']
+    rare_bonus = rod_info['rare_bonus']
+
+    if user_data.item_count('魚餌') > 0:
+        bait_info = game_data['items']['魚餌']
+        catch_bonus *= bait_info['catch_bonus']
+        rare_bonus += bait_info['rare_bonus']
+        user_data.add_item('魚餌', -1)
+
+    return catch_bonus, rare_bonus
+
+def compute_rarity_rates(rare_bonus, base_rates=None):
+    """依稀有度加成計算各稀有度的機率 (已正規化)。抽樣表都由這個公式編譯而來。"""
+    if base_rates is None:
+        base_rates = game_data['rarity_rates']
+    rates = base_rates.copy()
+
+    total_boost = rare_bonus
+    if total_boost > 0:
+        boost_to_legendary = total_boost * 0.4
+        boost_to_epic = total_boost * 0.3
+        boost_to_rare = total_boost * 0.2
+
+        rates['legendary'] = rates.get('legendary', 0) + boost_to_legendary
+        rates['epic'] = rates.get('epic', 0) + boost_to_epic
+        rates['rare'] = rates.get('rare', 0) + boost_to_rare
+
+        deductible_amount = (boost_to_legendary + boost_to_epic + boost_to_rare) - (rates['common'] + rates['rare'] + rates['epic'] + rates['legendary'] - sum(base_rates.values()))
+        if deductible_amount > 0:
+            deduct_from_common = min(rates.get('common', 0), deductible_amount * 0.7)
+            rates['common'] = rates.get('common', 0) - deduct_from_common
+            deductible_amount -= deduct_from_common
+
+            deduct_from_junk = min(rates.get('junk', 0), deductible_amount)
+            rates['junk'] = rates.get('junk', 0) - deduct_from_junk
+
+    for rarity in rates:
+        rates[rarity] = max(0, rates[rarity])
+
+    total_sum = sum(rates.values())
+    if total_sum != 0:
+        for rarity in rates:
+            rates[rarity] /= total_sum
+    else:
+        rates = {'common': 1.0}
+
+    return rates
+
+
+class AliasTable:
+    """Walker/Vose alias 表：建表 O(n)，每次抽樣 O(1)。"""
+
+    __slots__ = ('keys', 'prob', 'alias', 'size', 'np_tables')
+
+    def __init__(self, weights):
+        keys = list(weights)
+        n = len(keys)
+        scaled = [weights[key] * n for key in keys]
+        prob = [1.0] * n
+        alias = list(range(n))
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s = small.pop()
+            l = large.pop()
+            prob[s] = scaled[s]
+            alias[s] = l
+            scaled[l] = (scaled[l] + scaled[s]) - 1.0
+            if scaled[l] < 1.0:
+                small.append(l)
+            else:
+                large.append(l)
+        # 剩下的欄位因浮點誤差而接近 1，直接視為 1
+        self.keys = keys
+        self.prob = prob
+        self.alias = alias
+        self.size = n
+        self.np_tables = None  # (prob, alias) 的 NumPy 版本，第一次批次抽樣時建立
+
+    def sample(self):
+        u = random.random() * self.size
+        i = int(u)
+        if u - i < self.prob[i]:
+            return self.keys[i]
+        return self.keys[self.alias[i]]
+
+    def sample_indices(self, rng, count):
+        """一次抽出 count 個結果，回傳 self.keys 的索引陣列 (需要 NumPy)。"""
+        if self.np_tables is None:
+            self.np_tables = (np.array(self.prob), np.array(self.alias, dtype=np.int64))
+        np_prob, np_alias = self.np_tables
+        u = rng.random(count) * self.size
+        i = u.astype(np.int64)
+        return np.where(u - i < np_prob[i], i, np_alias[i])
+
+
+# --- 預先編譯的目錄衍生資料 ---
+# 目錄 (fish_data / items / rarity_rates) 變更後必須呼叫 invalidate_catalog_caches()，
+# 或用 install_catalog() 換上新的目錄
+catalog_version = 0
+_rarity_tables = {}   # rare_bonus -> AliasTable
+_fish_species = {}    # rarity -> ((魚名, 最小重量, 最大重量, 每公斤價格, emoji), ...)
+_fish_species_arrays = {}  # rarity -> (最小重量陣列, 最大重量陣列, 每公斤價格陣列)，第一次批次結算時建立
+_fish_index = {}      # 魚名 -> (rarity, emoji, 每公斤價格)
+_shop_index = None    # 可購買的道具 (不含基本魚竿) 的 NameIndex
+_rod_index = None     # 魚竿的 NameIndex
+_static_embeds = {}   # 'game' / 'shop' -> discord.Embed，內容只跟目錄有關
+
+RARITY_COLORS = {'common': 0x808080, 'rare': 0x0080ff, 'epic': 0x8000ff, 'legendary': 0xffd700, 'junk': 0x404040}
+RARITY_EMOJIS = {'common': '🟢', 'rare': '🔵', 'epic': '🟣', 'legendary': '🟡', 'junk': '⚫'}
+
+
+def possible_rare_bonuses(items=None):
+    """列出所有魚竿 (可搭配魚餌) 組合會產生的 rare_bonus 值。"""
+    if items is None:
+        items = game_data['items']
+    bait_bonus = items['魚餌']['rare_bonus'] if '魚餌' in items else None
+    bonuses = set()
+    for name, info in items.items():
+        if '魚竿' not in name:
+            continue
+        bonuses.add(info['rare_bonus'])
+        if bait_bonus is not None:
+            # 與 calculate_catch_probability 相同的加法順序，確保浮點數鍵值一致
+            bonuses.add(info['rare_bonus'] + bait_bonus)
+    return bonuses
+
+
+def get_rarity_table(rare_bonus):
+    table = _rarity_tables.get(rare_bonus)
+    if table is None:
+        table = _rarity_tables[rare_bonus] = AliasTable(compute_rarity_rates(rare_bonus))
+    return table
+
+
+def get_fish_species(rarity):
+    species = _fish_species.get(rarity)
+    if not species:
+        species = _fish_species['common']
+    return species
+
+
+def get_fish_species_arrays(rarity):
+    arrays = _fish_species_arrays.get(rarity)
+    if arrays is None:
+        species = get_fish_species(rarity)
+        arrays = _fish_species_arrays[rarity] = (
+            np.array([entry[1] for entry in species]),
+            np.array([entry[2] for entry in species]),
+            np.array([entry[3] for entry in species]),
+        )
+    return arrays
+
+
+def lookup_fish(fish_name):
+    """魚名 -> (rarity, emoji, 每公斤價格)；目錄裡沒有的魚 (例如舊存檔) 視為普通魚。"""
+    return _fish_index.get(fish_name, ('common', '🐟', 0))
+
+
+AUTOCOMPLETE_LIMIT = 25  # Discord 一次最多顯示 25 個選項
+
+
+def normalize_item_name(name):
+    """比對用的名稱：全形轉半形、不分大小寫、忽略所有空白。"""
+    return ''.join(unicodedata.normalize('NFKC', name).casefold().split())
+
+
+class NameIndex:
+    """道具名稱的完整比對與子字串索引，供自動完成和指令的最終查詢共用。
+
+    每個正規化名稱的所有子字串都預先對應到候選名稱 (前綴相符的排前面，其次依目錄順序)，
+    每次按鍵只需要一次 dict 查詢。道具名稱很短，子字串數量不多；建好後唯讀，可以在執行緒中建立。
+    """
+
+    def __init__(self, names):
+        self.exact = {}
+        for name in names:
+            self.exact.setdefault(normalize_item_name(name), name)
+        self.all = tuple(self.exact.values())
+        catalog_order = {name: position for position, name in enumerate(self.all)}
+        found = {}  # 子字串 -> {名稱: 出現位置}
+        for normalized, name in self.exact.items():
+            for start in range(len(normalized)):
+                for end in range(start + 1, len(normalized) + 1):
+                    found.setdefault(normalized[start:end], {}).setdefault(name, start)
+        self.substrings = {
+            key: tuple(sorted(matches, key=lambda name: (matches[name] != 0, catalog_order[name])))
+            for key, matches in found.items()
+        }
+
+    def resolve(self, text, owned=None):
+        """輸入 -> 道具名稱。正規化後完全相同的優先；否則只有一個候選名稱包含這段輸入時就是它
+        (owned 用來只看玩家擁有的道具)。找不到或有多個候選時回傳 None。"""
+        key = normalize_item_name(text)
+        name = self.exact.get(key)
+        if name is not None or not key:
+            return name
+        candidates = [name for name in self.substrings.get(key, ()) if owned is None or owned(name)]
+        return candidates[0] if len(candidates) == 1 else None
+
+    def search(self, text):
+        """輸入 -> 依相關程度排序的候選名稱。空白輸入回傳全部。"""
+        key = normalize_item_name(text)
+        if not key:
+            return self.all
+        return self.substrings.get(key, ())
+
+
+def compile_catalog(catalog=None):
+    """由目錄建立所有衍生資料並回傳，不修改全域狀態，可以在執行緒中執行。"""
+    if catalog is None:
+        catalog = game_data
+    fish_index = {}
+    fish_species = {}
+    for rarity, fish_map in catalog['fish_data'].items():
+        for name, info in fish_map.items():
+            # 同名的魚只記第一個稀有度，與逐一掃描 fish_data 的結果相同
+            fish_index.setdefault(name, (rarity, info.get('emoji', '🐟'), info['price_per_kg']))
+        if fish_map:
+            fish_species[rarity] = tuple(
+                (name, info['weight_range'][0], info['weight_range'][1], info['price_per_kg'], info.get('emoji', '🐟'))
+                for name, info in fish_map.items()
+            )
+    rarity_tables = {
+        rare_bonus: AliasTable(compute_rarity_rates(rare_bonus, catalog['rarity_rates']))
+        for rare_bonus in possible_rare_bonuses(catalog['items'])
+    }
+    return {
+        'rarity_tables': rarity_tables,
+        'fish_species': fish_species,
+        'fish_index': fish_index,
+        'shop_index': NameIndex(name for name in catalog['items'] if name != '基本魚竿'),
+        'rod_index': NameIndex(name for name in catalog['items'] if '魚竿' in name),
+    }
+
+
+def install_catalog(catalog, compiled):
+    """換上新的目錄與其衍生資料。
+
+    整個過程是同步的，中間沒有 await：任何指令看到的都是完整的舊目錄或完整的新目錄。
+    正在等待的 /fish 會在結算時使用新的機率與價格。
+    """
+    global catalog_version, _rarity_tables, _fish_species, _fish_species_arrays, _fish_index, _static_embeds
+    global _shop_index, _rod_index
+    legendary_before = set(game_data['fish_data'].get('legendary', {}))
+    for key in ('fish_data', 'items', 'rarity_rates'):
+        game_data[key] = catalog[key]
+    for fish_map in catalog['fish_data'].values():
+        for name in fish_map:
+            FISH_IDS.id_of(name)
+    for name in catalog['items']:
+        ITEM_IDS.id_of(name)
+    _rarity_tables = compiled['rarity_tables']
+    _fish_species = compiled['fish_species']
+    _fish_species_arrays = {}
+    _fish_index = compiled['fish_index']
+    _shop_index = compiled['shop_index']
+    _rod_index = compiled['rod_index']
+    _static_embeds = {}
+    catalog_version += 1
+    # 只有傳說魚的種類改變時，傳說魚排行榜才需要依新目錄重算
+    if set(game_data['fish_data'].get('legendary', {})) != legendary_before:
+        schedule_leaderboard_rebuild()
+
+
+def invalidate_catalog_caches():
+    install_catalog(game_data, compile_catalog())
+
+
+def determine_fish_rarity(rare_bonus):
+    return get_rarity_table(rare_bonus).sample()
+
+
+_compiled = compile_catalog()
+_rarity_tables = _compiled['rarity_tables']
+_fish_species = _compiled['fish_species']
+_fish_index = _compiled['fish_index']
+_shop_index = _compiled['shop_index']
+_rod_index = _compiled['rod_index']
+del _compiled
+
+# 目錄熱重新載入
+CATALOG_WATCH = os.environ.get('FISHING_CATALOG_WATCH', '1') == '1'
+CATALOG_POLL_INTERVAL = float(os.environ.get('FISHING_CATALOG_POLL', 2.0))
+_catalog_reload_lock = asyncio.Lock()
+catalog_reloads = 0
+catalog_reload_seconds = 0.0
+
+
+def _catalog_stamp():
+    try:
+        stat = os.stat(CATALOG_PATH)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+_catalog_loaded_stamp = _catalog_stamp()
+
+
+def _load_and_compile(path):
+    catalog = load_catalog_file(path)
+    return catalog, compile_catalog(catalog)
+
+
+async def reload_catalog():
+    """重新讀取目錄檔並換上。讀檔、驗證與編譯都在執行緒中進行，事件迴圈只負責最後的替換。
+
+    失敗時保留目前的目錄並拋出 CatalogError。回傳魚種數、道具數與耗時。
+    """
+    global catalog_reloads, catalog_reload_seconds, _catalog_loaded_stamp
+    async with _catalog_reload_lock:
+        started = time.perf_counter()
+        stamp = _catalog_stamp()
+        catalog, compiled = await asyncio.to_thread(_load_and_compile, CATALOG_PATH)
+        removed = set(game_data['items']) - set(catalog['items'])
+        if removed:
+            raise CatalogError(f"items: 不能移除玩家可能已擁有的道具 {', '.join(sorted(removed))}")
+        install_started = time.perf_counter()
+        install_catalog(catalog, compiled)
+        finished = time.perf_counter()
+        _catalog_loaded_stamp = stamp
+        catalog_reloads += 1
+        catalog_reload_seconds = finished - started
+        return {
+            'fish': len(compiled['fish_index']),
+            'items': len(catalog['items']),
+            'seconds': finished - started,
+            'install_seconds': finished - install_started,
+        }
+
+
+@tasks.loop(seconds=CATALOG_POLL_INTERVAL)
+async def catalog_watcher():
+    global _catalog_loaded_stamp
+    stamp = _catalog_stamp()
+    if stamp is None or stamp == _catalog_loaded_stamp:
+        return
+    try:
+        result = await reload_catalog()
+        print(f"已重新載入目錄：{result['fish']} 種魚、{result['items']} 個道具 ({result['seconds'] * 1000:.1f} ms)。")
+    except CatalogError as e:
+        # 同一個版本的檔案不再重試，等下一次修改
+        _catalog_loaded_stamp = stamp
+        print(f"目錄檔有誤，保留目前的目錄：\n{e}")
+
+# --- 排行榜 (增量維護) ---
+LEADERBOARD_SIZE = 10
+class SortedKeyList:
+    """分桶的有序串列，加上各桶長度的 Fenwick 樹，插入、刪除與名次查詢都是 O(log n)。
+
+    每個桶最多 2 * LOAD 個元素，插入只搬動一個小桶；桶分裂或清空時才重建 Fenwick 樹。
+    """
+
+    LOAD = 1000
+
+    def __init__(self, keys=()):
+        self._build(sorted(keys))
+
+    def _build(self, ordered):
+        self._lists = [ordered[i:i + self.LOAD] for i in range(0, len(ordered), self.LOAD)]
+        self._maxes = [bucket[-1] for bucket in self._lists]
+        self._rebuild_index()
+
+    def _rebuild_index(self):
+        tree = [0] + [len(bucket) for bucket in self._lists]
+        for i in range(1, len(tree)):
+            parent = i + (i & -i)
+            if parent < len(tree):
+                tree[parent] += tree[i]
+        self._tree = tree
+        self._len = sum(len(bucket) for bucket in self._lists)
+
+    def _tree_add(self, pos, delta):
+        i = pos + 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def _tree_prefix(self, pos):
+        """前 pos 個桶的元素總數。"""
+        total = 0
+        i = pos
+        while i > 0:
+            total += self._tree[i]
+            i -= i & -i
+        return total
+
+    def __len__(self):
+        return self._len
+
+    def add(self, key):
+        if not self._lists:
+            self._lists.append([key])
+            self._maxes.append(key)
+            self._rebuild_index()
+            return
+        pos = bisect.bisect_left(self._maxes, key)
+        if pos == len(self._maxes):
+            pos -= 1
+            self._lists[pos].append(key)
+            self._maxes[pos] = key
+        else:
+            bisect.insort(self._lists[pos], key)
+        self._len += 1
+        if len(self._lists[pos]) > 2 * self.LOAD:
+            bucket = self._lists[pos]
+            self._lists[pos:pos + 1] = [bucket[:self.LOAD], bucket[self.LOAD:]]
+            self._maxes[pos:pos + 1] = [bucket[self.LOAD - 1], bucket[-1]]
+            self._rebuild_index()
+        else:
+            self._tree_add(pos, 1)
+
+    def remove(self, key):
+        pos = bisect.bisect_left(self._maxes, key)
+        bucket = self._lists[pos]
+        del bucket[bisect.bisect_left(bucket, key)]
+        self._len -= 1
+        if not bucket:
+            del self._lists[pos]
+            del self._maxes[pos]
+            self._rebuild_index()
+        else:
+            self._maxes[pos] = bucket[-1]
+            self._tree_add(pos, -1)
+
+    def index(self, key):
+        """key 之前的元素個數 (key 必須存在)。"""
+        pos = bisect.bisect_left(self._maxes, key)
+        return self._tree_prefix(pos) + bisect.bisect_left(self._lists[pos], key)
+
+    def first(self, count):
+        result = []
+        for bucket in self._lists:
+            result.extend(bucket[:count - len(result)])
+            if len(result) >= count:
+                break
+        return result
+
+
+class Leaderboard:
+    """單一指標的排行榜。分數高者在前，同分時依 user_id 排序。"""
+
+    def __init__(self, name, title, score_fn):
+        self.name = name
+        self.title = title
+        self.score_fn = score_fn
+        self.scores = {}
+        self.order = SortedKeyList()
+
+    def update(self, user_id, user_data):
+        score = self.score_fn(user_data)
+        old = self.scores.get(user_id)
+        if old == score:
+            return
+        if old is not None:
+            self.order.remove((-old, user_id))
+        self.order.add((-score, user_id))
+        self.scores[user_id] = score
+
+    def rebuild(self, users):
+        self.set_scores({user_id: self.score_fn(user_data) for user_id, user_data in users.items()})
+
+    def set_scores(self, scores):
+        self.scores = scores
+        self.order = SortedKeyList((-score, user_id) for user_id, score in scores.items())
+
+    def top(self, count):
+        return [(user_id, -neg_score) for neg_score, user_id in self.order.first(count)]
+
+    def rank(self, user_id):
+        """名次 (從 1 開始)；沒有紀錄時回傳 None。"""
+        score = self.scores.get(user_id)
+        if score is None:
+            return None
+        return self.order.index((-score, user_id)) + 1
+
+
+def legendary_count(user_data):
+    return sum(user_data.fish_count(fish_name) for fish_name in game_data['fish_data'].get('legendary', {}))
+
+
+leaderboards = {
+    'money': Leaderboard('money', '💰 金錢', lambda user_data: user_data.money),
+    'total_catches': Leaderboard('total_catches', '📊 總釣魚次數', lambda user_data: user_data.total_catches),
+    'legendary': Leaderboard('legendary', '🟡 傳說魚數量', legendary_count),
+}
+
+
+def update_leaderboards(user_id):
+    user_data = game_data['users'].peek(user_id)
+    if user_data is None:
+        return
+    for board in leaderboards.values():
+        board.update(user_id, user_data)
+
+
+def _score_user(scores, user_id, user_data):
+    for name, board in leaderboards.items():
+        scores[name][user_id] = board.score_fn(user_data)
+
+
+def rebuild_leaderboards(pairs=None):
+    """重建所有排行榜。pairs 為 (user_id, UserRecord) 的序列，預設為所有玩家 (含只在資料庫裡的)。"""
+    scores = {name: {} for name in leaderboards}
+    for user_id, user_data in game_data['users'].iter_all() if pairs is None else pairs:
+        _score_user(scores, user_id, user_data)
+    for name, board in leaderboards.items():
+        board.set_scores(scores[name])
+
+
+def schedule_leaderboard_rebuild():
+    """需要讀資料庫裡所有玩家，有事件迴圈時在背景進行；否則 (例如啟動前) 直接重建。"""
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        rebuild_leaderboards()
+        return
+    loop.create_task(rebuild_leaderboards_async())
+
+
+async def rebuild_leaderboards_async():
+    """rebuild_leaderboards 的背景版本：逐頁讀資料庫，期間指令照常處理。
+
+    讀取期間記憶體中的玩家可能又有變更，最後 (沒有 await 的區段) 以記憶體中的版本重新計分。
+    """
+    scores = {name: {} for name in leaderboards}
+    async for user_id, user_data in game_data['users'].iter_all_async():
+        _score_user(scores, user_id, user_data)
+    for user_id, user_data in game_data['users'].items():
+        _score_user(scores, user_id, user_data)
+    for name, board in leaderboards.items():
+        board.set_scores(scores[name])
+
+
+# --- 連續拋竿 (批次結算) ---
+MAX_CASTS_PER_COMMAND = 100
+# 機率相同的拋竿至少這麼多次才用 NumPy 抽樣：NumPy 每批有約 60 µs 的固定成本，
+# 逐次抽樣每次約 1.1 µs，大約 64 次以上 NumPy 才比較快
+CAST_NUMPY_MIN = 64
+_rng = None
+
+
+def _draw_catches_numpy(count, success_rate, rare_bonus):
+    """以 NumPy 一次抽出 count 次拋竿的成功與否、稀有度、魚種和重量。"""
+    global _rng
+    if _rng is None:
+        _rng = np.random.default_rng()
+    catches = []
+    hits = int(np.count_nonzero(_rng.random(count) <= success_rate))
+    if hits == 0:
+        return catches
+    table = get_rarity_table(rare_bonus)
+    rarity_counts = np.bincount(table.sample_indices(_rng, hits), minlength=table.size)
+    for key_index, rarity_count in enumerate(rarity_counts.tolist()):
+        if rarity_count == 0:
+            continue
+        rarity = table.keys[key_index]
+        if not game_data['fish_data'].get(rarity):
+            rarity = 'common'
+        species = get_fish_species(rarity)
+        min_weights, max_weights, prices_per_kg = get_fish_species_arrays(rarity)
+        picks = _rng.integers(0, len(species), rarity_count)
+        low = min_weights[picks]
+        weights = np.round(low + (max_weights[picks] - low) * _rng.random(rarity_count), 2)
+        prices = (weights * prices_per_kg[picks]).astype(np.int64)
+        for pick, weight, price in zip(picks.tolist(), weights.tolist(), prices.tolist()):
+            catches.append((rarity, species[pick], weight, price))
+    return catches
+
+
+def _draw_catches_python(count, success_rate, rare_bonus):
+    catches = []
+    for _ in range(count):
+        if random.random() > success_rate:
+            continue
+        rarity = determine_fish_rarity(rare_bonus)
+        if not game_data['fish_data'].get(rarity):
+            rarity = 'common'
+        entry = random.choice(get_fish_species(rarity))
+        weight = round(random.uniform(entry[1], entry[2]), 2)
+        catches.append((rarity, entry, weight, int(weight * entry[3])))
+    return catches
+
+
+def resolve_casts(user_data, casts, user_id=None):
+    """一次結算多次拋竿並更新玩家資料。
+
+    魚餌和單次 /fish 一樣每次拋竿消耗一個，用完後剩下的拋竿只有魚竿加成；
+    每次拋竿的機率分布與單次 /fish 完全相同。有 user_id 時把每次拋竿記到事件紀錄。
+    """
+    log = event_log if user_id is not None else None
+    rod_id = ITEM_IDS.id_of(user_data.current_rod)
+    rod_info = game_data['items'].get(user_data.current_rod, game_data['items']['基本魚竿'])
+    bait_used = min(casts, user_data.item_count('魚餌'))
+    groups = [(casts - bait_used, rod_info['catch_bonus'], rod_info['rare_bonus'])]
+    if bait_used > 0:
+        bait_info = game_data['items']['魚餌']
+        groups.append((bait_used, rod_info['catch_bonus'] * bait_info['catch_bonus'], rod_info['rare_bonus'] + bait_info['rare_bonus']))
+        user_data.add_item('魚餌', -bait_used)
+
+    summary = {'casts': casts, 'bait_used': bait_used, 'caught': 0, 'money': 0, 'rarities': {}, 'species': {}}
+    for group_index, (count, catch_bonus, rare_bonus) in enumerate(groups):
+        if count <= 0:
+            continue
+        bait = group_index == 1
+        draw = _draw_catches_numpy if np is not None and count >= CAST_NUMPY_MIN else _draw_catches_python
+        catches = draw(count, min(0.95, 0.7 * catch_bonus), rare_bonus)
+        if log is not None:
+            for _ in range(count - len(catches)):
+                log.record(EVENT_MISS, user_id, rod=rod_id, bait=bait)
+        for rarity, entry, weight, price in catches:
+            fish_name = entry[0]
+            if log is not None:
+                log.record(
+                    EVENT_CATCH, user_id, price=price, weight=weight, species=FISH_IDS.id_of(fish_name),
+                    rod=rod_id, rarity=RARITY_IDS.get(rarity, NO_RARITY), bait=bait
+                )
+            summary['caught'] += 1
+            summary['money'] += price
+            rarity_stats = summary['rarities'].setdefault(rarity, {'count': 0, 'money': 0})
+            rarity_stats['count'] += 1
+            rarity_stats['money'] += price
+            fish_stats = summary['species'].setdefault(fish_name, {'rarity': rarity, 'emoji': entry[4], 'count': 0, 'max_weight': 0.0})
+            fish_stats['count'] += 1
+            fish_stats['max_weight'] = max(fish_stats['max_weight'], weight)
+
+    user_data.money += summary['money']
+    user_data.total_catches += summary['caught']
+    for fish_name, fish_stats in summary['species'].items():
+        user_data.add_fish(fish_name, fish_stats['count'])
+    return summary
+
+
+def build_multi_cast_embed(summary):
+    best_rarity = None
+    for rarity in ('legendary', 'epic', 'rare', 'common', 'junk'):
+        if rarity in summary['rarities']:
+            best_rarity = rarity
+            break
+    embed = discord.Embed(
+        title=f"🎣 連續釣魚 x{summary['casts']}",
+        color=RARITY_COLORS.get(best_rarity, 0xff0000)
+    )
+    embed.add_field(
+        name="結果",
+        value=f"成功 {summary['caught']} 次，失敗 {summary['casts'] - summary['caught']} 次",
+        inline=False
+    )
+    if summary['bait_used']:
+        embed.add_field(name="使用魚餌", value=f"{summary['bait_used']} 個", inline=True)
+    if summary['rarities']:
+        rarity_text = ""
+        for rarity, stats in summary['rarities'].items():
+            rarity_text += f"{RARITY_EMOJIS.get(rarity, '❓')} {rarity}: {stats['count']} 條 (💰 {stats['money']})\n"
+        embed.add_field(name="稀有度統計", value=rarity_text, inline=False)
+        fish_text = ""
+        for fish_name, stats in sorted(summary['species'].items(), key=lambda item: item[0]):
+            fish_text += f"{RARITY_EMOJIS.get(stats['rarity'], '❓')} {fish_name} {stats['emoji']}: {stats['count']} 條，最重 {stats['max_weight']} kg\n"
+        embed.add_field(name="魚種統計", value=fish_text, inline=False)
+    embed.add_field(name="獲得金錢", value=f"💰 {summary['money']}", inline=True)
+    embed.add_field(name="目前金錢", value=f"💰 {summary['balance']}", inline=True)
+    return embed
+
+
+def build_cast_embed(result):
+    """單次 /fish 的結果 (finish_cast 的回傳值)。"""
+    if not result['success']:
+        embed = discord.Embed(title="💔 釣魚失敗", color=0xff0000)
+        embed.add_field(name="結果", value="什麼都沒釣到...", inline=False)
+        return embed
+    rarity = result['rarity']
+    embed = discord.Embed(title="🎉 釣魚成功!", color=RARITY_COLORS[rarity])
+    embed.add_field(name="魚類", value=f"{RARITY_EMOJIS[rarity]} {result['fish_name']} {result['emoji']}", inline=True)
+    embed.add_field(name="重量", value=f"{result['weight']} kg", inline=True)
+    embed.add_field(name="獲得金錢", value=f"💰 {result['price']}", inline=True)
+    embed.add_field(name="目前金錢", value=f"💰 {result['balance']}", inline=True)
+    return embed
+
+# --- 事件紀錄 (append-only 的二進位分段檔，供離線分析，見 analytics.py) ---
+# 每次拋竿、購買與重置各記一筆 32 位元組的事件。指令只把事件打包進記憶體緩衝區，
+# 由 event_flush_loop 定期在執行緒中寫入以 mmap 對應的分段檔。
+# 分段檔開頭 64 位元組是檔頭 (魔術字串、事件大小、已寫入的事件數)，事件數在資料寫完後才更新，
+# 程式中途結束時讀取端只會看到完整的事件。每個程序啟動時開新的分段檔，
+# 旁邊的 .names.json 記錄這個程序的魚種 / 道具 ID 對照。
+EVENT_LOG_ENABLED = os.environ.get('FISHING_EVENT_LOG', '1') == '1'
+EVENT_LOG_DIR = os.environ.get('FISHING_EVENT_LOG_DIR', 'events')
+EVENT_SEGMENT_EVENTS = int(os.environ.get('FISHING_EVENT_SEGMENT_EVENTS', 1 << 20))  # 每個分段檔的事件數 (32 MB)
+EVENT_FLUSH_INTERVAL = 1.0
+EVENT_BUFFER_MAX = 1 << 20  # 緩衝區超過這麼多位元組時提早寫入
+
+# 時間 (epoch 秒), 玩家 ID, 金錢變化, 重量, 魚種/道具 ID, 魚竿 ID, 事件種類, 稀有度, 是否用魚餌, 保留
+EVENT_STRUCT = struct.Struct('<dQifHHBBBx')
+EVENT_HEADER = struct.Struct('<8sIIQ')
+EVENT_HEADER_SIZE = 64
+EVENT_MAGIC = b'FISHEVT1'
+EVENT_CATCH, EVENT_MISS, EVENT_BUY, EVENT_RESET = 1, 2, 3, 4
+NO_RARITY = 255
+RARITY_IDS = {rarity: index for index, rarity in enumerate(KNOWN_RARITIES)}
+
+
+def event_user_key(user_id):
+    """Discord 的使用者 ID 本來就是 64 位元整數；其他格式的 ID 以雜湊代替。"""
+    user_id = str(user_id)
+    if user_id.isdigit() and len(user_id) < 20:
+        return int(user_id)
+    return zlib.crc32(user_id.encode('utf-8'))
+
+
+class EventLog:
+    def __init__(self, directory, prefix, segment_events=EVENT_SEGMENT_EVENTS):
+        self.directory = directory
+        self.prefix = prefix
+        self.segment_events = segment_events
+        self._buffer = bytearray()
+        self._flush_lock = asyncio.Lock()
+        self._flush_scheduled = False
+        self._segment = None   # (檔案, mmap, 路徑)
+        self._count = 0
+        self._names_written = None
+        self.events = 0
+        os.makedirs(directory, exist_ok=True)
+        existing = [name for name in os.listdir(directory) if name.startswith(prefix + '-') and name.endswith('.evt')]
+        self._next_index = 1 + max((int(name[len(prefix) + 1:-4]) for name in existing), default=-1)
+
+    def record(self, kind, user_id, price=0, weight=0.0, species=0, rod=0, rarity=NO_RARITY, bait=False):
+        self._buffer += EVENT_STRUCT.pack(time.time(), event_user_key(user_id), price, weight, species, rod, kind, rarity, bait)
+        self.events += 1
+        if len(self._buffer) >= EVENT_BUFFER_MAX and not self._flush_scheduled:
+            self._flush_scheduled = True
+            asyncio.get_running_loop().create_task(self.flush())
+
+    async def flush(self):
+        async with self._flush_lock:
+            self._flush_scheduled = False
+            if not self._buffer:
+                return
+            data, self._buffer = self._buffer, bytearray()
+            await asyncio.to_thread(self.write, bytes(data), (tuple(FISH_IDS.names), tuple(ITEM_IDS.names)))
+
+    def flush_sync(self):
+        data, self._buffer = self._buffer, bytearray()
+        if data:
+            self.write(bytes(data), (tuple(FISH_IDS.names), tuple(ITEM_IDS.names)))
+
+    def _open_segment(self):
+        self._close_segment()
+        path = os.path.join(self.directory, f'{self.prefix}-{self._next_index:06d}.evt')
+        self._next_index += 1
+        file = open(path, 'w+b')
+        file.truncate(EVENT_HEADER_SIZE + self.segment_events * EVENT_STRUCT.size)
+        mapping = mmap.mmap(file.fileno(), 0)
+        EVENT_HEADER.pack_into(mapping, 0, EVENT_MAGIC, EVENT_STRUCT.size, 0, 0)
+        self._segment = (file, mapping, path)
+        self._count = 0
+        self._names_written = None
+
+    def _close_segment(self):
+        if self._segment is not None:
+            file, mapping, _ = self._segment
+            mapping.flush()
+            mapping.close()
+            file.close()
+            self._segment = None
+
+    def write(self, data, names):
+        """寫入打包好的事件 (在執行緒中執行)。names 為 (魚種名稱, 道具名稱)，ID 即為索引。"""
+        offset = 0
+        while offset < len(data):
+            if self._segment is None or self._count == self.segment_events:
+                self._open_segment()
+            _, mapping, path = self._segment
+            if self._names_written != names:
+                names_path = path[:-4] + '.names.json'
+                with open(names_path + '.tmp', 'w', encoding='utf-8') as output:
+                    json.dump({'fish': names[0], 'items': names[1], 'rarities': KNOWN_RARITIES}, output, ensure_ascii=False)
+                os.replace(names_path + '.tmp', names_path)
+                self._names_written = names
+            take = min(len(data) - offset, (self.segment_events - self._count) * EVENT_STRUCT.size)
+            start = EVENT_HEADER_SIZE + self._count * EVENT_STRUCT.size
+            mapping[start:start + take] = data[offset:offset + take]
+            self._count += take // EVENT_STRUCT.size
+            offset += take
+            # 資料寫完才更新事件數
+            EVENT_HEADER.pack_into(mapping, 0, EVENT_MAGIC, EVENT_STRUCT.size, 0, self._count)
+        self._segment[1].flush()
+
+    def close(self):
+        self.flush_sync()
+        self._close_segment()
+
+
+event_log = EventLog(EVENT_LOG_DIR, 'events' if WORKER_ID is None else f'events-w{WORKER_ID}') if EVENT_LOG_ENABLED else None
+
+
+@tasks.loop(seconds=EVENT_FLUSH_INTERVAL)
+async def event_flush_loop():
+    await event_log.flush()
+
+# --- 遊戲引擎 (不依賴 Discord) ---
+# 指令處理函數只負責 Discord 的回應與嵌入訊息，遊戲規則都在這裡，
+# 因此可以在沒有 Discord 連線的情況下直接呼叫 (見 benchmark.py)。
+# 這些函數都是同步的，中間沒有 await；需要和其他指令互斥時由呼叫端持有 user_locks。
+CAST_DELAY = float(os.environ.get('FISHING_CAST_DELAY', 2.0))  # 單次 /fish 拋竿到收竿的等待秒數 (見 CastScheduler)
+
+
+def has_rod(user_data):
+    return user_data.item_count(user_data.current_rod) > 0
+
+
+def start_cast(user_id):
+    """拋竿：消耗魚餌並決定這次的機率。沒有魚竿時回傳 None。"""
+    user_data = get_user_data(user_id)
+    if not has_rod(user_data):
+        return None
+    bait_used = user_data.item_count('魚餌') > 0
+    catch_bonus, rare_bonus = calculate_catch_probability(user_data)
+    mark_dirty(user_id)
+    return {
+        'rod': user_data.current_rod,
+        'bait_used': bait_used,
+        'bait_left': user_data.item_count('魚餌'),
+        'success_rate': min(0.95, 0.7 * catch_bonus),
+        'rare_bonus': rare_bonus
+    }
+
+
+def finish_cast(user_id, cast):
+    """收竿：抽出結果，記到玩家「目前」的紀錄上 (拋竿後資料可能已被 /load 或 /new_game 換掉)。"""
+    catches = _draw_catches_python(1, cast['success_rate'], cast['rare_bonus'])
+    return apply_cast_result(user_id, cast, catches[0] if catches else None)
+
+
+def finish_casts(entries):
+    """批次收竿：entries 為 [(user_id, cast), ...]，回傳與 entries 對應的結果。
+
+    機率相同的拋竿一起抽樣 (同 /fish 連續拋竿，見 _draw_catches_numpy)：每次拋竿彼此獨立且機率相同，
+    把抽到的漁獲隨機分給其中幾次拋竿，和逐次抽樣的分布完全一樣。
+    """
+    groups = {}
+    for index, (_, cast) in enumerate(entries):
+        groups.setdefault((cast['success_rate'], cast['rare_bonus']), []).append(index)
+    catches = [None] * len(entries)
+    for (success_rate, rare_bonus), indices in groups.items():
+        draw = _draw_catches_numpy if np is not None and len(indices) >= CAST_NUMPY_MIN else _draw_catches_python
+        drawn = draw(len(indices), success_rate, rare_bonus)
+        # random.sample 回傳的順序也是隨機的，依序配對即可
+        for index, catch in zip(random.sample(indices, len(drawn)), drawn):
+            catches[index] = catch
+    return [apply_cast_result(user_id, cast, catch) for (user_id, cast), catch in zip(entries, catches)]
+
+
+def apply_cast_result(user_id, cast, catch):
+    """把一次拋竿抽到的 (稀有度, 魚種資料, 重量, 售價) 記到玩家身上；catch 為 None 表示沒釣到。"""
+    if catch is None:
+        if event_log is not None:
+            event_log.record(EVENT_MISS, user_id, rod=ITEM_IDS.id_of(cast['rod']), bait=cast['bait_used'])
+        return {'success': False}
+
+    rarity, (fish_name, _, _, _, emoji), weight, price = catch
+    user_data = get_user_data(user_id)
+    user_data.money += price
+    user_data.total_catches += 1
+    user_data.add_fish(fish_name)
+    mark_dirty(user_id)
+    if event_log is not None:
+        event_log.record(
+            EVENT_CATCH, user_id, price=price, weight=weight, species=FISH_IDS.id_of(fish_name),
+            rod=ITEM_IDS.id_of(cast['rod']), rarity=RARITY_IDS.get(rarity, NO_RARITY), bait=cast['bait_used']
+        )
+
+    return {
+        'success': True,
+        'rarity': rarity,
+        'fish_name': fish_name,
+        'emoji': emoji,
+        'weight': weight,
+        'price': price,
+        'balance': user_data.money
+    }
+
+
+def fish_many(user_id, casts):
+    """連續拋竿，回傳 resolve_casts 的統計 (加上 'balance')。沒有魚竿時回傳 None。"""
+    user_data = get_user_data(user_id)
+    if not has_rod(user_data):
+        return None
+    summary = resolve_casts(user_data, casts, user_id)
+    mark_dirty(user_id)
+    summary['balance'] = user_data.money
+    return summary
+
+
+def buy_item(user_id, item_name):
+    """購買商店物品。回傳 {'status': 'not_found' | 'insufficient' | 'ok', ...}。"""
+    # 名稱比對不分大小寫、全形半形，並忽略空白，也接受只符合一個道具的部分名稱；基本魚竿不在商店索引裡
+    found_item_key = _shop_index.resolve(item_name)
+    if found_item_key is None:
+        return {'status': 'not_found'}
+
+    user_data = get_user_data(user_id)
+    price = game_data['items'][found_item_key]['price']
+    if user_data.money < price:
+        return {'status': 'insufficient', 'item': found_item_key, 'price': price, 'balance': user_data.money}
+
+    user_data.money -= price
+    user_data.add_item(found_item_key)
+    mark_dirty(user_id)
+    if event_log is not None:
+        event_log.record(EVENT_BUY, user_id, price=-price, species=ITEM_IDS.id_of(found_item_key), rod=ITEM_IDS.id_of(user_data.current_rod))
+    return {'status': 'ok', 'item': found_item_key, 'price': price, 'balance': user_data.money}
+
+
+def switch_rod(user_id, rod_name):
+    """切換魚竿，回傳找到的魚竿名稱；背包裡沒有這個魚竿時回傳 None。"""
+    user_data = get_user_data(user_id)
+
+    found_rod = _rod_index.resolve(rod_name, owned=lambda name: user_data.item_count(name) > 0)
+    if found_rod is None:
+        # 目錄裡沒有的魚竿 (舊存檔) 只能逐一比對背包
+        normalized_input_name = normalize_item_name(rod_name)
+        found_rod = next(
+            (name for name in user_data.item_dict() if '魚竿' in name and normalize_item_name(name) == normalized_input_name),
+            None
+        )
+
+    # 檢查用戶背包中是否有這個魚竿
+    if found_rod is None or user_data.item_count(found_rod) <= 0:
+        return None
+    user_data.current_rod = found_rod
+    mark_dirty(user_id)
+    return found_rod
+
+
+def view_bag(user_id):
+    """背包內容：金錢、道具，以及依名稱排序的 (稀有度, 魚名, 數量, emoji)。"""
+    user_data = get_user_data(user_id)
+    fish = []
+    for fish_name, count in sorted(user_data.fish_dict().items(), key=lambda item: item[0]):
+        fish_rarity, fish_emoji, _ = lookup_fish(fish_name)
+        fish.append((fish_rarity, fish_name, count, fish_emoji))
+    return {
+        'money': user_data.money,
+        'current_rod': user_data.current_rod,
+        'total_catches': user_data.total_catches,
+        'items': list(user_data.item_dict().items()),
+        'fish': fish
+    }
+
+
+def reset_user(user_id):
+    user_id = str(user_id)
+    game_data['users'][user_id] = new_user_record()
+    mark_dirty(user_id)
+    if event_log is not None:
+        event_log.record(EVENT_RESET, user_id)
+    return game_data['users'][user_id]
+
+
+def export_user(user_id):
+    """匯出單一玩家的 /save 檔內容 (JSON 字串)。"""
+    user_id = str(user_id)
+    # 為了只保存單一用戶的數據，我們建立一個新的字典
+    data_to_save_for_user = {user_id: get_user_data(user_id).to_dict()}
+    return json.dumps(data_to_save_for_user, indent=4, ensure_ascii=False)
+
+
+def import_user(user_id, loaded_data):
+    """從 /save 檔的內容恢復玩家資料；檔案裡沒有這位玩家時回傳 None。"""
+    user_id = str(user_id)
+    if user_id not in loaded_data:
+        return None
+    game_data['users'][user_id] = UserRecord.from_dict(loaded_data[user_id])
+    mark_dirty(user_id)
+    return game_data['users'][user_id]
+
+# --- 全體玩家批次匯出 / 匯入 (管理員) ---
+# 格式為 NDJSON：每行一位玩家 {"user_id": ..., "money": ..., ...}，可選擇 gzip 壓縮。
+# 匯出分塊序列化、逐塊交給呼叫端，不會組出整份資料的字串；匯入逐行驗證，分批套用並寫回資料庫。
+BULK_CHUNK_SIZE = 5000                 # 每塊序列化的玩家數
+BULK_IMPORT_BATCH_SIZE = 5000          # 每批套用的玩家數
+BULK_LEADERBOARD_REBUILD_AFTER = 50000 # 匯入超過這麼多位玩家時，改成最後一次重建排行榜
+BULK_MAX_REPORTED_ERRORS = 20
+BULK_IMPORT_READ_SIZE = 64 * 1024      # 串流匯入時每次讀取的位元組數
+EXPORT_DIR = os.environ.get('FISHING_EXPORT_DIR', 'exports')
+GZIP_MAGIC = b'\x1f\x8b'
+COUNT_MAX = 2 ** 31 - 1                # UserRecord 的數量陣列是 32 位元整數
+
+
+def _ndjson_line(user_id, record):
+    data = {'user_id': user_id, **record.to_dict()}
+    if orjson is not None:
+        return orjson.dumps(data) + b'\n'
+    return (json.dumps(data, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8')
+
+
+def _parse_json_line(line):
+    if orjson is not None:
+        return orjson.loads(line)
+    return json.loads(line)
+
+
+async def iter_export_chunks(compress=False, chunk_size=BULK_CHUNK_SIZE):
+    """逐塊產生所有玩家的 NDJSON 位元組 (可選 gzip)。每塊之間讓出事件迴圈，指令照常處理。"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    lines = []
+
+    async def finish_chunk():
+        chunk = b''.join(lines)
+        lines.clear()
+        if compressor is not None:
+            # zlib 壓縮時會釋放 GIL，放到執行緒裡不會卡住事件迴圈
+            chunk = await asyncio.to_thread(compressor.compress, chunk)
+        await asyncio.sleep(0)
+        return chunk
+
+    # 包含只在資料庫裡的冷玩家 (見 UserCache.iter_all_async)
+    async for user_id, record in game_data['users'].iter_all_async():
+        lines.append(_ndjson_line(user_id, record))
+        if len(lines) >= chunk_size:
+            chunk = await finish_chunk()
+            if chunk:
+                yield chunk
+    chunk = await finish_chunk()
+    if chunk:
+        yield chunk
+    if compressor is not None:
+        yield compressor.flush()
+
+
+def validate_user_payload(data):
+    """檢查一行匯入資料的格式；正確時回傳 None，否則回傳錯誤說明。"""
+    if not isinstance(data, dict):
+        return '不是 JSON 物件'
+    user_id = data.get('user_id')
+    if isinstance(user_id, bool) or not isinstance(user_id, (str, int)) or str(user_id) == '':
+        return 'user_id 缺少或格式錯誤'
+    for field in ('money', 'total_catches'):
+        value = data.get(field)
+        if isinstance(value, bool) or not isinstance(value, int) or value < 0:
+            return f'{field} 必須是非負整數'
+    if not isinstance(data.get('current_rod'), str):
+        return 'current_rod 必須是字串'
+    for field in ('items', 'fish_caught'):
+        counts = data.get(field)
+        if not isinstance(counts, dict) or not all(
+            isinstance(count, int) and not isinstance(count, bool) and 0 <= count <= COUNT_MAX
+            for count in counts.values()
+        ):
+            return f'{field} 必須是「名稱: 非負整數」的物件'
+    return None
+
+
+async def iter_ndjson_lines(chunks):
+    """把位元組區塊切成一行一行；開頭是 gzip 標記時自動解壓縮。"""
+    decompressor = None
+    pending = b''
+    first = True
+    async for chunk in chunks:
+        if first:
+            first = False
+            if chunk[:2] == GZIP_MAGIC:
+                decompressor = zlib.decompressobj(31)
+        if decompressor is not None:
+            chunk = decompressor.decompress(chunk)
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line
+    if decompressor is not None:
+        pending += decompressor.flush()
+    for line in pending.split(b'\n'):
+        yield line
+
+
+def _import_user(user_id, data, update_boards):
+    game_data['users'][user_id] = UserRecord.from_dict(data)
+    if update_boards:
+        mark_dirty(user_id)
+    else:
+        # 和 mark_dirty 相同，只是排行榜留到匯入結束時一次重建
+        user_versions[user_id] = user_versions.get(user_id, 0) + 1
+        dirty_users.add(user_id)
+
+
+def _apply_import_batch(batch, update_boards):
+    """套用一批 (行號, 玩家資料)。正在執行指令的玩家 (持有或等待玩家鎖) 不在這裡換掉，
+    回傳這些玩家讓呼叫端在玩家鎖內套用，同 release_owned_users 略過使用中的玩家。"""
+    busy = []
+    for line_number, data in batch:
+        user_id = str(data.pop('user_id'))
+        if user_locks.is_held(user_id):
+            busy.append((line_number, user_id, data))
+        else:
+            _import_user(user_id, data, update_boards)
+    return busy
+
+
+async def import_ndjson(chunks, batch_size=BULK_IMPORT_BATCH_SIZE):
+    """匯入 iter_export_chunks 格式的資料 (chunks 為位元組的非同步迭代器)。
+
+    每行獨立驗證，錯誤的行會略過並記在報告裡；每批套用後立即寫回資料庫，
+    記憶體用量只和批次大小有關。回傳 {'imported', 'failed', 'errors': [(行號, 說明), ...]}。
+    """
+    report = {'imported': 0, 'failed': 0, 'errors': []}
+    batch = []
+    line_number = 0
+    update_boards = True
+
+    async def apply():
+        nonlocal update_boards
+        if update_boards and report['imported'] + len(batch) > BULK_LEADERBOARD_REBUILD_AFTER:
+            update_boards = False
+        busy = _apply_import_batch(batch, update_boards)
+        report['imported'] += len(batch) - len(busy)
+        batch.clear()
+        # 指令 (包括收竿結算) 會在鎖內修改它取得的紀錄：等它結束再換上，結果才不會寫到被換掉的舊紀錄，
+        # 也不會蓋掉匯入的資料。還沒到期的拋竿和 /load 之後一樣，結算在匯入後的紀錄上。
+        for line_number, user_id, data in busy:
+            try:
+                async with user_locks.hold(user_id):
+                    _import_user(user_id, data, update_boards)
+            except UserBusyError:
+                report['failed'] += 1
+                if len(report['errors']) < BULK_MAX_REPORTED_ERRORS:
+                    report['errors'].append((line_number, '玩家正由另一個工作程序處理中'))
+                continue
+            report['imported'] += 1
+        await flush_dirty_users()
+
+    async for line in iter_ndjson_lines(chunks):
+        line_number += 1
+        if not line.strip():
+            continue
+        try:
+            data = _parse_json_line(line)
+        except ValueError as e:
+            error = f'JSON 格式錯誤: {e}'
+        else:
+            error = validate_user_payload(data)
+        if error is not None:
+            report['failed'] += 1
+            if len(report['errors']) < BULK_MAX_REPORTED_ERRORS:
+                report['errors'].append((line_number, error))
+            continue
+        batch.append((line_number, data))
+        if len(batch) >= batch_size:
+            await apply()
+    if batch:
+        await apply()
+    if not update_boards:
+        await rebuild_leaderboards_async()
+    return report
+
+
+async def export_to_file(compress=True):
+    """把所有玩家匯出到 EXPORT_DIR 下的檔案，回傳檔案路徑。"""
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    filename = f"players-{datetime.now().strftime('%Y%m%d-%H%M%S')}.ndjson" + ('.gz' if compress else '')
+    path = os.path.join(EXPORT_DIR, filename)
+    with open(path, 'wb') as output:
+        async for chunk in iter_export_chunks(compress):
+            await asyncio.to_thread(output.write, chunk)
+    return path
+
+# --- 嵌入訊息 (快取) ---
+# 快取的 Embed 會被多個回應共用，取得後不可再修改。
+BAG_EMBED_CACHE_SIZE = int(os.environ.get('FISHING_BAG_CACHE_SIZE', 10000))
+_bag_embed_cache = OrderedDict()  # user_id -> ((版本號, 目錄版本, 顯示名稱), discord.Embed)
+
+
+def _build_game_embed():
+    embed = discord.Embed(title="🎣 釣魚遊戲指令", color=0x00ff00)
+    commands_text = """
+    `/fish [次數]` - 開始釣魚，可指定連續拋竿次數
+    `/fish_item <魚竿名稱>` - 切換釣魚道具（魚竿），直接輸入名稱
+    `/shop` - 查看商店
+    `/buy <物品名稱>` - 從商店購買物品
+    `/bag` - 查看背包、金錢和釣到的魚
+    `/leaderboard [排行依據]` - 查看金錢、釣魚次數或傳說魚排行榜
+    `/rank` - 查看你在各排行榜的名次
+    `/new_game` - 建立新遊戲（重置你的資料）
+    `/save` - 將你的遊戲進度匯出為 JSON 檔案，以便下載備份 (進度本身會自動保存)
+    `/load` - 上傳你的遊戲進度 JSON 檔案，繼續之前的進度
+    """
+    game_info_text = """
+    **釣魚系統：**
+    - 根據魚的稀有度和重量獲得金錢。
+    - 使用更好的魚竿可以提高釣魚成功率和稀有魚的機率。
+    - 魚餌是一次性消耗品，能提供額外加成。
+    **稀有度等級:**
+    🟢 普通 (Common)
+    🔵 稀有 (Rare)
+    🟣 史詩 (Epic)
+    🟡 傳說 (Legendary)
+    ⚫ 垃圾 (Junk)
+    """
+    embed.add_field(name="指令列表", value=commands_text, inline=False)
+    embed.add_field(name="遊戲說明", value=game_info_text, inline=False)
+    return embed
+
+
+def _build_shop_embed():
+    embed = discord.Embed(title="🏪 釣魚用品商店", color=0x00ff00)
+
+    for item, info in game_data['items'].items():
+        if item == '基本魚竿':
+            continue
+        embed.add_field(
+            name=f"{item}",
+            value=f"價格: 💰{info['price']}\n描述: {info.get('description', '無')}",
+            inline=True
+        )
+
+    embed.set_footer(text="使用 /buy <物品名稱> 來購買道具。")
+    return embed
+
+
+_STATIC_EMBED_BUILDERS = {'game': _build_game_embed, 'shop': _build_shop_embed}
+
+
+def get_static_embed(name):
+    embed = _static_embeds.get(name)
+    if embed is None:
+        embed = _static_embeds[name] = _STATIC_EMBED_BUILDERS[name]()
+    return embed
+
+
+def build_bag_embed(user_id, display_name):
+    """/bag 的嵌入訊息，依玩家版本號快取；玩家資料或目錄沒變時直接重用。"""
+    user_id = str(user_id)
+    key = (user_versions.get(user_id, 0), catalog_version, display_name)
+    cached = _bag_embed_cache.get(user_id)
+    if cached is not None and cached[0] == key:
+        _bag_embed_cache.move_to_end(user_id)
+        return cached[1]
+
+    bag = view_bag(user_id)
+    embed = discord.Embed(title=f"🎒 {display_name} 的背包", color=0x9932cc)
+    embed.add_field(name="💰 金錢", value=str(bag['money']), inline=True)
+    embed.add_field(name="🎣 當前魚竿", value=bag['current_rod'], inline=True)
+    embed.add_field(name="📊 總釣魚次數", value=str(bag['total_catches']), inline=True)
+
+    items_text = ""
+    if bag['items']:
+        for item, count in bag['items']:
+            items_text += f"{item}: {count}\n"
+    else:
+        items_text = "無"
+    embed.add_field(name="🛠️ 道具", value=items_text, inline=False)
+
+    if bag['fish']:
+        fish_text = ""
+        for fish_rarity, fish, count, fish_emoji in bag['fish']:
+            fish_text += f"{RARITY_EMOJIS.get(fish_rarity, '❓')} {fish}: {count} 條 {fish_emoji}\n"
+        embed.add_field(name="🐟 釣到的魚", value=fish_text, inline=False)
+    else:
+        embed.add_field(name="🐟 釣到的魚", value="你還沒有釣到任何魚。", inline=False)
+
+    _bag_embed_cache[user_id] = (key, embed)
+    if len(_bag_embed_cache) > BAG_EMBED_CACHE_SIZE:
+        _bag_embed_cache.popitem(last=False)
+    return embed
+
+# --- 監控指標 (Prometheus 文字格式，見 /metrics) ---
+# 指標的寫入與 /metrics 的讀取都在同一個事件迴圈上，因此不需要任何鎖。
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ACTIVE_USER_WINDOW = 300  # 秒，「活躍玩家」的定義
+LOOP_LAG_INTERVAL = 0.5   # 秒，事件迴圈延遲的取樣間隔
+LOOP_LAG_PROBE = 0.01     # 秒，每次取樣用的短暫睡眠
+
+
+class Histogram:
+    __slots__ = ('counts', 'total', 'count')
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+command_calls = {}
+command_errors = {}
+command_latency = {}       # 指令名稱 -> Histogram
+discord_api_latency = {}   # (指令名稱, API 呼叫) -> Histogram
+loop_lag = Histogram()
+loop_lag_last = 0.0
+active_users = {}          # user_id -> 最後一次執行指令的時間 (monotonic)
+_current_command = contextvars.ContextVar('current_command', default='-')
+_current_trace = contextvars.ContextVar('current_trace', default=None)  # 慢指令追蹤開啟時的 CommandTrace
+
+
+def _observe(table, key, value):
+    histogram = table.get(key)
+    if histogram is None:
+        histogram = table[key] = Histogram()
+    histogram.observe(value)
+
+
+def instrument(name, func):
+    """包裝指令處理函數：記錄呼叫次數、錯誤次數、延遲與活躍玩家。"""
+    @functools.wraps(func)
+    async def wrapper(interaction, *args, **kwargs):
+        token = _current_command.set(name)
+        active_users[interaction.user.id] = time.monotonic()
+        command_calls[name] = command_calls.get(name, 0) + 1
+        trace_token = _current_trace.set(CommandTrace(name, interaction.user.id)) if slow_tracer.enabled else None
+        started = time.perf_counter()
+        try:
+            return await func(interaction, *args, **kwargs)
+        except Exception:
+            command_errors[name] = command_errors.get(name, 0) + 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            _observe(command_latency, name, elapsed)
+            if trace_token is not None:
+                trace = _current_trace.get()
+                _current_trace.reset(trace_token)
+                slow_tracer.finish(trace, elapsed)
+            _current_command.reset(token)
+            if 'first_command' not in startup_marks:
+                mark_startup('first_command')
+                print(f"第一個指令 ({name}) 已完成，啟動分析：\n{format_startup_report()}")
+    return wrapper
+
+
+def tracked_command(**kwargs):
+    """取代 @bot.tree.command，註冊斜線指令並加上監控。"""
+    def decorator(func):
+        return bot.tree.command(**kwargs)(instrument(kwargs['name'], func))
+    return decorator
+
+
+def _timed_api_call(call_name, method):
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await method(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - started
+            _observe(discord_api_latency, (_current_command.get(), call_name), elapsed)
+            trace = _current_trace.get()
+            if trace is not None:
+                trace.add('discord', call_name, elapsed)
+    return wrapper
+
+
+def instrument_discord_api():
+    """替 Discord 的回應 API 計時，依目前正在執行的指令分類。"""
+    targets = (
+        (discord.InteractionResponse, 'send_message'),
+        (discord.InteractionResponse, 'defer'),
+        (discord.Interaction, 'edit_original_response'),
+        (discord.Webhook, 'send'),  # interaction.followup
+    )
+    for cls, attr in targets:
+        method = getattr(cls, attr)
+        if not getattr(method, '_fishing_timed', False):
+            timed = _timed_api_call(attr if cls is not discord.Webhook else 'followup_send', method)
+            timed._fishing_timed = True
+            setattr(cls, attr, timed)
+
+
+instrument_discord_api()
+
+
+@tasks.loop(seconds=LOOP_LAG_INTERVAL)
+async def loop_lag_monitor():
+    """量測事件迴圈被阻塞的程度：計時器比預定時間晚醒來多久，就是延遲。"""
+    global loop_lag_last
+    started = time.perf_counter()
+    await asyncio.sleep(LOOP_LAG_PROBE)
+    lag = max(0.0, time.perf_counter() - started - LOOP_LAG_PROBE)
+    loop_lag_last = lag
+    loop_lag.observe(lag)
+    # 順便清掉超過時間窗的活躍玩家
+    cutoff = time.monotonic() - ACTIVE_USER_WINDOW
+    for user_id in [user_id for user_id, seen in active_users.items() if seen < cutoff]:
+        del active_users[user_id]
+
+
+def _render_histogram(lines, metric, labels, histogram):
+    cumulative = 0
+    for bound, count in zip(LATENCY_BUCKETS + (float('inf'),), list(histogram.counts)):
+        cumulative += count
+        le = '+Inf' if bound == float('inf') else repr(bound)
+        lines.append(f'{metric}_bucket{{{labels},le="{le}"}} {cumulative}')
+    lines.append(f'{metric}_sum{{{labels}}} {histogram.total}')
+    lines.append(f'{metric}_count{{{labels}}} {histogram.count}')
+
+
+def render_metrics():
+    lines = [
+        '# HELP fishing_command_calls_total 指令執行次數',
+        '# TYPE fishing_command_calls_total counter',
+    ]
+    for name, count in list(command_calls.items()):
+        lines.append(f'fishing_command_calls_total{{command="{name}"}} {count}')
+    lines += ['# HELP fishing_command_errors_total 指令發生例外的次數', '# TYPE fishing_command_errors_total counter']
+    for name, count in list(command_errors.items()):
+        lines.append(f'fishing_command_errors_total{{command="{name}"}} {count}')
+    lines += ['# HELP fishing_command_latency_seconds 指令處理時間 (含 Discord API 呼叫與等待)', '# TYPE fishing_command_latency_seconds histogram']
+    for name, histogram in list(command_latency.items()):
+        _render_histogram(lines, 'fishing_command_latency_seconds', f'command="{name}"', histogram)
+    lines += ['# HELP fishing_discord_api_latency_seconds Discord API 呼叫時間', '# TYPE fishing_discord_api_latency_seconds histogram']
+    for (name, call), histogram in list(discord_api_latency.items()):
+        _render_histogram(lines, 'fishing_discord_api_latency_seconds', f'command="{name}",call="{call}"', histogram)
+    lines += ['# HELP fishing_cast_lateness_seconds 收竿比預定時間晚多久', '# TYPE fishing_cast_lateness_seconds histogram']
+    _render_histogram(lines, 'fishing_cast_lateness_seconds', 'scheduler="cast"', cast_scheduler.lateness)
+    lines += ['# HELP fishing_event_loop_lag_seconds 事件迴圈延遲', '# TYPE fishing_event_loop_lag_seconds histogram']
+    _render_histogram(lines, 'fishing_event_loop_lag_seconds', 'loop="main"', loop_lag)
+    gateway_latency = bot.latency
+    lines += [
+        '# TYPE fishing_event_loop_lag_last_seconds gauge',
+        f'fishing_event_loop_lag_last_seconds {loop_lag_last}',
+        '# TYPE fishing_gateway_latency_seconds gauge',
+        f'fishing_gateway_latency_seconds {-1 if math.isnan(gateway_latency) else gateway_latency}',
+        '# TYPE fishing_active_users gauge',
+        f'fishing_active_users {len(active_users)}',
+        '# TYPE fishing_users_in_memory gauge',
+        f'fishing_users_in_memory {len(game_data["users"])}',
+        '# TYPE fishing_users_total gauge',
+        f'fishing_users_total {len(leaderboards["money"].scores)}',
+        '# HELP fishing_user_cache_hits_total 指令開始時玩家已在記憶體中',
+        '# TYPE fishing_user_cache_hits_total counter',
+        f'fishing_user_cache_hits_total {game_data["users"].hits}',
+        '# HELP fishing_user_cache_misses_total 需要從資料庫讀回玩家',
+        '# TYPE fishing_user_cache_misses_total counter',
+        f'fishing_user_cache_misses_total {game_data["users"].misses}',
+        '# TYPE fishing_user_cache_evictions_total counter',
+        f'fishing_user_cache_evictions_total {game_data["users"].evictions}',
+        '# HELP fishing_casts_pending 等待收竿的單次拋竿',
+        '# TYPE fishing_casts_pending gauge',
+        f'fishing_casts_pending {len(cast_scheduler)}',
+        '# TYPE fishing_casts_resolved_total counter',
+        f'fishing_casts_resolved_total {cast_scheduler.resolved}',
+        '# TYPE fishing_cast_batches_total counter',
+        f'fishing_cast_batches_total {cast_scheduler.batches}',
+        '# TYPE fishing_dirty_users gauge',
+        f'fishing_dirty_users {len(dirty_users)}',
+        '# TYPE fishing_pending_confirmations gauge',
+        f'fishing_pending_confirmations {len(pending_confirmations)}',
+        '# HELP fishing_outbound_requests_total 經由排程器送出的 Discord 請求',
+        '# TYPE fishing_outbound_requests_total counter',
+        f'fishing_outbound_requests_total {outbound.sent}',
+        '# HELP fishing_outbound_coalesced_total 被後來的編輯取代而沒有送出的編輯',
+        '# TYPE fishing_outbound_coalesced_total counter',
+        f'fishing_outbound_coalesced_total {outbound.coalesced}',
+        '# TYPE fishing_outbound_rate_limited_total counter',
+        f'fishing_outbound_rate_limited_total {outbound.rate_limited}',
+        '# TYPE fishing_outbound_queue gauge',
+        f'fishing_outbound_queue {len(outbound)}',
+        '# TYPE fishing_catalog_version gauge',
+        f'fishing_catalog_version {catalog_version}',
+        '# TYPE fishing_catalog_reloads_total counter',
+        f'fishing_catalog_reloads_total {catalog_reloads}',
+        '# HELP fishing_catalog_reload_seconds 最近一次重新載入目錄的耗時',
+        '# TYPE fishing_catalog_reload_seconds gauge',
+        f'fishing_catalog_reload_seconds {catalog_reload_seconds}',
+        '# TYPE fishing_tracing_enabled gauge',
+        f'fishing_tracing_enabled {int(slow_tracer.enabled)}',
+        '# TYPE fishing_profiler_running gauge',
+        f'fishing_profiler_running {int(profiler.running)}',
+        '# HELP fishing_loop_blocks_total 事件迴圈被同步程式阻塞超過門檻的次數 (阻塞偵測開啟期間)',
+        '# TYPE fishing_loop_blocks_total counter',
+        f'fishing_loop_blocks_total {loop_blocks.blocks}',
+        '# HELP fishing_startup_seconds 各啟動階段完成的時間 (從開始匯入起算)',
+        '# TYPE fishing_startup_seconds gauge',
+    ]
+    for phase, elapsed in list(startup_marks.items()):
+        lines.append(f'fishing_startup_seconds{{phase="{phase}"}} {elapsed}')
+    lines += ['# HELP fishing_slow_commands_total 超過門檻的指令次數 (慢指令追蹤開啟期間)', '# TYPE fishing_slow_commands_total counter']
+    for name, count in list(slow_tracer.counts.items()):
+        lines.append(f'fishing_slow_commands_total{{command="{name}"}} {count}')
+    return '\n'.join(lines) + '\n'
+
+# --- 效能分析 (管理員在執行中開關，關閉時不會多執行任何程式) ---
+# - SamplingProfiler：背景執行緒定期讀取事件迴圈執行緒的呼叫堆疊，輸出 collapsed stacks
+#   (每行「外層;...;內層 次數」，flamegraph.pl、inferno、speedscope 都能直接讀)
+# - SlowCommandTracer：替狀態查詢、遊戲邏輯、嵌入訊息與 Discord API 計時，指令超過門檻時印出各階段的耗時
+# - LoopBlockDetector：看門狗執行緒發現事件迴圈超過門檻沒有回應時，取樣當下正在執行的同步程式
+# 以 /profile、/trace 或 HTTP 管理員路由 (/admin/profile、/admin/trace) 開關；
+# 追蹤是在開啟時才把計時包裝換進模組，關閉時換回原本的函數。
+PROFILE_DIR = os.environ.get('FISHING_PROFILE_DIR', 'profiles')
+PROFILE_INTERVAL = float(os.environ.get('FISHING_PROFILE_INTERVAL', 0.005))  # 秒，取樣間隔
+PROFILE_MAX_SECONDS = 600
+PROFILE_TOP_FUNCTIONS = 10
+TRACE_ON_START = os.environ.get('FISHING_TRACE', '0') == '1'                # 啟動時就開啟慢指令追蹤與阻塞偵測
+SLOW_COMMAND_MS = float(os.environ.get('FISHING_SLOW_COMMAND_MS', 500))     # 指令 (不含等待) 超過這麼久就印出分析
+LOOP_BLOCK_MS = float(os.environ.get('FISHING_LOOP_BLOCK_MS', 100))         # 事件迴圈被阻塞超過這麼久就印出堆疊
+TRACE_HISTORY = 20  # 保留最近幾筆慢指令與阻塞紀錄
+IDLE_STACK = '(idle)'
+PHASE_TITLES = {
+    'state': '狀態查詢',
+    'game': '遊戲邏輯',
+    'embed': '嵌入訊息',
+    'discord': 'Discord API',
+    'wait': '等待',
+}
+
+
+def stack_key(frame):
+    """由外而內的 code 物件 tuple；事件迴圈在 selector 裡等待時回傳 IDLE_STACK。
+
+    取樣時只收集 code 物件，輸出時才格式化成字串，取樣本身的成本與堆疊深度成正比而且很小。
+    """
+    codes = []
+    while frame is not None:
+        codes.append(frame.f_code)
+        frame = frame.f_back
+    if codes and os.path.basename(codes[0].co_filename) == 'selectors.py':
+        return IDLE_STACK
+    codes.reverse()
+    return tuple(codes)
+
+
+def format_code(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def collapse_stack(key):
+    return key if isinstance(key, str) else ';'.join(map(format_code, key))
+
+
+def summarize_samples(samples, limit=PROFILE_TOP_FUNCTIONS):
+    """依最內層函數 (self time) 彙總取樣，回傳總取樣數、閒置取樣數與最耗時的函數。"""
+    total = sum(samples.values())
+    idle = samples.get(IDLE_STACK, 0)
+    leaves = {}
+    for key, count in samples.items():
+        if key != IDLE_STACK and key:
+            leaf = format_code(key[-1])
+            leaves[leaf] = leaves.get(leaf, 0) + count
+    top = heapq.nlargest(limit, leaves.items(), key=lambda item: item[1])
+    return {'samples': total, 'idle': idle, 'top': top}
+
+
+def collapsed_lines(samples):
+    """collapsed stacks 格式的各行，取樣次數多的在前。"""
+    for key, count in sorted(samples.items(), key=lambda item: -item[1]):
+        yield f"{collapse_stack(key)} {count}\n"
+
+
+def write_collapsed(samples, path):
+    with open(path, 'w', encoding='utf-8') as target:
+        target.writelines(collapsed_lines(samples))
+
+
+class SamplingProfiler:
+    """在背景執行緒以 sys._current_frames() 取樣事件迴圈執行緒的堆疊；事件迴圈本身不做任何額外的事。
+
+    取樣執行緒要拿到 GIL 才能讀堆疊，預設的 GIL 切換間隔 (5 ms) 下幾乎只會在事件迴圈
+    進入系統呼叫 (select、寫檔) 時取樣到，結果會偏向 I/O；取樣期間把切換間隔調短來減少這個偏差。
+    """
+
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self.samples = {}  # stack_key -> 次數
+        self._thread = None
+        self._stop = threading.Event()
+        self._switch_interval = None
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self, thread_id=None):
+        """開始取樣 thread_id (預設為呼叫端所在的執行緒)。"""
+        if self._thread is not None:
+            raise RuntimeError('取樣已經在進行中')
+        self.samples = {}
+        self._stop.clear()
+        self._switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(min(self._switch_interval, self.interval / 25))
+        self._thread = threading.Thread(
+            target=self._run, args=(thread_id or threading.get_ident(),), name='fishing-profiler', daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        """停止取樣並回傳 {stack_key: 次數}。"""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+            sys.setswitchinterval(self._switch_interval)
+        return self.samples
+
+    def _run(self, thread_id):
+        samples = self.samples
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                break
+            key = stack_key(frame)
+            samples[key] = samples.get(key, 0) + 1
+            del frame
+
+
+profiler = SamplingProfiler()
+
+
+async def run_profile(seconds):
+    """取樣 seconds 秒 (事件迴圈照常處理指令)，回傳 {stack_key: 次數}。"""
+    trace = _current_trace.get()
+    if trace is not None:
+        # 取樣期間是刻意的等待，不應讓 /profile 本身被當成慢指令
+        trace.add('wait', 'profile_window', seconds)
+    profiler.start()
+    try:
+        await asyncio.sleep(seconds)
+    finally:
+        samples = profiler.stop()
+    return samples
+
+
+def save_profile(samples):
+    """把取樣結果寫成 PROFILE_DIR 下的 .folded 檔，回傳路徑。"""
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    worker = f'-w{WORKER_ID}' if WORKER_ID is not None else ''
+    path = os.path.join(PROFILE_DIR, f"profile-{datetime.now():%Y%m%d-%H%M%S}{worker}.folded")
+    write_collapsed(samples, path)
+    return path
+
+
+class CommandTrace:
+    """一次指令執行中各階段的耗時。巢狀的計時 (例如 fish_many 裡的 get_user_data) 只把內層以外的時間算給外層。"""
+    __slots__ = ('command', 'user_id', 'spans', 'closed', '_inner')
+
+    def __init__(self, command, user_id):
+        self.command = command
+        self.user_id = user_id
+        self.spans = []   # (階段, 名稱, 秒數)
+        self.closed = False
+        self._inner = []  # 進行中的巢狀計時：各層內部已經記錄的秒數
+
+    def enter(self):
+        self._inner.append(0.0)
+
+    def exit(self, phase, label, elapsed):
+        inner = self._inner.pop()
+        self.add(phase, label, elapsed - inner, nested=elapsed)
+
+    def add(self, phase, label, elapsed, nested=None):
+        if self.closed:
+            return  # 指令結束後才送出的訊息 (例如被取代的進度動畫)
+        if self._inner:
+            self._inner[-1] += elapsed if nested is None else nested
+        self.spans.append((phase, label, elapsed))
+
+    def breakdown(self):
+        """{階段: {名稱: [秒數, 次數]}}"""
+        phases = {}
+        for phase, label, elapsed in self.spans:
+            entry = phases.setdefault(phase, {}).setdefault(label, [0.0, 0])
+            entry[0] += elapsed
+            entry[1] += 1
+        return phases
+
+
+def _traced_call(phase, label, func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        trace = _current_trace.get()
+        if trace is None:
+            return func(*args, **kwargs)
+        trace.enter()
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            trace.exit(phase, label, time.perf_counter() - started)
+    return wrapper
+
+
+def _traced_await(phase, label, func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        trace = _current_trace.get()
+        started = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            if trace is not None:
+                trace.add(phase, label, time.perf_counter() - started)
+    return wrapper
+
+
+class _TracedContext:
+    """只計算進入 context manager 的時間 (例如取得玩家鎖)，不含 async with 區塊本身。"""
+    __slots__ = ('context', 'phase', 'label')
+
+    def __init__(self, context, phase, label):
+        self.context = context
+        self.phase = phase
+        self.label = label
+
+    async def __aenter__(self):
+        trace = _current_trace.get()
+        started = time.perf_counter()
+        result = await self.context.__aenter__()
+        if trace is not None:
+            trace.add(self.phase, self.label, time.perf_counter() - started)
+        return result
+
+    def __aexit__(self, *exc_info):
+        return self.context.__aexit__(*exc_info)
+
+
+def _traced_context(phase, label, func):
+    """玩家鎖的計時包含叢集租約與從資料庫讀回玩家，也就是「狀態查詢」的主要成本。"""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return _TracedContext(func(*args, **kwargs), phase, label)
+    return wrapper
+
+
+class SlowCommandTracer:
+    """開啟時把下列函數換成計時版本；每個指令結束時若扣除等待後超過門檻，就印出各階段耗時。"""
+
+    def __init__(self, threshold=SLOW_COMMAND_MS / 1000):
+        self.threshold = threshold
+        self.enabled = False
+        self.counts = {}  # 指令名稱 -> 慢指令次數
+        self.recent = deque(maxlen=TRACE_HISTORY)
+        self._patched = []
+
+    @staticmethod
+    def targets():
+        """(模組或物件, 名稱, 階段, 包裝方式)。指令處理函數在執行時才查找這些名稱，換掉就會生效。"""
+        module = sys.modules[__name__]
+        targets = [(module, 'get_user_data', 'state', _traced_call)]
+        for name in ('start_cast', 'finish_cast', 'fish_many', 'buy_item', 'switch_rod', 'view_bag',
+                     'reset_user', 'export_user', 'import_user', 'determine_fish_rarity', 'resolve_casts'):
+            targets.append((module, name, 'game', _traced_call))
+        for name in ('get_static_embed', 'build_bag_embed', 'build_multi_cast_embed'):
+            targets.append((module, name, 'embed', _traced_call))
+        targets += [
+            (user_locks, 'hold', 'state', _traced_context),
+            (pending_confirmations, 'wait', 'wait', _traced_await),
+        ]
+        return targets
+
+    def enable(self):
+        if self.enabled:
+            return
+        module = sys.modules[__name__]
+        for owner, name, phase, wrap in self.targets():
+            namespace = vars(owner)
+            # 物件的方法原本在類別上，實例的命名空間裡沒有這個名稱，還原時刪掉即可
+            self._patched.append((namespace, name, namespace.get(name)))
+            label = name if owner is module else f'{type(owner).__name__}.{name}'
+            setattr(owner, name, wrap(phase, label, getattr(owner, name)))
+        self.enabled = True
+
+    def disable(self):
+        if not self.enabled:
+            return
+        for namespace, name, previous in reversed(self._patched):
+            if previous is None:
+                del namespace[name]
+            else:
+                namespace[name] = previous
+        self._patched = []
+        self.enabled = False
+
+    def finish(self, trace, elapsed):
+        trace.closed = True
+        waited = sum(seconds for phase, _, seconds in trace.spans if phase == 'wait')
+        active = elapsed - waited
+        if active < self.threshold:
+            return
+        self.counts[trace.command] = self.counts.get(trace.command, 0) + 1
+        phases = trace.breakdown()
+        tracked = sum(entry[0] for phase, labels in phases.items() if phase != 'wait' for entry in labels.values())
+        record = {
+            'at': datetime.now().isoformat(timespec='seconds'),
+            'command': trace.command,
+            'user_id': str(trace.user_id),
+            'active_ms': round(active * 1000, 2),
+            'waited_ms': round(waited * 1000, 2),
+            'phases': {
+                phase: {label: [round(seconds * 1000, 3), count] for label, (seconds, count) in labels.items()}
+                for phase, labels in phases.items()
+            },
+            'other_ms': round(max(0.0, active - tracked) * 1000, 2),
+        }
+        self.recent.append(record)
+        print(format_slow_command(record))
+
+
+def format_slow_command(record):
+    lines = [f"🐢 慢指令 /{record['command']} (玩家 {record['user_id']})：{record['active_ms']:.1f} ms"
+             + (f"，另外等待 {record['waited_ms']:.1f} ms" if 'wait' in record['phases'] else '')]
+    for phase, title in PHASE_TITLES.items():
+        labels = record['phases'].get(phase)
+        if not labels:
+            continue
+        total = sum(ms for ms, _ in labels.values())
+        details = ', '.join(
+            f"{label} {ms:.2f} ms" + (f" x{count}" if count > 1 else '')
+            for label, (ms, count) in sorted(labels.items(), key=lambda item: -item[1][0])
+        )
+        lines.append(f"  {title} {total:.1f} ms：{details}")
+    lines.append(f"  其他 {record['other_ms']:.1f} ms：指令本身的程式與事件迴圈排隊")
+    return '\n'.join(lines)
+
+
+slow_tracer = SlowCommandTracer()
+
+
+class LoopBlockDetector:
+    """事件迴圈每隔 interval 執行一次心跳回呼；看門狗執行緒發現心跳遲到超過門檻時，
+    取樣事件迴圈執行緒的堆疊，等心跳恢復後回報阻塞多久、最常取樣到哪段程式。"""
+
+    def __init__(self, threshold=LOOP_BLOCK_MS / 1000):
+        self.threshold = threshold
+        self.blocks = 0
+        self.recent = deque(maxlen=TRACE_HISTORY)
+        self._thread = None
+        self._stop = None
+        self._handle = None
+        self._beat = 0.0
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def _interval(self):
+        return max(0.002, self.threshold / 4)
+
+    def start(self):
+        """開始偵測 (需在事件迴圈上呼叫)。已經在執行時只套用新的門檻。"""
+        if self._thread is not None:
+            return
+        loop = asyncio.get_running_loop()
+        self._beat = time.perf_counter()
+        self._handle = loop.call_later(self._interval(), self._heartbeat, loop)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._watch, args=(threading.get_ident(), self._stop), name='fishing-loop-watchdog', daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._handle.cancel()
+        self._thread.join()
+        self._thread = None
+
+    def _heartbeat(self, loop):
+        self._beat = time.perf_counter()
+        self._handle = loop.call_later(self._interval(), self._heartbeat, loop)
+
+    def _watch(self, thread_id, stop):
+        stacks = None  # 目前這次阻塞期間取樣到的堆疊
+        blocked_beat = None
+        while not stop.wait(self._interval()):
+            beat = self._beat
+            if stacks is not None and beat != blocked_beat:
+                # 心跳恢復：阻塞時間約為兩次心跳的間隔扣掉原本的排程間隔
+                self._report(beat - blocked_beat - self._interval(), stacks)
+                stacks = None
+            if time.perf_counter() - beat - self._interval() < self.threshold:
+                continue
+            if stacks is None:
+                stacks = {}
+                blocked_beat = beat
+            frame = sys._current_frames().get(thread_id)
+            if frame is None:
+                return
+            key = stack_key(frame)
+            del frame
+            stacks[key] = stacks.get(key, 0) + 1
+
+    def _report(self, duration, stacks):
+        self.blocks += 1
+        key = max(stacks, key=stacks.get) if stacks else ()
+        record = {
+            'at': datetime.now().isoformat(timespec='seconds'),
+            'blocked_ms': round(duration * 1000, 1),
+            'samples': sum(stacks.values()),
+            'stack': collapse_stack(key),
+        }
+        self.recent.append(record)
+        frames = '\n'.join(f"    {format_code(code)}" for code in key[-8:]) if not isinstance(key, str) else f"    {key}"
+        print(f"⚠️ 事件迴圈被阻塞了 {record['blocked_ms']:.0f} ms，當時執行中的程式 (最內層在最後)：\n{frames or '    (沒有取樣到)'}")
+
+
+loop_blocks = LoopBlockDetector()
+
+
+def set_tracing(enabled, slow_ms=None, block_ms=None):
+    """開關慢指令追蹤與事件迴圈阻塞偵測 (需在事件迴圈上呼叫)，回傳 tracing_status()。"""
+    if slow_ms is not None:
+        slow_tracer.threshold = slow_ms / 1000
+    if block_ms is not None:
+        loop_blocks.threshold = block_ms / 1000
+    if enabled:
+        slow_tracer.enable()
+        loop_blocks.start()
+    else:
+        slow_tracer.disable()
+        loop_blocks.stop()
+    return tracing_status()
+
+
+def tracing_status():
+    return {
+        'enabled': slow_tracer.enabled,
+        'slow_command_ms': slow_tracer.threshold * 1000,
+        'loop_block_ms': loop_blocks.threshold * 1000,
+        'profiling': profiler.running,
+        'slow_commands': dict(slow_tracer.counts),
+        'loop_blocks': loop_blocks.blocks,
+        'recent_slow_commands': list(slow_tracer.recent),
+        'recent_loop_blocks': list(loop_blocks.recent),
+    }
+
+# --- 對外請求排程 (速率限制與編輯合併) ---
+# 指令不直接呼叫 edit_original_response / followup.send，而是交給 outbound 排程：
+# - 同一則訊息還沒送出的編輯會合併成一次 (結果出來時「釣魚中...」還在排隊，就只送結果)
+# - 玩家等待中的結果優先於進度動畫
+# - 依全域與每個路由的額度主動排隊，不等到收到 429 才退避
+PRIORITY_RESULT = 0
+PRIORITY_PROGRESS = 1
+OUTBOUND_RATE = float(os.environ.get('FISHING_OUTBOUND_RATE', 50))  # 全域每秒請求數，0 表示不限制
+OUTBOUND_ROUTE_BURST = 5      # 每個互動 (webhook token) 的額度；回應帶有速率限制標頭時以標頭為準
+OUTBOUND_ROUTE_PERIOD = 2.0   # 秒
+OUTBOUND_CONCURRENCY = 32     # 同時進行中的請求數
+OUTBOUND_DRAIN_TIMEOUT = 5.0
+
+
+class RateLimited(Exception):
+    """傳送函數收到 429 時拋出，排程器會暫停該路由 (或全域) retry_after 秒後重送。"""
+
+    def __init__(self, retry_after, is_global=False):
+        super().__init__(retry_after)
+        self.retry_after = retry_after
+        self.is_global = is_global
+
+
+class RateBucket:
+    """令牌桶；收到 X-RateLimit-* 標頭時以伺服器回報的剩餘額度校正。"""
+    __slots__ = ('capacity', 'rate', 'tokens', 'updated', 'blocked_until')
+
+    def __init__(self, capacity, period, now):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = float(capacity)
+        self.updated = now
+        self.blocked_until = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now):
+        """還要等幾秒才有額度。"""
+        self._refill(now)
+        wait = self.blocked_until - now
+        if self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.rate)
+        return max(0.0, wait)
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def block(self, seconds, now):
+        self.blocked_until = max(self.blocked_until, now + seconds)
+
+    def is_idle(self, now):
+        return self.delay(now) == 0 and self.tokens >= self.capacity
+
+    def observe_headers(self, headers, now):
+        remaining = headers.get('X-RateLimit-Remaining')
+        reset_after = headers.get('X-RateLimit-Reset-After')
+        if remaining is None or reset_after is None:
+            return
+        self.tokens = min(self.tokens, float(remaining))
+        if int(remaining) == 0:
+            self.block(float(reset_after), now)
+
+
+class OutboundRequest:
+    __slots__ = ('kind', 'target', 'route', 'kwargs', 'priority', 'seq', 'command', 'trace', 'futures')
+
+    def __init__(self, kind, target, route, kwargs, priority, command, trace=None):
+        self.kind = kind
+        self.target = target
+        self.route = route
+        self.kwargs = kwargs
+        self.priority = priority
+        self.seq = 0
+        self.command = command
+        self.trace = trace
+        self.futures = []
+
+
+def _log_outbound_failure(future):
+    if not future.cancelled() and future.exception() is not None:
+        print(f"送出 Discord 訊息失敗: {future.exception()!r}")
+
+
+class OutboundScheduler:
+    """依優先順序與速率額度送出訊息的佇列。
+
+    send(kind, target, kwargs) 負責實際送出 ('edit' 或 'followup')，可以回傳回應標頭讓排程器校正額度，
+    收到 429 時拋出 RateLimited。同一個路由 (互動) 同一時間只有一個請求在進行，確保訊息順序。
+    """
+
+    def __init__(self, send, rate=OUTBOUND_RATE, route_burst=OUTBOUND_ROUTE_BURST,
+                 route_period=OUTBOUND_ROUTE_PERIOD, concurrency=OUTBOUND_CONCURRENCY):
+        self._send = send
+        self._rate = rate
+        self._global = None
+        self._route_burst = route_burst
+        self._route_period = route_period
+        self._concurrency = concurrency
+        self._routes = OrderedDict()  # 路由 -> RateBucket，依最後使用時間排序以便回收
+        self._pending = {}            # 訊息鍵 -> OutboundRequest (尚未送出)
+        self._queue = []              # (priority, seq, 訊息鍵) 的堆積；seq 對不上的是已合併的舊項目
+        self._in_flight = set()       # 正在送出的路由
+        self._blocked = {}            # 路由 -> 等該路由送完才能排入的堆積項目
+        self._seq = 0
+        self._wakeup = None
+        self._slots = None
+        self._worker = None
+        self.sent = 0
+        self.coalesced = 0
+        self.rate_limited = 0
+
+    def __len__(self):
+        return len(self._pending)
+
+    def edit(self, interaction, content=None, *, priority=PRIORITY_RESULT, **kwargs):
+        """排程 interaction.edit_original_response(...)；回傳送出後完成的 future。"""
+        if content is not None:
+            kwargs['content'] = content
+        return self._submit(('edit', interaction.id), 'edit', interaction, interaction.id, priority, kwargs)
+
+    def followup(self, interaction, content=None, *, priority=PRIORITY_RESULT, **kwargs):
+        """排程 interaction.followup.send(...)；追加訊息不會被合併。"""
+        if content is not None:
+            kwargs['content'] = content
+        self._seq += 1
+        return self._submit(('followup', self._seq), 'followup', interaction, interaction.id, priority, kwargs)
+
+    def _submit(self, key, kind, target, route, priority, kwargs):
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(_log_outbound_failure)
+        request = self._pending.get(key)
+        if request is None:
+            request = self._pending[key] = OutboundRequest(
+                kind, target, route, kwargs, priority, _current_command.get(), _current_trace.get()
+            )
+        else:
+            # 還沒送出的編輯被新的取代：只送合併後的最終狀態
+            request.kwargs = {**request.kwargs, **kwargs}
+            request.priority = min(request.priority, priority)
+            self.coalesced += 1
+        request.futures.append(future)
+        self._push(key, request)
+        return future
+
+    def _push(self, key, request):
+        self._seq += 1
+        request.seq = self._seq
+        self._requeue((request.priority, request.seq, key))
+
+    def _requeue(self, entry):
+        heapq.heappush(self._queue, entry)
+        self._wakeup.set()
+
+    def _ensure_worker(self):
+        if self._worker is None or self._worker.done():
+            self._wakeup = asyncio.Event()
+            self._slots = asyncio.Semaphore(self._concurrency)
+            if self._rate > 0:
+                self._global = RateBucket(self._rate, 1.0, time.monotonic())
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    def _route_bucket(self, route, now):
+        bucket = self._routes.get(route)
+        if bucket is None:
+            bucket = self._routes[route] = RateBucket(self._route_burst, self._route_period, now)
+            # 額度已經完全恢復的舊路由和新建的沒有差別，可以丟掉
+            while len(self._routes) > 1:
+                oldest_route, oldest = next(iter(self._routes.items()))
+                if oldest_route in self._in_flight or not oldest.is_idle(now):
+                    break
+                del self._routes[oldest_route]
+        else:
+            self._routes.move_to_end(route)
+        return bucket
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self._queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            entry = heapq.heappop(self._queue)
+            key = entry[2]
+            request = self._pending.get(key)
+            if request is None or request.seq != entry[1]:
+                continue
+            if request.route in self._in_flight:
+                self._blocked.setdefault(request.route, []).append(entry)
+                continue
+            now = time.monotonic()
+            bucket = self._route_bucket(request.route, now)
+            wait = bucket.delay(now)
+            if wait > 0:
+                # 只有這個路由沒有額度，其他訊息照常送出
+                loop.call_later(wait, self._requeue, entry)
+                continue
+            if self._global is not None:
+                wait = self._global.delay(now)
+                if wait > 0:
+                    heapq.heappush(self._queue, entry)
+                    await asyncio.sleep(wait)
+                    continue
+            await self._slots.acquire()
+            request = self._pending.pop(key)
+            now = time.monotonic()
+            bucket.take(now)
+            if self._global is not None:
+                self._global.take(now)
+            self._in_flight.add(request.route)
+            loop.create_task(self._deliver(key, request, bucket))
+
+    async def _deliver(self, key, request, bucket):
+        # 讓 Discord API 的計時記在發出請求的指令名下 (慢指令追蹤也一樣)
+        token = _current_command.set(request.command)
+        trace_token = _current_trace.set(request.trace)
+        try:
+            headers = await self._send(request.kind, request.target, request.kwargs)
+        except RateLimited as e:
+            self.rate_limited += 1
+            target_bucket = self._global if e.is_global and self._global is not None else bucket
+            target_bucket.block(e.retry_after, time.monotonic())
+            newer = self._pending.get(key)
+            if newer is None:
+                self._pending[key] = request
+                self._push(key, request)
+            else:
+                # 等待期間又有新的編輯：合併進去，新的內容優先
+                newer.kwargs = {**request.kwargs, **newer.kwargs}
+                newer.futures[:0] = request.futures
+        except Exception as e:
+            for future in request.futures:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            self.sent += 1
+            if headers:
+                bucket.observe_headers(headers, time.monotonic())
+            for future in request.futures:
+                if not future.done():
+                    future.set_result(None)
+        finally:
+            _current_trace.reset(trace_token)
+            _current_command.reset(token)
+            self._in_flight.discard(request.route)
+            for entry in self._blocked.pop(request.route, ()):
+                heapq.heappush(self._queue, entry)
+            self._slots.release()
+            self._wakeup.set()
 
-# 嘗試載入 python-dotenv，如果沒有安裝就跳過
-try:
-    from dotenv import load_dotenv
-    load_dotenv()
-except ImportError:
-    pass
+    async def drain(self, timeout):
+        """等待佇列清空 (關閉前使用)。"""
+        deadline = time.monotonic() + timeout
+        while (self._pending or self._in_flight) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
 
-# Flask 設定
-app = Flask(__name__)
 
-# Discord Bot 設定
-intents = discord.Intents.default()
-intents.message_content = True
-bot = commands.Bot(command_prefix='/', intents=intents)
+async def send_to_discord(kind, interaction, kwargs):
+    # discord.py 不會把回應標頭交給呼叫端，額度以預設的令牌桶估計，429 由 discord.py 自行重試
+    if kind == 'edit':
+        await interaction.edit_original_response(**kwargs)
+    else:
+        await interaction.followup.send(**kwargs)
 
-# 遊戲資料 (全局變數，現在只在記憶體中，不會自動從文件載入或儲存)
-# 每次機器人啟動時，都會重新初始化為這個狀態 (除非透過 /load 手動載入)
-game_data = {
-    'users': {}, # 這是會動態改變的部分，但會在重啟後清空 (除非手動載入)
-    'fish_data': {
-        'common': {
-            '小魚': {'weight_range': (0.1, 0.5), 'price_per_kg': 10, 'emoji': '🐠'},
-            '鯉魚': {'weight_range': (0.3, 1.2), 'price_per_kg': 15, 'emoji': '🐟'},
-            '草魚': {'weight_range': (0.5, 1.5), 'price_per_kg': 12, 'emoji': '🐡'}
-        },
-        'rare': {
-            '鯛魚': {'weight_range': (0.8, 2.0), 'price_per_kg': 30, 'emoji': '🐡'},
-            '鱸魚': {'weight_range': (1.0, 2.5), 'price_per_kg': 35, 'emoji': '🐟'},
-            '石斑魚': {'weight_range': (1.2, 3.0), 'price_per_kg': 40, 'emoji': '🦈'}
-        },
-        'epic': {
-            '鮭魚': {'weight_range': (2.0, 4.0), 'price_per_kg': 60, 'emoji': '🍣'},
-            '鮪魚': {'weight_range': (3.0, 6.0), 'price_per_kg': 80, 'emoji': '🐟'},
-            '旗魚': {'weight_range': (4.0, 8.0), 'price_per_kg': 100, 'emoji': '🗡️'}
-        },
-        'legendary': {
-            '龍魚': {'weight_range': (5.0, 10.0), 'price_per_kg': 200, 'emoji': '🐉'},
-            '鯊魚': {'weight_range': (8.0, 15.0), 'price_per_kg': 250, 'emoji': '🦈'},
-            '黃金魚': {'weight_range': (1.0, 3.0), 'price_per_kg': 500, 'emoji': '🌟'}
-        },
-        'junk': {
-            '破鞋': {'weight_range': (0.1, 0.5), 'price_per_kg': 1, 'emoji': '👟'}
-        }
-    },
-    'items': {
-        '基本魚竿': {'price': 0, 'catch_bonus': 1.0, 'rare_bonus': 0.0, 'description': '最初始的魚竿，沒有任何加成。'},
-        '中級魚竿': {'price': 500, 'catch_bonus': 1.2, 'rare_bonus': 0.1, 'description': '提高釣魚成功率和釣到稀有魚的機率。'},
-        '高級魚竿': {'price': 1500, 'catch_bonus': 1.5, 'rare_bonus': 0.2, 'description': '顯著提高釣魚成功率和釣到稀有魚的機率。'},
-        '傳說魚竿': {'price': 5000, 'catch_bonus': 2.0, 'rare_bonus': 0.3, 'description': '大幅提高釣魚成功率和釣到傳說魚的機率。'},
-        '魚餌': {'price': 50, 'catch_bonus': 1.1, 'rare_bonus': 0.05, 'description': '一次性消耗品，使用後會略微提高釣魚成功率和稀有度機率。'}
-    },
-    'rarity_rates': {
-        'common': 0.6,
-        'rare': 0.25,
-        'epic': 0.12,
-        'legendary': 0.03,
-        'junk': 0.1
-    }
-}
 
-# --- 輔助函數：資料相關 ---
-def get_user_data(user_id):
-    """獲取或創建用戶資料。資料僅在記憶體中維護。"""
-    user_id = str(user_id)
-    if user_id not in game_data['users']:
-        game_data['users'][user_id] = {
-            'money': 100,
-            'items': {'基本魚竿': 1},
-            'current_rod': '基本魚竿',
-            'fish_caught': {},
-            'total_catches': 0
-        }
-    return game_data['users'][user_id]
+outbound = OutboundScheduler(send_to_discord)
 
-# --- 遊戲邏輯函數 (不變) ---
-def calculate_catch_probability(user_data):
-    rod = user_data['current_rod']
-    rod_info = game_data['items'].get(rod, game_data['items']['基本魚竿'])
+# --- 收竿排程 (單次 /fish) ---
+# 單次 /fish 拋竿後不再讓處理函數睡 CAST_DELAY 秒：拋竿放進一個依到期時間排序的堆積，
+# 由單一計時器在到期時批次結算並排程結果編輯。同時有上萬次拋竿時也只有一個計時器，
+# 沒有上萬個停在 sleep 的協程 (以及它們各自留住的 Interaction 和嵌入訊息)。
+CAST_TICK = float(os.environ.get('FISHING_CAST_TICK', 0.05))  # 秒，計時器最短的觸發間隔 (結果最多晚這麼久)
+CAST_BATCH_MAX = 256   # 每次最多結算的拋竿數 (每次約 70 us)，超過時讓其他回呼先執行再繼續
 
-    catch_bonus = rod_info['catch_bonus']
-    rare_bonus = rod_info['rare_bonus']
 
-    if '魚餌' in user_data['items'] and user_data['items']['魚餌'] > 0:
-        bait_info = game_data['items']['魚餌']
-        catch_bonus *= bait_info['catch_bonus']
-        rare_bonus += bait_info['rare_bonus']
-        user_data['items']['魚餌'] -= 1
-        if user_data['items']['魚餌'] <= 0:
-            del user_data['items']['魚餌']
-        print(f"DEBUG: 使用魚餌，剩餘 {user_data['items'].get('魚餌', 0)} 個")
+class CastScheduler:
+    """到期時間的最小堆積加上一個 loop.call_at 計時器。
 
-    return catch_bonus, rare_bonus
+    schedule(delay, item) 之後約 delay 秒 (不會提早，最多晚 tick 秒加上事件迴圈延遲)，
+    item 會和同一段時間內到期的其他項目一起交給 resolve(batch)。resolve 是同步函數，在事件迴圈上執行。
+    """
 
-def determine_fish_rarity(rare_bonus):
-    rates = game_data['rarity_rates'].copy()
+    def __init__(self, resolve, tick=CAST_TICK, batch_max=CAST_BATCH_MAX):
+        self._resolve = resolve
+        self.tick = tick
+        self.batch_max = batch_max
+        self._heap = []  # (到期時間 (loop.time()), seq, item)
+        self._seq = 0
+        self._timer = None
+        self._timer_when = None
+        self._last_fire = float('-inf')
+        # 計時器回呼不繼承排程當下的 context (第一個 /fish 的指令名稱與慢指令追蹤)
+        self._context = contextvars.Context()
+        self.resolved = 0
+        self.batches = 0
+        self.lateness = Histogram()  # 實際結算時間比到期時間晚多久
 
-    total_boost = rare_bonus
-    if total_boost > 0:
-        boost_to_legendary = total_boost * 0.4
-        boost_to_epic = total_boost * 0.3
-        boost_to_rare = total_boost * 0.2
+    def __len__(self):
+        return len(self._heap)
 
-        rates['legendary'] = rates.get('legendary', 0) + boost_to_legendary
-        rates['epic'] = rates.get('epic', 0) + boost_to_epic
-        rates['rare'] = rates.get('rare', 0) + boost_to_rare
+    def schedule(self, delay, item):
+        loop = asyncio.get_running_loop()
+        self._seq += 1
+        heapq.heappush(self._heap, (loop.time() + delay, self._seq, item))
+        self._arm(loop)
 
-        deductible_amount = (boost_to_legendary + boost_to_epic + boost_to_rare) - (rates['common'] + rates['rare'] + rates['epic'] + rates['legendary'] - sum(game_data['rarity_rates'].values()))
-        if deductible_amount > 0:
-            deduct_from_common = min(rates.get('common', 0), deductible_amount * 0.7)
-            rates['common'] = rates.get('common', 0) - deduct_from_common
-            deductible_amount -= deduct_from_common
+    def _arm(self, loop):
+        if not self._heap:
+            return
+        when = max(self._heap[0][0], self._last_fire + self.tick)
+        if self._timer is not None:
+            if self._timer_when <= when:
+                return
+            self._timer.cancel()
+        self._timer_when = when
+        self._timer = loop.call_at(when, self._fire, loop, context=self._context)
 
-            deduct_from_junk = min(rates.get('junk', 0), deductible_amount)
-            rates['junk'] = rates.get('junk', 0) - deduct_from_junk
+    def _fire(self, loop):
+        self._timer = None
+        now = self._last_fire = loop.time()
+        batch = []
+        while self._heap and self._heap[0][0] <= now and len(batch) < self.batch_max:
+            due, _, item = heapq.heappop(self._heap)
+            self.lateness.observe(now - due)
+            batch.append(item)
+        self._run_batch(batch)
+        if self._heap and self._heap[0][0] <= now:
+            # 這次沒結算完：讓其他回呼先執行，避免一次阻塞事件迴圈太久
+            self._timer_when = now
+            self._timer = loop.call_soon(self._fire, loop, context=self._context)
+        else:
+            self._arm(loop)
 
-    for rarity in rates:
-        rates[rarity] = max(0, rates[rarity])
+    def _run_batch(self, batch):
+        if not batch:
+            return
+        self.batches += 1
+        self.resolved += len(batch)
+        try:
+            self._resolve(batch)
+        except Exception as e:
+            print(f"批次收竿時發生錯誤: {e!r}")
 
-    total_sum = sum(rates.values())
-    if total_sum != 0:
-        for rarity in rates:
-            rates[rarity] /= total_sum
-    else:
-        rates = {'common': 1.0}
+    def flush(self):
+        """不等到期，立刻結算所有等待中的項目 (關閉前使用，魚餌在拋竿時就已經扣掉了)。"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._heap:
+            batch = [heapq.heappop(self._heap)[2] for _ in range(min(self.batch_max, len(self._heap)))]
+            self._context.run(self._run_batch, batch)
 
-    rand = random.random()
-    cumulative = 0
 
-    for rarity, rate in rates.items():
-        cumulative += rate
-        if rand <= cumulative:
-            return rarity
+def resolve_due_casts(batch):
+    """結算一批到期的拋竿 (interaction, user_id, cast) 並排程結果編輯。
+
+    玩家沒有其他指令在執行、資料在記憶體中 (叢集模式下還要持有租約) 時直接在這裡結算；
+    否則交給一個先取得玩家鎖再收竿的工作，和指令本身收竿時的做法一樣。
+    """
+    token = _current_command.set('fish')
+    try:
+        ready, deferred = [], []
+        users = game_data['users']
+        for item in batch:
+            user_id = item[1]
+            if user_locks.is_held(user_id) or user_id not in users or (leases is not None and user_id not in owned_users):
+                deferred.append(item)
+            else:
+                ready.append(item)
+        if ready:
+            results = finish_casts([(user_id, cast) for _, user_id, cast in ready])
+            for (interaction, _, _), result in zip(ready, results):
+                outbound.edit(interaction, embed=build_cast_embed(result))
+        loop = asyncio.get_running_loop()
+        for item in deferred:
+            loop.create_task(_resolve_cast_locked(*item))
+    finally:
+        _current_command.reset(token)
+
 
-    return 'common'
+async def _resolve_cast_locked(interaction, user_id, cast):
+    try:
+        async with user_locks.hold(user_id):
+            result = finish_cast(user_id, cast)
+    except UserBusyError:
+        outbound.edit(interaction, content="⏳ 你的上一個指令還在處理中，請稍後再試。", embed=None)
+        return
+    outbound.edit(interaction, embed=build_cast_embed(result))
+
+
+cast_scheduler = CastScheduler(resolve_due_casts)
+
+# --- 待確認操作 (等待玩家在頻道中輸入確認文字) ---
+# 以 (玩家, 頻道) 為鍵登記，每則訊息只需查一次 dict，成本與同時等待中的確認數量無關；
+# 逾時用時間輪處理：每秒前進一格，只檢查到期的那一格。
+CONFIRM_TICK = 1.0
+CONFIRM_WHEEL_SLOTS = 128  # 可支援的最長逾時為 (slots - 2) 秒
+
+
+class PendingConfirmations:
+    def __init__(self, tick=CONFIRM_TICK, slots=CONFIRM_WHEEL_SLOTS):
+        self.tick = tick
+        self._pending = {}  # (user_id, channel_id) -> (future, slot)
+        self._wheel = [set() for _ in range(slots)]
+        self._cursor = 0
+
+    def __len__(self):
+        return len(self._pending)
+
+    def open(self, user_id, channel_id, timeout):
+        """登記一個等待中的確認，回傳之後會收到訊息內容 (或 asyncio.TimeoutError) 的 future。
+
+        同一位玩家在同一頻道重複開啟時，舊的確認視為取消 (收到 None)。
+        """
+        key = (user_id, channel_id)
+        self._resolve(key, None)
+        # 多等一格，確保不會比 timeout 早到期
+        ticks = min(math.ceil(timeout / self.tick) + 1, len(self._wheel) - 1)
+        slot = (self._cursor + ticks) % len(self._wheel)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = (future, slot)
+        self._wheel[slot].add(key)
+        return future
+
+    async def wait(self, user_id, channel_id, timeout):
+        return await self.open(user_id, channel_id, timeout)
+
+    def dispatch(self, user_id, channel_id, content):
+        """把訊息交給等待中的確認；沒有人在等時回傳 False。"""
+        return self._resolve((user_id, channel_id), content)
+
+    def _resolve(self, key, content):
+        entry = self._pending.pop(key, None)
+        if entry is None:
+            return False
+        future, slot = entry
+        self._wheel[slot].discard(key)
+        if not future.done():
+            future.set_result(content)
+        return True
+
+    def advance(self):
+        """時間輪前進一格，讓這一格的確認逾時。"""
+        self._cursor = (self._cursor + 1) % len(self._wheel)
+        expired, self._wheel[self._cursor] = self._wheel[self._cursor], set()
+        for key in expired:
+            future, _ = self._pending.pop(key)
+            if not future.done():
+                future.set_exception(asyncio.TimeoutError())
+
+
+pending_confirmations = PendingConfirmations()
+
+
+@tasks.loop(seconds=CONFIRM_TICK)
+async def confirmation_wheel():
+    pending_confirmations.advance()
 
 # --- Discord 機器人事件 ---
 @bot.event
 async def on_ready():
+    # 每次閘道重新連線 (RESUME 失敗後重新 IDENTIFY) 都會再觸發 on_ready，只有第一次需要處理
+    if not mark_startup('ready'):
+        print(f'{bot.user} 已重新連線。')
+        return
     print(f'{bot.user} 已連線!')
+    if await sync_command_tree() == 'failed':
+        # 之後的 on_ready 不會再進到這裡，失敗的同步交給背景工作重試，啟動流程照常完成
+        start_command_sync_retry()
+    print(f"啟動分析：\n{format_startup_report()}")
+
+
+@bot.listen('on_connect')
+async def on_gateway_connect():
+    mark_startup('gateway_connect')
+
+# --- 斜線指令同步 ---
+# tree.sync() 是有速率限制的全域 API 呼叫，而且會延後就緒。指令樹的內容 (名稱、說明、參數…)
+# 序列化後取雜湊，和上次同步成功時存在資料庫裡的雜湊相同就不再同步。
+COMMAND_SYNC = os.environ.get('FISHING_COMMAND_SYNC', 'auto')  # 'auto' | 'always' | 'never'
+COMMAND_TREE_HASH_KEY = 'command_tree_hash'
+COMMAND_SYNC_RETRY = 5.0        # 同步失敗後第一次重試前等待的秒數，之後每次加倍
+COMMAND_SYNC_RETRY_MAX = 600.0
+_command_sync_retry = None
+
+
+def command_tree_hash(application_id=None):
+    """全域指令樹的穩定雜湊。不同的應用程式 (換了 Token) 也視為不同。
+
+    Command.to_dict(tree) 是 discord.py 2.4 起的簽名 (見 requirements.txt)。
+    """
+    commands_payload = sorted((command.to_dict(bot.tree) for command in bot.tree.get_commands()), key=lambda c: c['name'])
+    payload = json.dumps({'application_id': application_id, 'commands': commands_payload}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+async def sync_command_tree():
+    """必要時同步斜線指令，回傳 'synced' / 'unchanged' / 'skipped' / 'failed'。"""
+    # 叢集模式下只由第 0 個工作程序同步，指令樹對所有分片都一樣
+    if COMMAND_SYNC == 'never' or WORKER_ID not in (None, 0):
+        return 'skipped'
+    digest = command_tree_hash(bot.application_id)
+    if COMMAND_SYNC != 'always' and storage.get_meta(COMMAND_TREE_HASH_KEY) == digest:
+        print("斜線指令沒有變更，略過同步。")
+        mark_startup('commands_synced')
+        return 'unchanged'
     try:
         synced_commands = await bot.tree.sync()
-        print(f"已同步 {len(synced_commands)} 個斜線指令。")
     except Exception as e:
         print(f"同步指令失敗: {e}")
+        return 'failed'
+    storage.set_meta(COMMAND_TREE_HASH_KEY, digest)
+    mark_startup('commands_synced')
+    print(f"已同步 {len(synced_commands)} 個斜線指令。")
+    return 'synced'
+
+
+async def retry_command_sync():
+    """以指數退避重試 sync_command_tree，直到不再失敗；回傳最後的結果。失敗時不會更新已同步的雜湊。"""
+    delay = COMMAND_SYNC_RETRY
+    while True:
+        print(f"{delay:.0f} 秒後重試同步斜線指令。")
+        await asyncio.sleep(delay)
+        result = await sync_command_tree()
+        if result != 'failed':
+            return result
+        delay = min(delay * 2, COMMAND_SYNC_RETRY_MAX)
+
+
+def start_command_sync_retry():
+    """開始背景重試 (已經在重試時沿用同一個工作)。"""
+    global _command_sync_retry
+    if _command_sync_retry is None or _command_sync_retry.done():
+        _command_sync_retry = asyncio.get_running_loop().create_task(retry_command_sync())
+    return _command_sync_retry
+
+
+@bot.listen('on_message')
+async def on_confirmation_message(message):
+    if message.author.bot:
+        return
+    pending_confirmations.dispatch(message.author.id, message.channel.id, message.content)
+
+@bot.tree.error
+async def on_app_command_error(interaction: discord.Interaction, error: app_commands.AppCommandError):
+    original = getattr(error, 'original', error)
+    if isinstance(error, app_commands.MissingPermissions):
+        await interaction.response.send_message("❌ 這個指令只有管理員可以使用。", ephemeral=True)
+        return
+    if not isinstance(original, UserBusyError):
+        # 其他錯誤交給預設處理 (記錄到 log)
+        await app_commands.CommandTree.on_error(bot.tree, interaction, error)
+        return
+    # 叢集模式下另一個工作程序正在處理這位玩家的指令
+    message = "⏳ 你的上一個指令還在處理中，請稍後再試。"
+    if interaction.response.is_done():
+        await interaction.followup.send(message, ephemeral=True)
+    else:
+        await interaction.response.send_message(message, ephemeral=True)
 
 # --- 斜線指令定義 ---
 
-@bot.tree.command(name='game', description='顯示所有可用的遊戲指令和遊戲說明。')
+@tracked_command(name='game', description='顯示所有可用的遊戲指令和遊戲說明。')
 async def game_command(interaction: discord.Interaction):
-    embed = discord.Embed(title="🎣 釣魚遊戲指令", color=0x00ff00)
-    commands_text = """
-    `/fish` - 開始釣魚
-    `/fish_item <魚竿名稱>` - 切換釣魚道具（魚竿），直接輸入名稱
-    `/shop` - 查看商店
-    `/buy <物品名稱>` - 從商店購買物品
-    `/bag` - 查看背包、金錢和釣到的魚
-    `/new_game` - 建立新遊戲（重置你的資料）
-    `/save` - 將你的遊戲進度保存為 JSON 檔案，以便下載 (此版本不自動保存到檔案)
-    `/load` - 上傳你的遊戲進度 JSON 檔案，繼續之前的進度
-    """
-    game_info_text = """
-    **釣魚系統：**
-    - 根據魚的稀有度和重量獲得金錢。
-    - 使用更好的魚竿可以提高釣魚成功率和稀有魚的機率。
-    - 魚餌是一次性消耗品，能提供額外加成。
-    **稀有度等級:**
-    🟢 普通 (Common)
-    🔵 稀有 (Rare)
-    🟣 史詩 (Epic)
-    🟡 傳說 (Legendary)
-    ⚫ 垃圾 (Junk)
-    """
-    embed.add_field(name="指令列表", value=commands_text, inline=False)
-    embed.add_field(name="遊戲說明", value=game_info_text, inline=False)
-    await interaction.response.send_message(embed=embed, ephemeral=True)
+    await interaction.response.send_message(embed=get_static_embed('game'), ephemeral=True)
 
-@bot.tree.command(name='new_game', description='開始一個新遊戲並重置你的進度。')
+@tracked_command(name='new_game', description='開始一個新遊戲並重置你的進度。')
 async def new_game_command(interaction: discord.Interaction):
     user_id = str(interaction.user.id)
-    user_data_before_reset = get_user_data(user_id)
 
     await interaction.response.defer(ephemeral=True)
 
+    async with user_locks.hold(user_id):
+        user_data_before_reset = get_user_data(user_id)
+
     embed = discord.Embed(
         title="⚠️ 建立新遊戲確認",
         description="這將會重置你的所有遊戲資料。**此操作無法復原！**",
         color=0xff6600
     )
     reset_info = f"""
-    💰 金錢: {user_data_before_reset['money']} → 100
-    🎣 道具數量: {sum(user_data_before_reset['items'].values())} 個 → 1 個（基本魚竿）
-    📊 總釣魚次數: {user_data_before_reset['total_catches']} 次 → 0
-    🐟 魚類收藏: {len(user_data_before_reset['fish_caught'])} 種 → 0
+    💰 金錢: {user_data_before_reset.money} → 100
+    🎣 道具數量: {user_data_before_reset.item_total()} 個 → 1 個（基本魚竿）
+    📊 總釣魚次數: {user_data_before_reset.total_catches} 次 → 0
+    🐟 魚類收藏: {user_data_before_reset.fish_species_count()} 種 → 0
 
     請輸入 `確認重置` 來建立新遊戲，輸入其他任何內容則取消。
     """
     embed.add_field(name="將會重置的資料概覽", value=reset_info, inline=False)
     embed.set_footer(text="你有 30 秒時間回應。")
 
-    await interaction.followup.send(embed=embed, ephemeral=True)
-
-    def check(m):
-        return m.author == interaction.user and m.channel == interaction.channel
+    await outbound.followup(interaction, embed=embed, ephemeral=True)
 
     try:
-        msg = await bot.wait_for('message', check=check, timeout=30.0)
-        user_input = msg.content.lower().strip()
+        content = await pending_confirmations.wait(interaction.user.id, interaction.channel_id, timeout=30.0)
+        user_input = (content or '').lower().strip()
 
         if user_input == '確認重置':
             # 重置玩家資料：直接在 memory 中覆蓋
-            game_data['users'][user_id] = {
-                'money': 100,
-                'items': {'基本魚竿': 1},
-                'current_rod': '基本魚竿',
-                'fish_caught': {},
-                'total_catches': 0
-            }
+            async with user_locks.hold(user_id):
+                reset_user(user_id)
 
             success_embed = discord.Embed(
                 title="🎉 新遊戲建立成功!",
@@ -235,14 +3630,14 @@ async def new_game_command(interaction: discord.Interaction):
             )
             success_embed.add_field(name="初始狀態", value="💰 金錢: 100\n🎣 道具: 基本魚竿 x1\n🐟 釣魚記錄: 0", inline=False)
             success_embed.add_field(name="開始遊戲", value="使用 `/fish` 開始你的釣魚冒險！\n使用 `/game` 查看所有指令。", inline=False)
-            await interaction.followup.send(embed=success_embed, ephemeral=False)
+            await outbound.followup(interaction, embed=success_embed, ephemeral=False)
         else:
             cancel_embed = discord.Embed(
                 title="❌ 已取消建立新遊戲",
                 description="你的遊戲資料保持不變。",
                 color=0x808080
             )
-            await interaction.followup.send(embed=cancel_embed, ephemeral=True)
+            await outbound.followup(interaction, embed=cancel_embed, ephemeral=True)
 
     except asyncio.TimeoutError:
         timeout_embed = discord.Embed(
@@ -250,94 +3645,64 @@ async def new_game_command(interaction: discord.Interaction):
             description="建立新遊戲已取消，你的資料保持不變。",
             color=0x808080
         )
-        await interaction.followup.send(embed=timeout_embed, ephemeral=True)
+        await outbound.followup(interaction, embed=timeout_embed, ephemeral=True)
     except Exception as e:
         error_embed = discord.Embed(
             title="發生錯誤",
             description=f"在建立新遊戲時發生錯誤: {e}",
             color=0xff0000
         )
-        await interaction.followup.send(embed=error_embed, ephemeral=True)
+        await outbound.followup(interaction, embed=error_embed, ephemeral=True)
 
 
-@bot.tree.command(name='fish', description='開始釣魚！')
-async def fish_command(interaction: discord.Interaction):
+@tracked_command(name='fish', description='開始釣魚！')
+@app_commands.describe(casts=f'連續拋竿的次數 (1-{MAX_CASTS_PER_COMMAND}，預設 1)')
+async def fish_command(interaction: discord.Interaction, casts: app_commands.Range[int, 1, MAX_CASTS_PER_COMMAND] = 1):
     user_id = str(interaction.user.id)
-    user_data = get_user_data(user_id)
 
-    if not user_data['items'] or not user_data['current_rod'] in user_data['items']:
+    async with user_locks.hold(user_id):
+        owns_rod = has_rod(get_user_data(user_id))
+    if not owns_rod:
         await interaction.response.send_message("❌ 你沒有任何魚竿！請先到 `/shop` 購買。", ephemeral=True)
         return
 
     await interaction.response.defer(ephemeral=False)
 
-    catch_bonus, rare_bonus = calculate_catch_probability(user_data)
-    success_rate = min(0.95, 0.7 * catch_bonus)
-
-    initial_fishing_embed = discord.Embed(title="🎣 釣魚中...", description="正在準備魚竿和魚餌...", color=0xffff00)
-    initial_fishing_embed.add_field(name="使用道具", value=user_data['current_rod'], inline=True)
-    if '魚餌' in user_data['items'] and user_data['items']['魚餌'] > 0:
-        initial_fishing_embed.add_field(name="使用魚餌", value="是", inline=True)
-    await interaction.edit_original_response(embed=initial_fishing_embed)
-
-
-    await asyncio.sleep(2)
-
-    if random.random() > success_rate:
-        embed = discord.Embed(title="💔 釣魚失敗", color=0xff0000)
-        embed.add_field(name="結果", value="什麼都沒釣到...", inline=False)
-        await interaction.edit_original_response(embed=embed)
+    if casts > 1:
+        # 連續拋竿：一次結算、一次回覆，不播放逐次的釣魚動畫
+        async with user_locks.hold(user_id):
+            summary = fish_many(user_id, casts)
+        if summary is None:
+            await outbound.edit(interaction, content="❌ 你沒有任何魚竿！請先到 `/shop` 購買。")
+            return
+        await outbound.edit(interaction, embed=build_multi_cast_embed(summary))
         return
 
-    rarity = determine_fish_rarity(rare_bonus)
-    if not game_data['fish_data'].get(rarity):
-        rarity = 'common'
-    fish_name = random.choice(list(game_data['fish_data'][rarity].keys()))
-    fish_info = game_data['fish_data'][rarity][fish_name]
-
-    weight = round(random.uniform(*fish_info['weight_range']), 2)
-    price = int(weight * fish_info['price_per_kg'])
-    emoji = fish_info.get('emoji', '🐟')
-
-    user_data['money'] += price
-    user_data['total_catches'] += 1
-    if fish_name not in user_data['fish_caught']:
-        user_data['fish_caught'][fish_name] = 0
-    user_data['fish_caught'][fish_name] += 1
-
-    rarity_colors = {
-        'common': 0x808080, 'rare': 0x0080ff, 'epic': 0x8000ff, 'legendary': 0xffd700, 'junk': 0x404040
-    }
-    rarity_emojis = {
-        'common': '🟢', 'rare': '🔵', 'epic': '🟣', 'legendary': '🟡', 'junk': '⚫'
-    }
+    async with user_locks.hold(user_id):
+        cast = start_cast(user_id)
+    if cast is None:
+        await outbound.edit(interaction, content="❌ 你沒有任何魚竿！請先到 `/shop` 購買。")
+        return
 
-    result_embed = discord.Embed(title="🎉 釣魚成功!", color=rarity_colors[rarity])
-    result_embed.add_field(name="魚類", value=f"{rarity_emojis[rarity]} {fish_name} {emoji}", inline=True)
-    result_embed.add_field(name="重量", value=f"{weight} kg", inline=True)
-    result_embed.add_field(name="獲得金錢", value=f"💰 {price}", inline=True)
-    result_embed.add_field(name="目前金錢", value=f"💰 {user_data['money']}", inline=True)
+    initial_fishing_embed = discord.Embed(title="🎣 釣魚中...", description="正在準備魚竿和魚餌...", color=0xffff00)
+    initial_fishing_embed.add_field(name="使用道具", value=cast['rod'], inline=True)
+    if cast['bait_left'] > 0:
+        initial_fishing_embed.add_field(name="使用魚餌", value="是", inline=True)
+    # 進度動畫不等待送出；結果出來時若它還在排隊，就直接被結果取代
+    outbound.edit(interaction, priority=PRIORITY_PROGRESS, embed=initial_fishing_embed)
 
-    await interaction.edit_original_response(embed=result_embed)
+    # 收竿由 cast_scheduler 批次結算並送出結果，處理函數到這裡就結束
+    cast_scheduler.schedule(CAST_DELAY, (interaction, user_id, cast))
 
-@bot.tree.command(name='fish_item', description='切換你的釣魚道具（魚竿），請直接輸入魚竿名稱。')
+@tracked_command(name='fish_item', description='切換你的釣魚道具（魚竿），輸入時會列出你擁有的魚竿。')
 @app_commands.describe(rod_name='要切換的魚竿名稱 (例如：中級魚竿)')
 async def fish_item_command(interaction: discord.Interaction, rod_name: str):
     user_id = str(interaction.user.id)
-    user_data = get_user_data(user_id)
-
-    # 將輸入的魚竿名稱正規化，方便比對 (移除空白、轉小寫)
-    normalized_input_name = rod_name.lower().replace(' ', '')
-    found_rod_key = None
 
-    # 檢查用戶背包中是否有這個魚竿
-    for item_in_bag in user_data['items'].keys():
-        if item_in_bag.lower().replace(' ', '') == normalized_input_name and '魚竿' in item_in_bag:
-            found_rod_key = item_in_bag
-            break
+    async with user_locks.hold(user_id):
+        found_rod_key = switch_rod(user_id, rod_name)
 
     if found_rod_key:
-        user_data['current_rod'] = found_rod_key
         await interaction.response.send_message(f"✅ 已切換到 **{found_rod_key}**！", ephemeral=False)
     else:
         # 如果用戶背包中沒有這個魚竿，或者輸入的不是魚竿
@@ -346,108 +3711,100 @@ async def fish_item_command(interaction: discord.Interaction, rod_name: str):
             ephemeral=True
         )
 
-@bot.tree.command(name='shop', description='查看商店裡可用的釣魚用品。')
-async def shop_command(interaction: discord.Interaction):
-    embed = discord.Embed(title="🏪 釣魚用品商店", color=0x00ff00)
+@fish_item_command.autocomplete('rod_name')
+async def rod_name_autocomplete(interaction: discord.Interaction, current: str):
+    """只列出玩家背包裡有的魚竿。自動完成不取得玩家鎖，也不替沒玩過的人建立資料。
 
-    for item, info in game_data['items'].items():
-        if item == '基本魚竿':
-            continue
-        embed.add_field(
-            name=f"{item}",
-            value=f"價格: 💰{info['price']}\n描述: {info.get('description', '無')}",
-            inline=True
-        )
+    每次按鍵都會呼叫，只看記憶體 (peek)：不在記憶體中的玩家 (冷玩家或沒玩過的人) 不讀資料庫，
+    直接列出符合的魚竿，是否擁有由 /fish_item 在玩家鎖內檢查。
+    """
+    user_data = game_data['users'].peek(str(interaction.user.id))
+    if user_data is None:
+        return [app_commands.Choice(name=name, value=name) for name in _rod_index.search(current)[:AUTOCOMPLETE_LIMIT]]
+    choices = []
+    for name in _rod_index.search(current):
+        if user_data.item_count(name) > 0:
+            label = f"{name} (使用中)" if name == user_data.current_rod else name
+            choices.append(app_commands.Choice(name=label, value=name))
+            if len(choices) == AUTOCOMPLETE_LIMIT:
+                break
+    return choices
 
-    embed.set_footer(text="使用 /buy <物品名稱> 來購買道具。")
-    await interaction.response.send_message(embed=embed, ephemeral=True)
+@tracked_command(name='shop', description='查看商店裡可用的釣魚用品。')
+async def shop_command(interaction: discord.Interaction):
+    await interaction.response.send_message(embed=get_static_embed('shop'), ephemeral=True)
 
-@bot.tree.command(name='buy', description='從商店購買物品。')
+@tracked_command(name='buy', description='從商店購買物品。')
 @app_commands.describe(item_name='要購買的物品名稱 (例如：高級魚竿)')
 async def buy_command(interaction: discord.Interaction, item_name: str):
     user_id = str(interaction.user.id)
-    user_data = get_user_data(user_id)
-
-    normalized_input_name = item_name.lower().replace(' ', '')
-    found_item_key = None
-    item_info = None
 
-    for key, info in game_data['items'].items():
-        if key.lower().replace(' ', '') == normalized_input_name:
-            found_item_key = key
-            item_info = info
-            break
+    async with user_locks.hold(user_id):
+        result = buy_item(user_id, item_name)
 
-    if not found_item_key or found_item_key == '基本魚竿':
+    if result['status'] == 'not_found':
         await interaction.response.send_message(f"❌ 商店中沒有 **{item_name}** 這個物品。", ephemeral=True)
-        return
-
-    price = item_info['price']
-
-    if user_data['money'] >= price:
-        user_data['money'] -= price
-        if found_item_key not in user_data['items']:
-            user_data['items'][found_item_key] = 0
-        user_data['items'][found_item_key] += 1
-
+    elif result['status'] == 'ok':
         await interaction.response.send_message(
-            f"✅ 成功購買了 **{found_item_key}**！你現在有 💰{user_data['money']} 金錢。",
+            f"✅ 成功購買了 **{result['item']}**！你現在有 💰{result['balance']} 金錢。",
             ephemeral=False
         )
     else:
         await interaction.response.send_message(
-            f"❌ 你的金錢不足！購買 **{found_item_key}** 需要 💰{price}，你只有 💰{user_data['money']}。",
+            f"❌ 你的金錢不足！購買 **{result['item']}** 需要 💰{result['price']}，你只有 💰{result['balance']}。",
             ephemeral=True
         )
 
-@bot.tree.command(name='bag', description='查看你的背包、金錢和釣到的魚。')
+@buy_command.autocomplete('item_name')
+async def item_name_autocomplete(interaction: discord.Interaction, current: str):
+    items = game_data['items']
+    return [
+        app_commands.Choice(name=f"{name} (💰{items[name]['price']})", value=name)
+        for name in _shop_index.search(current)[:AUTOCOMPLETE_LIMIT]
+    ]
+
+@tracked_command(name='bag', description='查看你的背包、金錢和釣到的魚。')
 async def bag_command(interaction: discord.Interaction):
     user_id = str(interaction.user.id)
-    user_data = get_user_data(user_id)
-
-    embed = discord.Embed(title=f"🎒 {interaction.user.display_name} 的背包", color=0x9932cc)
-    embed.add_field(name="💰 金錢", value=str(user_data['money']), inline=True)
-    embed.add_field(name="🎣 當前魚竿", value=user_data['current_rod'], inline=True)
-    embed.add_field(name="📊 總釣魚次數", value=str(user_data['total_catches']), inline=True)
+    async with user_locks.hold(user_id):
+        embed = build_bag_embed(user_id, interaction.user.display_name)
+    await interaction.response.send_message(embed=embed, ephemeral=True)
 
-    items_text = ""
-    if user_data['items']:
-        for item, count in user_data['items'].items():
-            items_text += f"{item}: {count}\n"
-    else:
-        items_text = "無"
-    embed.add_field(name="🛠️ 道具", value=items_text, inline=False)
+@tracked_command(name='leaderboard', description='查看排行榜。')
+@app_commands.describe(metric='排行依據')
+@app_commands.choices(metric=[
+    app_commands.Choice(name=board.title, value=board.name) for board in leaderboards.values()
+])
+async def leaderboard_command(interaction: discord.Interaction, metric: app_commands.Choice[str] = None):
+    board = leaderboards[metric.value if metric else 'money']
+    embed = discord.Embed(title=f"🏆 排行榜 - {board.title}", color=0xffd700)
+    lines = []
+    for position, (user_id, score) in enumerate(board.top(LEADERBOARD_SIZE), start=1):
+        lines.append(f"**{position}.** <@{user_id}> - {score}")
+    embed.description = "\n".join(lines) if lines else "目前還沒有任何玩家。"
+    await interaction.response.send_message(embed=embed, ephemeral=False)
 
-    if user_data['fish_caught']:
-        fish_text = ""
-        sorted_fish = sorted(user_data['fish_caught'].items(), key=lambda item: item[0])
-        for fish, count in sorted_fish:
-            fish_rarity = 'common'
-            fish_emoji = '🐟'
-            for rarity_type, fish_map in game_data['fish_data'].items():
-                if fish in fish_map:
-                    fish_rarity = rarity_type
-                    fish_emoji = fish_map[fish]['emoji']
-                    break
-            rarity_emojis = {
-                'common': '🟢', 'rare': '🔵', 'epic': '🟣', 'legendary': '🟡', 'junk': '⚫'
-            }
-            fish_text += f"{rarity_emojis.get(fish_rarity, '❓')} {fish}: {count} 條 {fish_emoji}\n"
-        embed.add_field(name="🐟 釣到的魚", value=fish_text, inline=False)
-    else:
-        embed.add_field(name="🐟 釣到的魚", value="你還沒有釣到任何魚。", inline=False)
+@tracked_command(name='rank', description='查看你在各排行榜的名次。')
+async def rank_command(interaction: discord.Interaction):
+    user_id = str(interaction.user.id)
+    async with user_locks.hold(user_id):
+        get_user_data(user_id)
 
+    embed = discord.Embed(title=f"🏅 {interaction.user.display_name} 的名次", color=0xffd700)
+    for board in leaderboards.values():
+        embed.add_field(
+            name=board.title,
+            value=f"第 {board.rank(user_id)} 名 / {len(board.order)} 人 ({board.scores[user_id]})",
+            inline=False
+        )
     await interaction.response.send_message(embed=embed, ephemeral=True)
 
-@bot.tree.command(name='save', description='將你的遊戲進度保存為 JSON 檔案，以便下載。')
+@tracked_command(name='save', description='將你的遊戲進度保存為 JSON 檔案，以便下載。')
 async def save_command(interaction: discord.Interaction):
     """保存玩家資料為檔案 (匯出功能)"""
     user_id = str(interaction.user.id)
-    player_data = get_user_data(user_id)
-
-    # 為了只保存單一用戶的數據，我們建立一個新的字典
-    data_to_save_for_user = {user_id: player_data}
-    json_string = json.dumps(data_to_save_for_user, indent=4, ensure_ascii=False)
+    async with user_locks.hold(user_id):
+        json_string = export_user(user_id)
 
     file_bytes = io.BytesIO(json_string.encode('utf-8'))
 
@@ -456,12 +3813,12 @@ async def save_command(interaction: discord.Interaction):
 
     await interaction.response.send_message(
         f'{interaction.user.mention} 這是你的遊戲進度檔案。請妥善保存！\n'
-        '**重要：** 此機器人版本不會自動保存進度。若要恢復，請使用 `/load` 指令。',
+        '進度會自動保存；此檔案可作為備份，需要時請使用 `/load` 指令恢復。',
         file=discord_file,
         ephemeral=True # 訊息只對使用者可見
     )
 
-@bot.tree.command(name='load', description='上傳你的遊戲進度 JSON 檔案，繼續之前的進度。')
+@tracked_command(name='load', description='上傳你的遊戲進度 JSON 檔案，繼續之前的進度。')
 @app_commands.describe(file='請上傳你的 JSON 進度檔案')
 async def load_command(interaction: discord.Interaction, file: discord.Attachment):
     user_id = str(interaction.user.id)
@@ -469,7 +3826,7 @@ async def load_command(interaction: discord.Interaction, file: discord.Attachmen
     await interaction.response.defer(ephemeral=True)
 
     if not file.filename.lower().endswith('.json'):
-        await interaction.followup.send("❌ 請上傳一個 **.json** 檔案。", ephemeral=True)
+        await outbound.followup(interaction, "❌ 請上傳一個 **.json** 檔案。", ephemeral=True)
         return
 
     try:
@@ -477,61 +3834,345 @@ async def load_command(interaction: discord.Interaction, file: discord.Attachmen
         file_content_str = file_content_bytes.decode('utf-8')
         loaded_data = json.loads(file_content_str)
 
-        if user_id not in loaded_data:
-            await interaction.followup.send(
+        async with user_locks.hold(user_id):
+            loaded_player_data = import_user(user_id, loaded_data)
+
+        if loaded_player_data is None:
+            await outbound.followup(
+                interaction,
                 "❌ 載入的檔案不包含你的遊戲進度！請確保上傳的是你自己的 `/save` 檔案。",
                 ephemeral=True
             )
             return
 
-        game_data['users'][user_id] = loaded_data[user_id]
-
-        loaded_player_data = game_data['users'][user_id]
-        coins = loaded_player_data.get('money', 0)
-        items_count = sum(loaded_player_data.get('items', {}).values())
-        fish_types_count = len(loaded_player_data.get('fish_caught', {}))
+        coins = loaded_player_data.money
+        items_count = loaded_player_data.item_total()
+        fish_types_count = loaded_player_data.fish_species_count()
 
-        await interaction.followup.send(
+        await outbound.followup(
+            interaction,
             f'✅ **{interaction.user.mention}** 你的遊戲進度已成功載入！\n'
             f'你現在有 **💰{coins}** 金錢，**🎣 {items_count}** 個道具，並釣過 **🐟 {fish_types_count}** 種魚。',
             ephemeral=False
         )
 
     except json.JSONDecodeError:
-        await interaction.followup.send("❌ 無效的 JSON 檔案內容。請確保檔案未損壞。", ephemeral=True)
+        await outbound.followup(interaction, "❌ 無效的 JSON 檔案內容。請確保檔案未損壞。", ephemeral=True)
     except Exception as e:
         print(f"載入檔案時發生錯誤: {e}")
-        await interaction.followup.send(f"❌ 載入檔案時發生錯誤：`{e}`", ephemeral=True)
+        await outbound.followup(interaction, f"❌ 載入檔案時發生錯誤：`{e}`", ephemeral=True)
+
+
+@tracked_command(name='export_all', description='(管理員) 匯出所有玩家的遊戲資料 (NDJSON)。')
+@app_commands.default_permissions(administrator=True)
+@app_commands.checks.has_permissions(administrator=True)
+@app_commands.describe(compress='是否以 gzip 壓縮 (預設：是)')
+async def export_all_command(interaction: discord.Interaction, compress: bool = True):
+    await interaction.response.defer(ephemeral=True)
+    path = await export_to_file(compress)
+    size = os.path.getsize(path)
+    size_limit = interaction.guild.filesize_limit if interaction.guild else 8 * 1024 * 1024
+    message = f"✅ 已匯出 {len(leaderboards['money'].scores)} 位玩家的資料 ({size / 1024 / 1024:.1f} MB)。"
+    if size <= size_limit:
+        await outbound.followup(interaction, message, file=discord.File(path), ephemeral=True)
+    else:
+        await outbound.followup(interaction, f"{message}\n檔案超過上傳限制，已保存在伺服器：`{path}`", ephemeral=True)
+
+@tracked_command(name='import_all', description='(管理員) 從 NDJSON 檔案匯入玩家資料 (會覆蓋相同玩家的進度)。')
+@app_commands.default_permissions(administrator=True)
+@app_commands.checks.has_permissions(administrator=True)
+@app_commands.describe(file='由 /export_all 產生的 .ndjson 或 .ndjson.gz 檔案')
+async def import_all_command(interaction: discord.Interaction, file: discord.Attachment):
+    await interaction.response.defer(ephemeral=True)
+    if leases is not None:
+        await outbound.followup(interaction, "❌ 叢集模式下無法批次匯入，請以單一程序執行後再匯入。", ephemeral=True)
+        return
+
+    # 直接從 Discord CDN 邊下載邊匯入，不把整個附件讀進記憶體 (同 POST /admin/import)
+    async with aiohttp.ClientSession() as session:
+        async with session.get(file.url) as response:
+            if response.status != 200:
+                await outbound.followup(interaction, f"❌ 無法下載附件 (HTTP {response.status})。", ephemeral=True)
+                return
+            report = await import_ndjson(response.content.iter_chunked(BULK_IMPORT_READ_SIZE))
+    lines = [f"✅ 匯入完成：成功 {report['imported']} 位，失敗 {report['failed']} 行。"]
+    for line_number, error in report['errors']:
+        lines.append(f"第 {line_number} 行：{error}")
+    if report['failed'] > len(report['errors']):
+        lines.append(f"... 另有 {report['failed'] - len(report['errors'])} 行錯誤")
+    await outbound.followup(interaction, "\n".join(lines), ephemeral=True)
+
+
+@tracked_command(name='reload_catalog', description='(管理員) 重新載入魚類與商店目錄檔。')
+@app_commands.default_permissions(administrator=True)
+@app_commands.checks.has_permissions(administrator=True)
+async def reload_catalog_command(interaction: discord.Interaction):
+    await interaction.response.defer(ephemeral=True)
+    try:
+        result = await reload_catalog()
+    except CatalogError as e:
+        await outbound.followup(interaction, f"❌ 目錄檔有誤，保留目前的目錄：\n```\n{str(e)[:1800]}\n```", ephemeral=True)
+        return
+    await outbound.followup(
+        interaction,
+        f"✅ 已重新載入目錄：{result['fish']} 種魚、{result['items']} 個道具 ({result['seconds'] * 1000:.1f} ms)。",
+        ephemeral=True
+    )
 
 
-# Flask 路由 (用於 Render 部署)
-@app.route('/')
-def home():
-    return jsonify({
+@tracked_command(name='profile', description='(管理員) 取樣剖析機器人一段時間，回傳可畫成火焰圖的 collapsed stacks 檔。')
+@app_commands.default_permissions(administrator=True)
+@app_commands.checks.has_permissions(administrator=True)
+@app_commands.describe(seconds=f'取樣秒數 (1-{PROFILE_MAX_SECONDS}，預設 30)')
+async def profile_command(interaction: discord.Interaction, seconds: app_commands.Range[int, 1, PROFILE_MAX_SECONDS] = 30):
+    if profiler.running:
+        await interaction.response.send_message("❌ 已經有一個取樣正在進行中。", ephemeral=True)
+        return
+    await interaction.response.defer(ephemeral=True)
+    samples = await run_profile(seconds)
+    path = await asyncio.to_thread(save_profile, samples)
+    summary = summarize_samples(samples)
+    busy = summary['samples'] - summary['idle']
+    lines = [f"✅ 取樣 {seconds} 秒，共 {summary['samples']} 次，其中 {busy} 次在執行程式 (其餘為閒置)。"]
+    if busy:
+        lines.append("最耗時的函數 (不含它呼叫的其他函數)：")
+        for name, count in summary['top']:
+            lines.append(f"`{count / busy:6.1%}` {name}")
+    message = "\n".join(lines)[:1800]
+    if os.path.getsize(path) <= (interaction.guild.filesize_limit if interaction.guild else 8 * 1024 * 1024):
+        await outbound.followup(interaction, message, file=discord.File(path), ephemeral=True)
+    else:
+        await outbound.followup(interaction, f"{message}\n檔案超過上傳限制，已保存在伺服器：`{path}`", ephemeral=True)
+
+@tracked_command(name='trace', description='(管理員) 開關慢指令追蹤與事件迴圈阻塞偵測，或查看最近的紀錄。')
+@app_commands.default_permissions(administrator=True)
+@app_commands.checks.has_permissions(administrator=True)
+@app_commands.describe(action='開啟、關閉或查看狀態', slow_ms='慢指令門檻 (毫秒，不含等待)', block_ms='事件迴圈阻塞門檻 (毫秒)')
+@app_commands.choices(action=[
+    app_commands.Choice(name='開啟', value='on'),
+    app_commands.Choice(name='關閉', value='off'),
+    app_commands.Choice(name='狀態', value='status'),
+])
+async def trace_command(interaction: discord.Interaction, action: app_commands.Choice[str],
+                        slow_ms: app_commands.Range[int, 1, 60000] = None, block_ms: app_commands.Range[int, 5, 10000] = None):
+    if action.value == 'status':
+        status = tracing_status()
+    else:
+        status = set_tracing(action.value == 'on', slow_ms, block_ms)
+    lines = [
+        f"{'🟢 追蹤中' if status['enabled'] else '⚪ 未開啟'}：慢指令門檻 {status['slow_command_ms']:.0f} ms，"
+        f"阻塞門檻 {status['loop_block_ms']:.0f} ms。",
+        f"慢指令 {sum(status['slow_commands'].values())} 次，事件迴圈阻塞 {status['loop_blocks']} 次。",
+    ]
+    for record in status['recent_slow_commands'][-3:]:
+        lines.append(f"```\n{format_slow_command(record)}\n```")
+    for record in status['recent_loop_blocks'][-3:]:
+        lines.append(f"⚠️ {record['at']} 阻塞 {record['blocked_ms']:.0f} ms：`{record['stack'].rsplit(';', 1)[-1]}`")
+    await interaction.response.send_message("\n".join(lines)[:1900], ephemeral=True)
+
+
+# HTTP 路由 (用於 Render 部署)
+# 由 aiohttp 在機器人的事件迴圈上提供，路由可以直接讀取遊戲狀態，不會和指令處理產生跨執行緒競爭。
+http_runner = None
+
+
+async def home(request):
+    return web.json_response({
         "status": "Bot is running",
         "timestamp": datetime.now().isoformat()
     })
 
-@app.route('/health')
-def health():
-    return jsonify({"status": "healthy"})
 
-def run_flask():
-    port = int(os.environ.get('PORT', 5000))
-    app.run(host='0.0.0.0', port=port)
+def gateway_status():
+    latency = bot.latency
+    shards = {}
+    for shard_id, shard in getattr(bot, 'shards', {}).items():
+        shards[str(shard_id)] = {
+            "connected": not shard.is_closed(),
+            "latency": None if math.isnan(shard.latency) else round(shard.latency, 4)
+        }
+    return {
+        "connected": bot.is_ready() and not bot.is_closed(),
+        "latency": None if math.isnan(latency) else round(latency, 4),
+        "shard_id": bot.shard_id,
+        "shard_count": bot.shard_count,
+        "shards": shards
+    }
+
+
+async def health(request):
+    gateway = gateway_status()
+    healthy = gateway["connected"] and all(shard["connected"] for shard in gateway["shards"].values())
+    return web.json_response({
+        "status": "healthy" if healthy else "unhealthy",
+        "gateway": gateway,
+        "users_in_memory": len(game_data['users'])
+    }, status=200 if healthy else 503)
+
+
+async def metrics(request):
+    return web.Response(text=render_metrics(), content_type='text/plain', headers={'X-Prometheus-Format': '0.0.4'})
 
-if __name__ == '__main__':
-    flask_thread = threading.Thread(target=run_flask)
-    flask_thread.daemon = True
-    flask_thread.start()
 
+# 管理員路由：設定 FISHING_ADMIN_TOKEN 後才會啟用，請求需帶 Authorization: Bearer <token>
+ADMIN_TOKEN = os.environ.get('FISHING_ADMIN_TOKEN')
+
+
+def is_admin_request(request):
+    if not ADMIN_TOKEN:
+        return False
+    # 固定時間比較，回應時間不會透露猜中了幾個字元
+    provided = request.headers.get('Authorization', '').encode('utf-8')
+    return hmac.compare_digest(provided, f'Bearer {ADMIN_TOKEN}'.encode('utf-8'))
+
+
+async def admin_export(request):
+    """GET /admin/export[?gzip=1]：以串流回傳所有玩家的 NDJSON。"""
+    if not is_admin_request(request):
+        return web.json_response({"error": "unauthorized"}, status=401)
+    compress = request.query.get('gzip') == '1'
+    response = web.StreamResponse(headers={
+        'Content-Type': 'application/gzip' if compress else 'application/x-ndjson'
+    })
+    await response.prepare(request)
+    async for chunk in iter_export_chunks(compress):
+        await response.write(chunk)
+    await response.write_eof()
+    return response
+
+
+async def admin_import(request):
+    """POST /admin/import：請求本文為 NDJSON (可 gzip)，邊接收邊匯入。"""
+    if not is_admin_request(request):
+        return web.json_response({"error": "unauthorized"}, status=401)
+    if leases is not None:
+        return web.json_response({"error": "bulk import is not supported in cluster mode"}, status=409)
+    report = await import_ndjson(request.content.iter_chunked(BULK_IMPORT_READ_SIZE))
+    return web.json_response(report)
+
+
+async def admin_profile(request):
+    """POST /admin/profile?seconds=30：取樣剖析一段時間，回傳 collapsed stacks (可直接交給 flamegraph.pl)。"""
+    if not is_admin_request(request):
+        return web.json_response({"error": "unauthorized"}, status=401)
+    if profiler.running:
+        return web.json_response({"error": "a profile is already running"}, status=409)
+    try:
+        seconds = float(request.query.get('seconds', 30))
+    except ValueError:
+        return web.json_response({"error": "seconds must be a number"}, status=400)
+    samples = await run_profile(min(max(seconds, 0.1), PROFILE_MAX_SECONDS))
+    return web.Response(text=''.join(collapsed_lines(samples)), content_type='text/plain')
+
+
+async def admin_trace(request):
+    """GET /admin/trace：查看狀態與最近的紀錄；POST /admin/trace?enabled=1&slow_ms=&block_ms=：開關追蹤。"""
+    if not is_admin_request(request):
+        return web.json_response({"error": "unauthorized"}, status=401)
+    if request.method == 'GET':
+        return web.json_response(tracing_status())
+    try:
+        slow_ms = float(request.query['slow_ms']) if 'slow_ms' in request.query else None
+        block_ms = float(request.query['block_ms']) if 'block_ms' in request.query else None
+    except ValueError:
+        return web.json_response({"error": "slow_ms and block_ms must be numbers"}, status=400)
+    return web.json_response(set_tracing(request.query.get('enabled', '1') == '1', slow_ms, block_ms))
+
+
+def create_http_app():
+    http_app = web.Application()
+    http_app.router.add_get('/', home)
+    http_app.router.add_get('/health', health)
+    http_app.router.add_get('/metrics', metrics)
+    if ADMIN_TOKEN:
+        http_app.router.add_get('/admin/export', admin_export)
+        http_app.router.add_post('/admin/import', admin_import)
+        http_app.router.add_post('/admin/profile', admin_profile)
+        http_app.router.add_get('/admin/trace', admin_trace)
+        http_app.router.add_post('/admin/trace', admin_trace)
+    return http_app
+
+
+async def start_http_server():
+    global http_runner
+    if http_runner is not None:
+        return
+    # 叢集模式下每個工作程序使用不同的埠
+    port = int(os.environ.get('PORT', 5000)) + (WORKER_ID or 0)
+    http_runner = web.AppRunner(create_http_app(), access_log=None)
+    await http_runner.setup()
+    await web.TCPSite(http_runner, '0.0.0.0', port).start()
+    print(f"HTTP 伺服器已在連接埠 {port} 啟動。")
+
+
+async def stop_http_server():
+    global http_runner
+    if http_runner is not None:
+        await http_runner.cleanup()
+        http_runner = None
+
+# --- 叢集啟動器 ---
+
+def recommended_shard_count(token):
+    """向 Discord 詢問建議的分片數。"""
+    import requests
+    response = requests.get(
+        'https://discord.com/api/v10/gateway/bot',
+        headers={'Authorization': f'Bot {token}'},
+        timeout=10
+    )
+    response.raise_for_status()
+    return response.json()['shards']
+
+
+def run_cluster(token, workers):
+    """把分片平均分給 workers 個工作程序；每個程序各自連線並只處理自己的分片。"""
+    import subprocess
+    shard_count = SHARD_COUNT or recommended_shard_count(token)
+    workers = min(workers, shard_count)
+    processes = []
+    for worker_id in range(workers):
+        shard_ids = list(range(worker_id, shard_count, workers))
+        env = dict(
+            os.environ,
+            FISHING_CLUSTER_WORKERS='1',
+            FISHING_WORKER_ID=str(worker_id),
+            FISHING_SHARD_COUNT=str(shard_count),
+            FISHING_SHARD_IDS=','.join(map(str, shard_ids))
+        )
+        processes.append(subprocess.Popen([sys.executable, os.path.abspath(__file__)], env=env))
+        print(f"工作程序 {worker_id} 已啟動，負責分片 {shard_ids}。")
+
+    def forward(signum, frame):
+        for process in processes:
+            process.send_signal(signum)
+
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+    for process in processes:
+        process.wait()
+
+
+mark_startup('module')
+
+if __name__ == '__main__':
     BOT_TOKEN = os.environ.get('DISCORD_BOT_TOKEN')
-    if BOT_TOKEN:
+    if BOT_TOKEN and CLUSTER_WORKERS > 1:
+        run_cluster(BOT_TOKEN, CLUSTER_WORKERS)
+    elif BOT_TOKEN:
         try:
             bot.run(BOT_TOKEN)
         except discord.errors.LoginFailure:
             print("❌ 無效的機器人 Token，請檢查 DISCORD_BOT_TOKEN 環境變數。")
         except Exception as e:
             print(f"機器人啟動時發生錯誤: {e}")
+        finally:
+            # 正常關閉時 close() 已經寫回過，這裡補寫任何遺漏的變更
+            flush_dirty_users_sync()
+            storage.close()
+            if event_log is not None:
+                event_log.close()
+            if leases is not None:
+                leases.close()
     else:
         print("❌ 請設定 DISCORD_BOT_TOKEN 環境變數。")
\ No newline at end of file
@@ -0,0 +1,29 @@
+import os
+import sys
+
+import pytest
+
+# 和 benchmark.py 相同：不寫資料庫與事件紀錄、不等待拋竿動畫、不限制送出速率，也不監看目錄檔
+os.environ.setdefault('FISHING_STORAGE', 'memory')
+os.environ.setdefault('FISHING_CAST_DELAY', '0')
+os.environ.setdefault('FISHING_OUTBOUND_RATE', '0')
+os.environ.setdefault('FISHING_EVENT_LOG', '0')
+os.environ.setdefault('FISHING_CATALOG_WATCH', '0')
+os.environ.setdefault('FISHING_CATALOG_CACHE', '')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def sqlite_storage(tmp_path, monkeypatch):
+    """以暫存目錄中的 SQLite 資料庫與新的玩家快取取代記憶體儲存。"""
+    import main
+
+    storage = main.SQLiteStorage(str(tmp_path / 'fishing_data.db'))
+    monkeypatch.setattr(main, 'storage', storage)
+    monkeypatch.setattr(main, 'DB_PATH', storage.path)
+    monkeypatch.setitem(main.game_data, 'users', main.UserCache(main.USER_CACHE_SIZE))
+    main.dirty_users.clear()
+    yield storage
+    main.dirty_users.clear()
+    storage.close()
@@ -0,0 +1,77 @@
+"""事件紀錄：EventLog 寫出的分段檔由 analytics.scan 讀回，彙總出的拋竿數、上鉤率與魚餌花費必須正確。"""
+import os
+
+import analytics
+import main
+
+ROD = main.ITEM_IDS.id_of('中級魚竿')
+BASIC_ROD = main.ITEM_IDS.id_of('基本魚竿')
+BAIT = main.ITEM_IDS.id_of('魚餌')
+COMMON = main.RARITY_IDS['common']
+RARE = main.RARITY_IDS['rare']
+FISH = main.FISH_IDS.id_of('小魚')
+
+
+def record_session(log):
+    # 玩家 1：買魚竿與兩個魚餌，用中級魚竿拋竿四次 (前兩次用魚餌)
+    log.record(main.EVENT_BUY, '1', price=-500, species=ROD, rod=BASIC_ROD)
+    log.record(main.EVENT_BUY, '1', price=-50, species=BAIT, rod=ROD)
+    log.record(main.EVENT_BUY, '1', price=-50, species=BAIT, rod=ROD)
+    log.record(main.EVENT_CATCH, '1', price=100, weight=2.5, species=FISH, rod=ROD, rarity=RARE, bait=True)
+    log.record(main.EVENT_MISS, '1', rod=ROD, bait=True)
+    log.record(main.EVENT_CATCH, '1', price=40, weight=0.4, species=FISH, rod=ROD, rarity=COMMON)
+    log.record(main.EVENT_MISS, '1', rod=ROD)
+    # 玩家 2：基本魚竿拋竿兩次，不用魚餌
+    log.record(main.EVENT_CATCH, '2', price=20, weight=0.3, species=FISH, rod=BASIC_ROD, rarity=COMMON)
+    log.record(main.EVENT_MISS, '2', rod=BASIC_ROD)
+
+
+def test_scan_reports_casts_catch_rate_and_bait_spend(tmp_path):
+    directory = str(tmp_path)
+    log = main.EventLog(directory, 'events', segment_events=4)
+    record_session(log)
+    log.flush_sync()
+    # 寫完一批後再寫一批，跨越分段的事件也要讀得到
+    log.record(main.EVENT_CATCH, '2', price=30, weight=0.5, species=FISH, rod=BASIC_ROD, rarity=COMMON)
+    log.close()
+
+    segments = analytics.list_segments(directory)
+    assert [os.path.basename(path) for path in segments] == ['events-000000.evt', 'events-000001.evt', 'events-000002.evt']
+    assert all(os.path.exists(path[:-4] + '.names.json') for path in segments)
+
+    report = analytics.scan(directory).report()
+    assert report['events'] == 10
+    assert report['players'] == 2
+    assert report['rods']['中級魚竿'] == {'casts': 4, 'catch_rate': 0.5, 'revenue_per_cast': 35.0}
+    assert report['rods']['基本魚竿'] == {'casts': 3, 'catch_rate': 0.6667, 'revenue_per_cast': 16.667}
+
+    bait = report['bait']
+    assert (bait['casts_with'], bait['casts_without']) == (2, 5)
+    assert bait['revenue_per_cast_with'] == 50.0
+    assert bait['revenue_per_cast_without'] == 18.0
+    assert bait['cost_per_bait'] == 50.0
+    assert bait['roi'] == round((50.0 - 18.0 - 50.0) / 50.0, 4)
+
+    minted = {}
+    for by_rarity in report['minted_per_hour'].values():
+        for rarity, money in by_rarity.items():
+            minted[rarity] = minted.get(rarity, 0) + money
+    assert minted == {'rare': 100, 'common': 90}
+    assert report['rod_upgrades']['中級魚竿']['buyers'] == 1
+
+
+def test_new_log_continues_after_existing_segments(tmp_path):
+    directory = str(tmp_path)
+    first = main.EventLog(directory, 'events', segment_events=4)
+    record_session(first)
+    first.close()
+    second = main.EventLog(directory, 'events', segment_events=4)
+    record_session(second)
+    second.close()
+
+    # 重新啟動後從下一個編號開始，不覆蓋舊的分段
+    assert len(analytics.list_segments(directory)) == 6
+    report = analytics.scan(directory).report()
+    assert report['events'] == 18
+    assert report['rods']['中級魚竿']['casts'] == 8
+    assert report['bait']['cost_per_bait'] == 50.0
@@ -0,0 +1,122 @@
+"""全體玩家的批次匯入與管理員路由的驗證。"""
+import asyncio
+import gzip
+import json
+import types
+
+from aiohttp import web
+
+import main
+from benchmark import FakeInteraction
+
+
+class StreamedAttachment:
+    """只能從 url 下載的附件：匯入若改用 read() 讀整個檔案就會失敗。"""
+
+    def __init__(self, url):
+        self.filename = 'players.ndjson.gz'
+        self.url = url
+
+    async def read(self):
+        raise AssertionError('/import_all 應該從 url 串流下載')
+
+
+def _request(authorization=None):
+    headers = {} if authorization is None else {'Authorization': authorization}
+    return types.SimpleNamespace(headers=headers)
+
+
+def test_admin_token_check(monkeypatch):
+    monkeypatch.setattr(main, 'ADMIN_TOKEN', 's3cret')
+    assert main.is_admin_request(_request('Bearer s3cret'))
+    assert not main.is_admin_request(_request('Bearer s3cre'))
+    assert not main.is_admin_request(_request('Bearer s3cret '))
+    assert not main.is_admin_request(_request())
+    assert not main.is_admin_request(_request('Bearer 管理員'))
+    # 沒有設定權杖時不接受任何請求 (包括字面上的 "Bearer None")
+    monkeypatch.setattr(main, 'ADMIN_TOKEN', None)
+    assert not main.is_admin_request(_request('Bearer None'))
+
+
+def test_import_all_streams_attachment_from_url():
+    lines = [
+        json.dumps({'user_id': str(5 * 10 ** 6 + index), 'money': index, 'items': {'基本魚竿': 1},
+                    'current_rod': '基本魚竿', 'fish_caught': {}, 'total_catches': 0})
+        for index in range(3000)
+    ]
+    lines.insert(10, '{"user_id": "broken"')
+    payload = gzip.compress(('\n'.join(lines) + '\n').encode('utf-8'))
+    served = []
+
+    async def attachment(request):
+        response = web.StreamResponse()
+        await response.prepare(request)
+        for start in range(0, len(payload), 4096):
+            served.append(start)
+            await response.write(payload[start:start + 4096])
+        return response
+
+    async def scenario():
+        app = web.Application()
+        app.router.add_get('/attachment', attachment)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        site = web.TCPSite(runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        interaction = FakeInteraction(1)
+        try:
+            await main.import_all_command.callback(interaction, file=StreamedAttachment(f'http://127.0.0.1:{port}/attachment'))
+        finally:
+            await runner.cleanup()
+        return interaction
+
+    interaction = asyncio.run(scenario())
+    messages = [content for kind, content, _ in interaction.calls if kind == 'followup']
+    assert messages and '成功 3000 位，失敗 1 行' in messages[-1]
+    assert '第 11 行' in messages[-1]
+    assert len(served) > 1
+    assert main.game_data['users'].peek(str(5 * 10 ** 6 + 2999)).money == 2999
+
+
+def test_import_waits_for_players_running_a_command(sqlite_storage):
+    lines = ''.join(
+        json.dumps({'user_id': user_id, 'money': 777, 'items': {'基本魚竿': 1}, 'current_rod': '基本魚竿',
+                    'fish_caught': {}, 'total_catches': 0}) + '\n'
+        for user_id in ('9001', '9002')
+    ).encode('utf-8')
+
+    async def chunks():
+        yield lines
+
+    async def scenario():
+        started, release = asyncio.Event(), asyncio.Event()
+
+        async def command():
+            async with main.user_locks.hold('9001'):
+                user_data = main.get_user_data('9001')
+                started.set()
+                await release.wait()
+                # 指令在鎖內修改它一開始取得的紀錄
+                user_data.money += 5
+                main.mark_dirty('9001')
+                return user_data
+
+        running = asyncio.create_task(command())
+        await started.wait()
+        importing = asyncio.create_task(main.import_ndjson(chunks()))
+        await asyncio.sleep(0.05)
+        # 沒有指令在執行的玩家已經換上，執行中的玩家等指令結束
+        assert main.game_data['users'].peek('9002').money == 777
+        assert main.game_data['users'].peek('9001').money != 777
+        assert not importing.done()
+        release.set()
+        old_record = await running
+        report = await importing
+        return old_record, report
+
+    old_record, report = asyncio.run(scenario())
+    assert report['imported'] == 2 and report['failed'] == 0
+    assert main.game_data['users'].peek('9001') is not old_record
+    assert main.game_data['users'].peek('9001').money == 777
+    assert sqlite_storage.load_user('9001')['money'] == 777
@@ -0,0 +1,112 @@
+"""收竿排程：依到期時間結算、玩家有指令在執行時延後，以及關閉前立刻結算還沒到期的拋竿。"""
+import asyncio
+import random
+
+import main
+from benchmark import FakeInteraction
+
+TICK = 0.01
+
+
+def test_items_resolve_in_due_order_and_never_early():
+    rng = random.Random(3)
+    delays = [rng.choice((0.0, 0.02, 0.05, 0.08)) for _ in range(60)]
+    resolved = []
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        scheduler = main.CastScheduler(lambda batch: resolved.extend((loop.time(), item) for item in batch), tick=TICK, batch_max=4)
+        due = {}
+        for index, delay in enumerate(delays):
+            due[index] = loop.time() + delay
+            scheduler.schedule(delay, index)
+        while len(scheduler):
+            await asyncio.sleep(TICK)
+        return scheduler, due
+
+    scheduler, due = asyncio.run(scenario())
+    order = [index for _, index in resolved]
+    # 到期時間相同的項目依排程順序
+    assert order == sorted(range(len(delays)), key=lambda index: (delays[index], index))
+    assert all(at >= due[index] for at, index in resolved)
+    assert scheduler.resolved == len(delays)
+    assert scheduler.batches >= len(delays) / 4
+
+
+def test_flush_resolves_pending_items_without_waiting():
+    resolved = []
+
+    async def scenario():
+        scheduler = main.CastScheduler(resolved.extend, tick=TICK, batch_max=3)
+        for index in range(10):
+            scheduler.schedule(60 - index, index)
+        scheduler.flush()
+        assert len(scheduler) == 0
+        # 計時器已經取消，之後不會再結算一次
+        await asyncio.sleep(3 * TICK)
+        return scheduler
+
+    scheduler = asyncio.run(scenario())
+    assert resolved == list(reversed(range(10)))
+    assert scheduler.batches == 4
+
+
+def _cast_result(interaction):
+    return [kwargs['embed'].title for kind, _, kwargs in interaction.calls if kind == 'edit' and kwargs.get('embed')]
+
+
+def _sure_cast(user_id):
+    cast = main.start_cast(user_id)
+    cast['success_rate'] = 1.0
+    return cast
+
+
+def test_casts_of_players_running_a_command_wait_for_the_lock():
+    async def scenario():
+        free, busy = FakeInteraction('801'), FakeInteraction('802')
+        locked = asyncio.Event()
+        release = asyncio.Event()
+
+        async def other_command():
+            async with main.user_locks.hold('802'):
+                locked.set()
+                await release.wait()
+                # 指令還在執行：拋竿不能在這之前記到玩家身上
+                assert main.get_user_data('802').total_catches == 0
+
+        task = asyncio.create_task(other_command())
+        await locked.wait()
+        batch = [(free, '801', _sure_cast('801')), (busy, '802', _sure_cast('802'))]
+        main.resolve_due_casts(batch)
+        assert main.get_user_data('801').total_catches == 1
+        assert main.get_user_data('802').total_catches == 0
+
+        release.set()
+        await task
+        await main.outbound.drain(1.0)
+        while not _cast_result(busy):
+            await asyncio.sleep(TICK)
+        return free, busy
+
+    free, busy = asyncio.run(scenario())
+    assert main.get_user_data('802').total_catches == 1
+    assert _cast_result(free) == _cast_result(busy) == ['🎉 釣魚成功!']
+
+
+def test_fish_results_are_sent_when_the_scheduler_is_flushed(monkeypatch):
+    monkeypatch.setattr(main, 'CAST_DELAY', 60.0)
+
+    async def scenario():
+        scheduler = main.CastScheduler(main.resolve_due_casts)
+        monkeypatch.setattr(main, 'cast_scheduler', scheduler)
+        interactions = [FakeInteraction(str(810 + index)) for index in range(5)]
+        await asyncio.gather(*(main.fish_command.callback(interaction) for interaction in interactions))
+        assert len(scheduler) == 5
+        # 關閉流程 (FishingBot.close)：先結算，再等排隊中的訊息送完
+        scheduler.flush()
+        await main.outbound.drain(1.0)
+        return interactions
+
+    for interaction in asyncio.run(scenario()):
+        # 進度動畫若還在排隊會被結果取代，最後一則一定是結果
+        assert _cast_result(interaction)[-1] in ('🎉 釣魚成功!', '💔 釣魚失敗')
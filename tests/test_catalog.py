@@ -0,0 +1,87 @@
+"""目錄檔的驗證與熱重新載入：有問題的目錄一律被拒絕，並且保留目前的目錄。"""
+import asyncio
+import copy
+import json
+
+import pytest
+
+import main
+
+
+@pytest.fixture
+def catalog_file(tmp_path, monkeypatch):
+    """把目前的目錄寫成暫存檔並指給 reload_catalog；測試結束後換回原本的目錄。"""
+    original = {key: main.game_data[key] for key in ('fish_data', 'items', 'rarity_rates')}
+    path = tmp_path / 'catalog.json5'
+    monkeypatch.setattr(main, 'CATALOG_PATH', str(path))
+
+    def write(catalog):
+        path.write_text(json.dumps(catalog, ensure_ascii=False), encoding='utf-8')
+
+    yield copy.deepcopy(original), write
+    main.install_catalog(original, main.compile_catalog(original))
+
+
+def assert_rejected(write, catalog, message):
+    before = (main.game_data['items'], main.game_data['fish_data'], main.catalog_version, main._shop_index)
+    write(catalog)
+    with pytest.raises(main.CatalogError, match=message):
+        asyncio.run(main.reload_catalog())
+    assert (main.game_data['items'], main.game_data['fish_data'], main.catalog_version, main._shop_index) == before
+
+
+def test_invalid_catalog_is_rejected_and_old_one_kept(catalog_file):
+    catalog, write = catalog_file
+    catalog['items']['中級魚竿']['price'] = -1
+    catalog['fish_data']['common']['小魚']['weight_range'] = [2, 1]
+    del catalog['rarity_rates']['epic']
+    with pytest.raises(main.CatalogError) as error:
+        main.validate_catalog(copy.deepcopy(catalog))
+    # 一次列出所有問題
+    message = str(error.value)
+    assert 'items.中級魚竿: price' in message
+    assert 'fish_data.common.小魚: weight_range' in message
+    assert 'rarity_rates: 缺少 epic' in message
+    assert 'fish_data.epic: 沒有對應的 rarity_rates' in message
+    assert_rejected(write, catalog, 'price 必須是非負整數')
+
+
+def test_unparseable_file_is_rejected(catalog_file, tmp_path):
+    _, write = catalog_file
+    before = main.game_data['items']
+    (tmp_path / 'catalog.json5').write_text('{fish_data: {', encoding='utf-8')
+    with pytest.raises(main.CatalogError, match='無法讀取目錄檔'):
+        asyncio.run(main.reload_catalog())
+    assert main.game_data['items'] is before
+
+
+def test_removing_an_item_on_sale_is_rejected(catalog_file):
+    catalog, write = catalog_file
+    del catalog['items']['中級魚竿']
+    # 目錄本身是合法的，但玩家可能已經擁有這個道具
+    main.validate_catalog(copy.deepcopy(catalog))
+    assert_rejected(write, catalog, '不能移除玩家可能已擁有的道具 中級魚竿')
+    assert main._shop_index.resolve('中級魚竿') == '中級魚竿'
+
+
+@pytest.mark.parametrize('name', main.REQUIRED_ITEMS)
+def test_removing_a_required_item_is_rejected(catalog_file, name):
+    catalog, write = catalog_file
+    del catalog['items'][name]
+    with pytest.raises(main.CatalogError, match=f'缺少必要道具 {name}'):
+        main.validate_catalog(copy.deepcopy(catalog))
+    assert_rejected(write, catalog, f'缺少必要道具 {name}')
+
+
+def test_valid_change_is_installed(catalog_file):
+    catalog, write = catalog_file
+    catalog['items']['魚餌']['price'] = 75
+    catalog['items']['超級魚竿'] = dict(catalog['items']['高級魚竿'], price=9999)
+    write(catalog)
+    version = main.catalog_version
+    result = asyncio.run(main.reload_catalog())
+    assert result['items'] == len(catalog['items'])
+    assert main.catalog_version == version + 1
+    assert main.game_data['items']['魚餌']['price'] == 75
+    assert main._shop_index.search('超級') == ('超級魚竿',)
+    assert main._rod_index.resolve('超級魚竿') == '超級魚竿'
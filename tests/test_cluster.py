@@ -0,0 +1,70 @@
+"""叢集模式的玩家租約：釋放後再取得的玩家必須以資料庫的最新狀態為準。"""
+import asyncio
+import json
+
+import main
+
+
+def test_reacquired_player_does_not_reuse_cached_bag(sqlite_storage, monkeypatch):
+    leases = main.UserLeases(sqlite_storage.path, 'worker-test')
+    monkeypatch.setattr(main, 'leases', leases)
+    monkeypatch.setattr(main, 'owned_users', {})
+
+    async def scenario():
+        async with main.user_locks.hold('42'):
+            main.get_user_data('42').money = 100
+            main.mark_dirty('42')
+            before = main.build_bag_embed('42', 'player42')
+        await main.release_owned_users(['42'])
+        assert '42' not in main.owned_users
+        assert '42' not in main.game_data['users']
+
+        # 另一個工作程序取得租約、修改後寫回並釋放
+        record = main.UserRecord.new()
+        record.money = 99999
+        sqlite_storage.write_batch([('42', json.dumps(record.to_dict(), ensure_ascii=False))])
+
+        async with main.user_locks.hold('42'):
+            assert main.get_user_data('42').money == 99999
+            after = main.build_bag_embed('42', 'player42')
+        return before, after
+
+    try:
+        before, after = asyncio.run(scenario())
+    finally:
+        leases.conn.close()
+    assert before.fields[0].value == '100'
+    assert after.fields[0].value == '99999'
+
+
+def test_concurrent_acquisitions_share_one_transaction(sqlite_storage, monkeypatch):
+    leases = main.UserLeases(sqlite_storage.path, 'worker-test')
+    other = main.UserLeases(sqlite_storage.path, 'worker-other')
+    monkeypatch.setattr(main, 'leases', leases)
+    monkeypatch.setattr(main, 'owned_users', {})
+    batches = []
+    try_acquire = leases.try_acquire
+    monkeypatch.setattr(leases, 'try_acquire', lambda user_ids: batches.append(list(user_ids)) or try_acquire(user_ids))
+    assert other.try_acquire(['busy']) == {'busy'}
+
+    async def use(user_id):
+        async with main.user_locks.hold(user_id):
+            main.get_user_data(user_id)
+
+    async def scenario():
+        await asyncio.gather(*(use(str(user_id)) for user_id in range(200)))
+        # 另一個程序持有的玩家：請求移交，對方釋放後在等待期限內取得
+        waiting = asyncio.create_task(use('busy'))
+        await asyncio.sleep(3 * main.LEASE_POLL)
+        assert other.requested() == ['busy']
+        other.release(['busy'])
+        await waiting
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        leases.conn.close()
+        other.conn.close()
+    assert batches[0] == [str(user_id) for user_id in range(200)]
+    assert all(batch == ['busy'] for batch in batches[1:])
+    assert set(main.owned_users) == {str(user_id) for user_id in range(200)} | {'busy'}
@@ -0,0 +1,91 @@
+"""排行榜：分桶有序串列與名次查詢必須和直接 sorted() 的結果完全相同。"""
+import bisect
+import random
+
+import pytest
+
+import main
+
+
+class SmallBuckets(main.SortedKeyList):
+    # 桶很小才會頻繁分裂與清空，Fenwick 樹的重建路徑都會被走到
+    LOAD = 4
+
+
+def check_against(keys, reference):
+    assert len(keys) == len(reference)
+    assert keys.first(len(reference) + 5) == reference
+    assert keys.first(7) == reference[:7]
+    for key in set(reference):
+        assert keys.index(key) == bisect.bisect_left(reference, key)
+    assert all(len(bucket) <= 2 * keys.LOAD for bucket in keys._lists)
+    assert keys._maxes == [bucket[-1] for bucket in keys._lists]
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_sorted_key_list_matches_sorted(seed):
+    rng = random.Random(seed)
+    initial = [rng.randrange(50) for _ in range(rng.randrange(0, 30))]
+    keys = SmallBuckets(initial)
+    reference = sorted(initial)
+    check_against(keys, reference)
+    for step in range(3000):
+        # 值域很小，重複的鍵 (同分) 很多；刪除比插入少一點，串列會時大時小
+        if reference and rng.random() < 0.45:
+            key = rng.choice(reference)
+            keys.remove(key)
+            reference.remove(key)
+        else:
+            key = rng.randrange(50)
+            keys.add(key)
+            bisect.insort(reference, key)
+        if step % 50 == 0:
+            check_against(keys, reference)
+    while reference:
+        key = rng.choice(reference)
+        keys.remove(key)
+        reference.remove(key)
+    check_against(keys, reference)
+    keys.add(3)
+    assert keys.first(5) == [3]
+
+
+def brute_force(scores):
+    return sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_leaderboard_matches_brute_force(seed, monkeypatch):
+    monkeypatch.setattr(main, 'SortedKeyList', SmallBuckets)
+    rng = random.Random(seed)
+    board = main.Leaderboard('money', 'money', lambda user_data: user_data.money)
+    users = {}
+    for user_id in range(40):
+        users[str(user_id)] = main.UserRecord(money=rng.randrange(10))
+    board.rebuild(users)
+    assert isinstance(board.order, SmallBuckets)
+
+    for step in range(3000):
+        user_id = str(rng.randrange(60))
+        user_data = users.setdefault(user_id, main.UserRecord(money=0))
+        # 分數可增可減，也常常不變；值域小所以同分很多
+        user_data.money = max(0, user_data.money + rng.choice((-3, -1, 0, 1, 2, 5)))
+        board.update(user_id, user_data)
+        if step % 25 == 0:
+            expected = brute_force({user_id: record.money for user_id, record in users.items()})
+            assert board.top(10) == expected[:10]
+            assert board.top(len(expected) + 1) == expected
+            for position, (expected_id, _) in enumerate(expected, 1):
+                assert board.rank(expected_id) == position
+    assert board.rank('missing') is None
+
+
+def test_leaderboard_rebuild_equals_incremental_updates():
+    rng = random.Random(7)
+    users = {str(user_id): main.UserRecord(money=rng.randrange(5)) for user_id in range(500)}
+    incremental = main.Leaderboard('money', 'money', lambda user_data: user_data.money)
+    for user_id, user_data in users.items():
+        incremental.update(user_id, user_data)
+    rebuilt = main.Leaderboard('money', 'money', lambda user_data: user_data.money)
+    rebuilt.rebuild(users)
+    assert incremental.top(500) == rebuilt.top(500) == brute_force({u: r.money for u, r in users.items()})
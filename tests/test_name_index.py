@@ -0,0 +1,96 @@
+"""道具名稱索引：自動完成的排序，以及 /buy、/fish_item 對部分名稱的解析。"""
+import asyncio
+
+import pytest
+
+import main
+from benchmark import FakeInteraction
+
+NAMES = ['魚竿架', '基本魚竿', '中級魚竿', '高級魚竿', '魚餌', 'Lucky Lure']
+
+
+@pytest.fixture
+def index():
+    return main.NameIndex(NAMES)
+
+
+def test_prefix_matches_rank_before_substring_matches(index):
+    # 「魚竿」是魚竿架的前綴，其他魚竿只是包含它：前綴優先，其餘依目錄順序
+    assert index.search('魚竿') == ('魚竿架', '基本魚竿', '中級魚竿', '高級魚竿')
+    assert index.search('魚') == ('魚竿架', '魚餌', '基本魚竿', '中級魚竿', '高級魚竿')
+    assert index.search('級') == ('中級魚竿', '高級魚竿')
+    assert index.search('') == tuple(NAMES)
+    assert index.search('不存在') == ()
+
+
+def test_search_and_resolve_normalise_input(index):
+    # 全形、大小寫與空白都不影響比對
+    assert index.search('ＬＵＣＫＹ') == ('Lucky Lure',)
+    assert index.resolve(' lucky   lure ') == 'Lucky Lure'
+    assert index.resolve('中級 魚竿') == '中級魚竿'
+
+
+def test_resolve_accepts_unambiguous_partial_names(index):
+    assert index.resolve('中級') == '中級魚竿'
+    assert index.resolve('餌') == '魚餌'
+    assert index.resolve('lure') == 'Lucky Lure'
+    # 有多個候選時不猜
+    assert index.resolve('級') is None
+    assert index.resolve('魚竿') is None
+    assert index.resolve('') is None
+    # 只看擁有的道具時，唯一擁有的候選就是答案
+    assert index.resolve('級', owned=lambda name: name == '高級魚竿') == '高級魚竿'
+    assert index.resolve('級', owned=lambda name: False) is None
+    # 完整名稱不受 owned 影響 (是否擁有由呼叫端判斷)
+    assert index.resolve('中級魚竿', owned=lambda name: False) == '中級魚竿'
+
+
+def _reply(interaction):
+    kind, content, _ = interaction.calls[-1]
+    assert kind == 'send_message'
+    return content
+
+
+def test_buy_resolves_partial_names():
+    user_id = '7001'
+    main.get_user_data(user_id).money = 10000
+
+    async def buy(item_name):
+        interaction = FakeInteraction(user_id)
+        await main.buy_command.callback(interaction, item_name=item_name)
+        return _reply(interaction)
+
+    assert '成功購買了 **中級魚竿**' in asyncio.run(buy('中級'))
+    assert '成功購買了 **魚餌**' in asyncio.run(buy('餌'))
+    # 「魚竿」符合好幾個商品，基本魚竿不在商店裡
+    assert '商店中沒有 **魚竿**' in asyncio.run(buy('魚竿'))
+    assert '商店中沒有 **基本**' in asyncio.run(buy('基本'))
+    user_data = main.get_user_data(user_id)
+    assert user_data.item_count('中級魚竿') == 1 and user_data.item_count('魚餌') == 1
+
+
+def test_switch_rod_resolves_partial_names_among_owned_rods():
+    user_id = '7002'
+    user_data = main.get_user_data(user_id)
+    user_data.add_item('高級魚竿')
+
+    async def switch(rod_name):
+        interaction = FakeInteraction(user_id)
+        await main.fish_item_command.callback(interaction, rod_name=rod_name)
+        return _reply(interaction)
+
+    # 目錄裡有中級與高級魚竿，但玩家只有高級的：「級」就是高級魚竿
+    assert '已切換到 **高級魚竿**' in asyncio.run(switch('級'))
+    assert main.get_user_data(user_id).current_rod == '高級魚竿'
+    assert '已切換到 **基本魚竿**' in asyncio.run(switch('基本'))
+    # 同時擁有的兩支魚竿都包含「魚竿」，不猜；沒有的魚竿即使名稱完整也不能切換
+    assert '你沒有名為「**魚竿**」的魚竿' in asyncio.run(switch('魚竿'))
+    assert '你沒有名為「**中級魚竿**」的魚竿' in asyncio.run(switch('中級魚竿'))
+    assert main.get_user_data(user_id).current_rod == '基本魚竿'
+
+
+def test_autocomplete_uses_the_same_ranking():
+    interaction = FakeInteraction('7003')
+    choices = asyncio.run(main.item_name_autocomplete(interaction, '魚'))
+    assert [choice.value for choice in choices] == list(main._shop_index.search('魚'))
+    assert choices[0].value == '魚餌'
@@ -0,0 +1,150 @@
+"""OutboundScheduler 對著有速率限制的假 Discord 端點 (benchmark._fake_discord_app)：不超額、429 後重送、合併舊編輯。"""
+import asyncio
+import contextlib
+import time
+
+import aiohttp
+from aiohttp import web
+
+import benchmark
+import main
+
+ROUTE_PERIOD = 0.5
+
+
+class Target:
+    def __init__(self, route):
+        self.id = str(route)
+
+
+@contextlib.asynccontextmanager
+async def fake_discord(stats):
+    runner = web.AppRunner(benchmark._fake_discord_app(stats), access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    base = f'http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}'
+    delivered = []  # (路由, 內容, 送達時間)
+
+    async with aiohttp.ClientSession() as session:
+        async def send(kind, target, kwargs):
+            token = target.id
+            method, path = ('PATCH', f'/webhooks/{token}/messages/@original') if kind == 'edit' else ('POST', f'/webhooks/{token}')
+            async with session.request(method, base + path, json=kwargs) as response:
+                if response.status == 429:
+                    body = await response.json()
+                    raise main.RateLimited(body['retry_after'], body['global'])
+                delivered.append((token, kwargs.get('content'), time.monotonic()))
+                return response.headers
+
+        try:
+            yield send, delivered
+        finally:
+            await runner.cleanup()
+
+
+def new_stats():
+    return {'requests': 0, '429': 0, 'messages': {}}
+
+
+def test_route_buckets_never_exceed_the_server_limit(monkeypatch):
+    monkeypatch.setattr(benchmark, 'FAKE_ROUTE_PERIOD', ROUTE_PERIOD)
+    stats = new_stats()
+
+    async def scenario():
+        async with fake_discord(stats) as (send, delivered):
+            scheduler = main.OutboundScheduler(
+                send, rate=benchmark.FAKE_GLOBAL_LIMIT * 0.9,
+                route_burst=benchmark.FAKE_ROUTE_LIMIT, route_period=ROUTE_PERIOD,
+            )
+            # 一個路由有三倍於額度的追加訊息 (不會被合併)，其他路由各一則
+            busy = [scheduler.followup(Target('busy'), f'line {index}') for index in range(3 * benchmark.FAKE_ROUTE_LIMIT)]
+            others = [scheduler.followup(Target(f'other-{index}'), 'hello') for index in range(10)]
+            await asyncio.gather(*busy, *others)
+            return scheduler, delivered
+
+    scheduler, delivered = asyncio.run(scenario())
+    assert stats['429'] == 0
+    assert scheduler.rate_limited == 0
+    busy = [(content, at) for route, content, at in delivered if route == 'busy']
+    # 同一個路由依送出順序到達
+    assert [content for content, _ in busy] == [f'line {index}' for index in range(3 * benchmark.FAKE_ROUTE_LIMIT)]
+    assert busy[-1][1] - busy[0][1] >= 2 * ROUTE_PERIOD * 0.9
+    # 用完額度的路由不會擋住其他路由
+    assert max(at for route, _, at in delivered if route != 'busy') < busy[benchmark.FAKE_ROUTE_LIMIT][1]
+
+
+def test_rate_limited_requests_are_retried_after_retry_after():
+    stats = new_stats()
+    routes = benchmark.FAKE_GLOBAL_LIMIT + 30
+
+    async def scenario():
+        async with fake_discord(stats) as (send, delivered):
+            # 排程器的全域額度比假端點高：超出的請求收到全域 429，等 retry_after 後重送
+            scheduler = main.OutboundScheduler(send, rate=routes * 10)
+            started = time.monotonic()
+            await asyncio.gather(*(scheduler.edit(Target(route), f'result {route}') for route in range(routes)))
+            return scheduler, time.monotonic() - started
+
+    scheduler, elapsed = asyncio.run(scenario())
+    assert stats['429'] > 0
+    assert scheduler.rate_limited == stats['429']
+    assert scheduler.sent == routes
+    assert stats['messages'] == {str(route): f'result {route}' for route in range(routes)}
+    # 假端點的全域窗口是 1 秒：重送的請求一定要等到下一個窗口
+    assert elapsed >= 0.9
+
+
+def test_superseded_edits_are_dropped(monkeypatch):
+    monkeypatch.setattr(benchmark, 'FAKE_ROUTE_PERIOD', ROUTE_PERIOD)
+    stats = new_stats()
+    routes, edits = 20, 6
+
+    async def scenario():
+        async with fake_discord(stats) as (send, delivered):
+            scheduler = main.OutboundScheduler(
+                send, rate=benchmark.FAKE_GLOBAL_LIMIT * 0.9,
+                route_burst=benchmark.FAKE_ROUTE_LIMIT, route_period=ROUTE_PERIOD,
+            )
+            futures = []
+            for route in range(routes):
+                futures.append(scheduler.edit(Target(route), 'progress', priority=main.PRIORITY_PROGRESS))
+                for step in range(edits):
+                    futures.append(scheduler.edit(Target(route), f'step {step}'))
+            await asyncio.gather(*futures)
+            return scheduler, delivered
+
+    scheduler, delivered = asyncio.run(scenario())
+    # 每個互動只送出最後的狀態，被取代的編輯的 future 也都完成
+    assert stats['requests'] == routes
+    assert scheduler.coalesced == routes * edits
+    assert stats['messages'] == {str(route): f'step {edits - 1}' for route in range(routes)}
+    assert all(content == f'step {edits - 1}' for _, content, _ in delivered)
+
+
+def test_edit_waiting_out_a_429_is_replaced_by_newer_edit():
+    stats = new_stats()
+
+    async def scenario():
+        async with fake_discord(stats) as (send, delivered):
+            limited = []
+
+            async def send_once_limited(kind, target, kwargs):
+                if not limited:
+                    limited.append(kwargs['content'])
+                    raise main.RateLimited(0.3)
+                return await send(kind, target, kwargs)
+
+            scheduler = main.OutboundScheduler(send_once_limited, rate=benchmark.FAKE_GLOBAL_LIMIT * 0.9)
+            first = scheduler.edit(Target('x'), 'progress', priority=main.PRIORITY_PROGRESS)
+            await asyncio.sleep(0.1)
+            assert limited == ['progress'] and not first.done()
+            # 等待 retry_after 期間送來的新編輯取代舊的，兩個 future 都在送出後完成
+            second = scheduler.edit(Target('x'), 'result')
+            await asyncio.gather(first, second)
+            return scheduler
+
+    scheduler = asyncio.run(scenario())
+    assert scheduler.rate_limited == 1
+    assert stats['requests'] == 1
+    assert stats['messages'] == {'x': 'result'}
@@ -0,0 +1,271 @@
+"""稀有度抽樣表的正確性：alias 表必須和原本逐次計算的公式有完全相同的分布。"""
+import math
+import random
+
+import numpy as np
+import pytest
+
+import main
+
+SAMPLES = 200000
+
+
+def legacy_rarity_rates(rare_bonus, base_rates):
+    """改寫前 determine_fish_rarity 每次拋竿計算的機率 (不含最後的累加掃描)。"""
+    rates = base_rates.copy()
+
+    total_boost = rare_bonus
+    if total_boost > 0:
+        boost_to_legendary = total_boost * 0.4
+        boost_to_epic = total_boost * 0.3
+        boost_to_rare = total_boost * 0.2
+
+        rates['legendary'] = rates.get('legendary', 0) + boost_to_legendary
+        rates['epic'] = rates.get('epic', 0) + boost_to_epic
+        rates['rare'] = rates.get('rare', 0) + boost_to_rare
+
+        deductible_amount = (boost_to_legendary + boost_to_epic + boost_to_rare) - (rates['common'] + rates['rare'] + rates['epic'] + rates['legendary'] - sum(base_rates.values()))
+        if deductible_amount > 0:
+            deduct_from_common = min(rates.get('common', 0), deductible_amount * 0.7)
+            rates['common'] = rates.get('common', 0) - deduct_from_common
+            deductible_amount -= deduct_from_common
+
+            deduct_from_junk = min(rates.get('junk', 0), deductible_amount)
+            rates['junk'] = rates.get('junk', 0) - deduct_from_junk
+
+    for rarity in rates:
+        rates[rarity] = max(0, rates[rarity])
+
+    total_sum = sum(rates.values())
+    if total_sum != 0:
+        for rarity in rates:
+            rates[rarity] /= total_sum
+    else:
+        rates = {'common': 1.0}
+    return rates
+
+
+def alias_distribution(table):
+    """由 alias 表的欄位反推每個結果的機率。"""
+    mass = [0.0] * table.size
+    for i in range(table.size):
+        prob = min(table.prob[i], 1.0)
+        mass[i] += prob
+        mass[table.alias[i]] += 1.0 - prob
+    return {key: mass[i] / table.size for i, key in enumerate(table.keys)}
+
+
+def chi_square_critical(df, z=3.09):
+    """卡方分布的上 0.1% 臨界值 (Wilson-Hilferty 近似)，不需要 SciPy。"""
+    k = 2.0 / (9.0 * df)
+    return df * (1.0 - k + z * math.sqrt(k)) ** 3
+
+
+def chi_square(counts, expected):
+    return sum((counts.get(key, 0) - value) ** 2 / value for key, value in expected.items() if value > 0)
+
+
+@pytest.fixture(autouse=True)
+def seeded():
+    random.seed(1234)
+    main._rng = np.random.default_rng(1234)
+
+
+def bonuses():
+    return sorted(main.possible_rare_bonuses())
+
+
+def test_bonuses_cover_every_rod_and_bait_combination():
+    items = main.game_data['items']
+    for name, info in items.items():
+        if '魚竿' not in name:
+            continue
+        assert info['rare_bonus'] in main.possible_rare_bonuses()
+        assert info['rare_bonus'] + items['魚餌']['rare_bonus'] in main.possible_rare_bonuses()
+
+
+@pytest.mark.parametrize('rare_bonus', bonuses())
+def test_rates_match_legacy_formula(rare_bonus):
+    base_rates = main.game_data['rarity_rates']
+    assert main.compute_rarity_rates(rare_bonus) == legacy_rarity_rates(rare_bonus, base_rates)
+
+
+@pytest.mark.parametrize('rare_bonus', bonuses())
+def test_alias_table_matches_rates(rare_bonus):
+    table = main.get_rarity_table(rare_bonus)
+    expected = main.compute_rarity_rates(rare_bonus)
+    actual = alias_distribution(table)
+    assert set(actual) == set(expected)
+    for rarity, rate in expected.items():
+        assert actual[rarity] == pytest.approx(rate, abs=1e-12)
+
+
+@pytest.mark.parametrize('rare_bonus', bonuses())
+def test_alias_sampling_chi_square(rare_bonus):
+    expected_rates = main.compute_rarity_rates(rare_bonus)
+    expected = {rarity: rate * SAMPLES for rarity, rate in expected_rates.items()}
+    table = main.get_rarity_table(rare_bonus)
+
+    counts = {}
+    for _ in range(SAMPLES):
+        rarity = main.determine_fish_rarity(rare_bonus)
+        counts[rarity] = counts.get(rarity, 0) + 1
+    df = sum(1 for value in expected.values() if value > 0) - 1
+    assert chi_square(counts, expected) < chi_square_critical(df)
+
+    indices = table.sample_indices(main._rng, SAMPLES)
+    counts = dict(zip(table.keys, np.bincount(indices, minlength=table.size).tolist()))
+    assert chi_square(counts, expected) < chi_square_critical(df)
+
+
+def test_tables_follow_catalog_changes():
+    catalog = {key: main.game_data[key] for key in ('fish_data', 'items', 'rarity_rates')}
+    changed = dict(catalog, rarity_rates=dict(catalog['rarity_rates'], legendary=0.5))
+    try:
+        main.install_catalog(changed, main.compile_catalog(changed))
+        for rare_bonus in bonuses():
+            actual = alias_distribution(main.get_rarity_table(rare_bonus))
+            expected = legacy_rarity_rates(rare_bonus, changed['rarity_rates'])
+            for rarity, rate in expected.items():
+                assert actual[rarity] == pytest.approx(rate, abs=1e-12)
+    finally:
+        main.install_catalog(catalog, main.compile_catalog(catalog))
+
+
+# --- 連續拋竿：NumPy 批次抽樣必須和逐次拋竿的分布相同 ---
+def two_sample_chi_square(first, second):
+    """兩組計數是否來自同一個分布 (同質性檢定)，回傳 (統計量, 自由度)。"""
+    total_first, total_second = sum(first.values()), sum(second.values())
+    statistic = 0.0
+    keys = set(first) | set(second)
+    for key in keys:
+        a, b = first.get(key, 0), second.get(key, 0)
+        expected_a = (a + b) * total_first / (total_first + total_second)
+        expected_b = (a + b) * total_second / (total_first + total_second)
+        statistic += (a - expected_a) ** 2 / expected_a + (b - expected_b) ** 2 / expected_b
+    return statistic, len(keys) - 1
+
+
+def within_binomial(hits, trials, rate, sigmas=4.5):
+    return abs(hits - trials * rate) < sigmas * math.sqrt(trials * rate * (1 - rate))
+
+
+def species_counts(catches):
+    counts = {}
+    for rarity, entry, _, _ in catches:
+        counts[(rarity, entry[0])] = counts.get((rarity, entry[0]), 0) + 1
+    return counts
+
+
+def expected_species(rare_bonus, hits):
+    """每個 (稀有度, 魚名) 的期望次數：稀有度機率 x 該稀有度內均勻選魚。"""
+    expected = {}
+    for rarity, rate in main.compute_rarity_rates(rare_bonus).items():
+        if not main.game_data['fish_data'].get(rarity):
+            rarity = 'common'
+        species = main.get_fish_species(rarity)
+        for entry in species:
+            key = (rarity, entry[0])
+            expected[key] = expected.get(key, 0.0) + hits * rate / len(species)
+    return expected
+
+
+@pytest.mark.parametrize('rare_bonus', bonuses())
+def test_numpy_batch_matches_single_casts(rare_bonus):
+    success_rate = 0.77
+    batch = main._draw_catches_numpy(SAMPLES, success_rate, rare_bonus)
+    single = main._draw_catches_python(SAMPLES, success_rate, rare_bonus)
+
+    for catches in (batch, single):
+        assert within_binomial(len(catches), SAMPLES, success_rate)
+        expected = expected_species(rare_bonus, len(catches))
+        assert chi_square(species_counts(catches), expected) < chi_square_critical(len(expected) - 1)
+        for _, (_, min_weight, max_weight, price_per_kg, _), weight, price in catches:
+            assert min_weight <= weight <= max_weight
+            assert weight == round(weight, 2)
+            assert price == int(weight * price_per_kg)
+
+    statistic, df = two_sample_chi_square(species_counts(batch), species_counts(single))
+    assert statistic < chi_square_critical(df)
+    batch_weights = np.array([weight for _, _, weight, _ in batch])
+    single_weights = np.array([weight for _, _, weight, _ in single])
+    spread = math.sqrt(batch_weights.var() / len(batch_weights) + single_weights.var() / len(single_weights))
+    assert abs(batch_weights.mean() - single_weights.mean()) < 4.5 * spread
+
+
+def _player(bait):
+    user_data = main.UserRecord.new()
+    user_data.add_item('中級魚竿')
+    user_data.current_rod = '中級魚竿'
+    if bait:
+        user_data.add_item('魚餌', bait)
+    return user_data
+
+
+def test_resolve_casts_runs_out_of_bait_mid_batch():
+    user_data = _player(bait=30)
+    money = user_data.money
+    summary = main.resolve_casts(user_data, 100)
+
+    assert summary['bait_used'] == 30
+    assert user_data.item_count('魚餌') == 0
+    assert summary['caught'] == sum(stats['count'] for stats in summary['rarities'].values())
+    assert summary['caught'] == sum(stats['count'] for stats in summary['species'].values())
+    assert user_data.total_catches == summary['caught'] == sum(user_data.fish)
+    assert user_data.money == money + summary['money']
+
+    # 魚餌比拋竿次數多時只用掉需要的數量
+    user_data = _player(bait=150)
+    assert main.resolve_casts(user_data, 100)['bait_used'] == 100
+    assert user_data.item_count('魚餌') == 50
+
+
+def test_resolve_casts_matches_single_casts_with_partial_bait():
+    """30 個魚餌、每批 100 次拋竿：批次結算和 100 次 calculate_catch_probability + 單次抽樣的分布相同。"""
+    players, casts, bait = 2000, 100, 30
+    rod, bait_info = main.game_data['items']['中級魚竿'], main.game_data['items']['魚餌']
+    groups = (
+        (bait, min(0.95, 0.7 * rod['catch_bonus'] * bait_info['catch_bonus']), rod['rare_bonus'] + bait_info['rare_bonus']),
+        (casts - bait, min(0.95, 0.7 * rod['catch_bonus']), rod['rare_bonus']),
+    )
+    trials = players * casts
+    mean_rate = sum(count * rate for count, rate, _ in groups) / casts
+    expected = {}
+    for count, rate, rare_bonus in groups:
+        for rarity, share in main.compute_rarity_rates(rare_bonus).items():
+            expected[rarity] = expected.get(rarity, 0.0) + players * count * rate * share
+
+    batch = {}
+    batch_caught = 0
+    for _ in range(players):
+        summary = main.resolve_casts(_player(bait), casts)
+        batch_caught += summary['caught']
+        for rarity, stats in summary['rarities'].items():
+            batch[rarity] = batch.get(rarity, 0) + stats['count']
+
+    single = {}
+    single_caught = 0
+    for _ in range(players):
+        user_data = _player(bait)
+        for _ in range(casts):
+            catch_bonus, rare_bonus = main.calculate_catch_probability(user_data)
+            catches = main._draw_catches_python(1, min(0.95, 0.7 * catch_bonus), rare_bonus)
+            single_caught += len(catches)
+            for rarity, _, _, _ in catches:
+                single[rarity] = single.get(rarity, 0) + 1
+        assert user_data.item_count('魚餌') == 0
+
+    for caught, counts in ((batch_caught, batch), (single_caught, single)):
+        assert within_binomial(caught, trials, mean_rate)
+        assert chi_square(counts, expected) < chi_square_critical(len(expected) - 1)
+    statistic, df = two_sample_chi_square(batch, single)
+    assert statistic < chi_square_critical(df)
+
+
+def test_small_batches_skip_numpy(monkeypatch):
+    def numpy_draw(*args):
+        raise AssertionError('少於 CAST_NUMPY_MIN 次的拋竿應該逐次抽樣')
+
+    monkeypatch.setattr(main, '_draw_catches_numpy', numpy_draw)
+    summary = main.resolve_casts(_player(bait=5), main.CAST_NUMPY_MIN - 1)
+    assert summary['bait_used'] == 5
@@ -0,0 +1,52 @@
+"""斜線指令同步：指令樹的雜湊內容不變時必須相同、任何改變時必須不同；同步失敗時要重試，且不記錄雜湊。"""
+import asyncio
+
+import main
+
+
+def test_command_tree_hash_is_stable_and_tracks_changes(monkeypatch):
+    digest = main.command_tree_hash(1234)
+    assert digest == main.command_tree_hash(1234)
+    assert digest != main.command_tree_hash(5678)
+
+    command = main.bot.tree.get_command('fish')
+    monkeypatch.setattr(command, 'description', command.description + '!')
+    assert main.command_tree_hash(1234) != digest
+
+
+def test_failed_first_sync_is_retried_with_backoff(sqlite_storage, monkeypatch):
+    attempts = []
+    sleeps = []
+
+    async def sync():
+        attempts.append(len(attempts))
+        if len(attempts) < 3:
+            raise RuntimeError('Discord API 暫時無法使用')
+        return ['fish']
+
+    async def sleep(seconds):
+        sleeps.append(seconds)
+
+    monkeypatch.setattr(main.bot.tree, 'sync', sync)
+    monkeypatch.setattr(main, 'COMMAND_SYNC', 'auto')
+    monkeypatch.setattr(main, 'WORKER_ID', None)
+    monkeypatch.setattr(main, 'startup_marks', {})
+    monkeypatch.setattr(main, '_command_sync_retry', None)
+    monkeypatch.setattr(main.asyncio, 'sleep', sleep)
+
+    async def scenario():
+        await main.on_ready()
+        # 第一次同步失敗：雜湊不能被記錄，否則下次啟動會以為已經同步過
+        assert attempts == [0]
+        assert sqlite_storage.get_meta(main.COMMAND_TREE_HASH_KEY) is None
+        task = main._command_sync_retry
+        # 重新連線觸發的 on_ready 不會另外開始同步
+        await main.on_ready()
+        assert main.start_command_sync_retry() is task
+        return await task
+
+    assert asyncio.run(scenario()) == 'synced'
+    assert len(attempts) == 3
+    assert sleeps == [main.COMMAND_SYNC_RETRY, main.COMMAND_SYNC_RETRY * 2]
+    assert sqlite_storage.get_meta(main.COMMAND_TREE_HASH_KEY) == main.command_tree_hash(main.bot.application_id)
+    assert 'commands_synced' in main.startup_marks
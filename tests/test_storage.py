@@ -0,0 +1,17 @@
+"""資料庫位置的檢查：在 Render 上資料庫不在另外掛載的磁碟時必須警告。"""
+import main
+
+
+def test_warns_when_database_is_on_the_container_disk(monkeypatch, capsys):
+    monkeypatch.setenv('RENDER', 'true')
+    monkeypatch.setattr(main.os.path, 'ismount', lambda path: path in ('/', '/var/data'))
+    assert main.warn_if_ephemeral('fishing_data.db')
+    assert 'Persistent Disk' in capsys.readouterr().out
+    assert not main.warn_if_ephemeral('/var/data/fishing_data.db')
+    assert main.mount_point('/var/data/sub/fishing_data.db') == '/var/data'
+
+
+def test_no_warning_outside_render(monkeypatch, capsys):
+    monkeypatch.delenv('RENDER', raising=False)
+    assert not main.warn_if_ephemeral('fishing_data.db')
+    assert capsys.readouterr().out == ''
@@ -0,0 +1,87 @@
+"""LRU 玩家快取：被淘汰的玩家只留在資料庫，任何寫入都不能因為淘汰而遺失。"""
+import asyncio
+import json
+
+import main
+
+
+def _player_line(user_id, money):
+    return json.dumps({'user_id': str(user_id), 'money': money, 'items': {'基本魚竿': 1},
+                       'current_rod': '基本魚竿', 'fish_caught': {}, 'total_catches': 0})
+
+
+def _stored(storage):
+    return dict(storage.conn.execute('SELECT user_id, data FROM users').fetchall())
+
+
+def test_bulk_import_into_full_cache_keeps_every_player(sqlite_storage, monkeypatch):
+    monkeypatch.setitem(main.game_data, 'users', main.UserCache(100))
+    payload = ''.join(_player_line(user_id, user_id) + '\n' for user_id in range(1000)).encode('utf-8')
+
+    async def chunks():
+        yield payload
+
+    async def scenario():
+        report = await main.import_ndjson(chunks(), batch_size=500)
+        await main.flush_dirty_users()
+        return report
+
+    report = asyncio.run(scenario())
+    assert report['imported'] == 1000
+    stored = _stored(sqlite_storage)
+    assert len(stored) == 1000
+    assert all(json.loads(stored[str(user_id)])['money'] == user_id for user_id in range(1000))
+    # 寫回後快取回到容量以內
+    assert len(main.game_data['users']) <= 100
+
+
+def test_rod_autocomplete_never_reads_storage(sqlite_storage, monkeypatch):
+    from benchmark import FakeInteraction
+
+    record = main.UserRecord.new()
+    record.add_item('中級魚竿')
+    sqlite_storage.write_batch([('77', json.dumps(record.to_dict(), ensure_ascii=False))])
+
+    def load_user(user_id):
+        raise AssertionError('自動完成不應該讀資料庫')
+
+    monkeypatch.setattr(sqlite_storage, 'load_user', load_user)
+    # 冷玩家與沒玩過的人：不讀資料庫、不放入快取，列出所有符合的魚竿
+    for user_id in (77, 78):
+        choices = asyncio.run(main.rod_name_autocomplete(FakeInteraction(user_id), '魚竿'))
+        assert [choice.value for choice in choices] == list(main._rod_index.search('魚竿'))
+        assert str(user_id) not in main.game_data['users']
+
+    # 記憶體中的玩家只列出擁有的魚竿
+    main.game_data['users']['77'] = record
+    choices = asyncio.run(main.rod_name_autocomplete(FakeInteraction(77), ''))
+    assert [choice.value for choice in choices] == ['基本魚竿', '中級魚竿']
+
+
+def test_new_player_is_read_from_storage_once(sqlite_storage, monkeypatch):
+    reads = []
+    load_user = sqlite_storage.load_user
+    monkeypatch.setattr(sqlite_storage, 'load_user', lambda user_id: reads.append(user_id) or load_user(user_id))
+    users = main.game_data['users']
+
+    async def command(user_id):
+        async with main.user_locks.hold(user_id):
+            return main.get_user_data(user_id)
+
+    # 第一次玩：prefetch 在執行緒中讀一次資料庫，get_user_data 不再同步讀取
+    record = asyncio.run(command('501'))
+    assert reads == ['501']
+    assert users.get('501') is record
+    assert '501' not in users._absent
+
+    # 只查詢、沒有建立紀錄的人：之後的 get 與 prefetch 都不讀資料庫
+    asyncio.run(users.prefetch('502'))
+    assert users.get('502') is None
+    asyncio.run(users.prefetch('502'))
+    assert reads == ['501', '502']
+
+    # 從記憶體移除後 (例如釋放租約) 不再認定資料庫裡沒有
+    sqlite_storage.write_batch([('502', json.dumps(main.UserRecord.new().to_dict() | {'money': 7}, ensure_ascii=False))])
+    users.pop('502')
+    assert users.get('502').money == 7
+    assert reads == ['501', '502', '502']
@@ -0,0 +1,56 @@
+"""每位玩家的指令依序執行：數千位玩家同時下指令時，金錢與道具的不變量都必須成立。"""
+import argparse
+import asyncio
+import random
+
+import benchmark
+import main
+
+PLAYERS = 2000
+UPDATES_PER_PLAYER = 10
+
+
+def test_lock_table_serialises_each_player_and_runs_players_in_parallel():
+    counters = {}
+    inside = {}
+    peak = {'player': 0, 'total': 0}
+
+    async def update(user_id):
+        async with main.user_locks.hold(user_id):
+            inside[user_id] = inside.get(user_id, 0) + 1
+            peak['player'] = max(peak['player'], inside[user_id])
+            peak['total'] = max(peak['total'], sum(1 for count in inside.values() if count))
+            # 讀取 -> 讓出事件迴圈 -> 寫入：沒有鎖的話其他協程會在中間寫入，更新就會遺失
+            value = counters.get(user_id, 0)
+            await asyncio.sleep(0)
+            counters[user_id] = value + 1
+            inside[user_id] -= 1
+
+    async def scenario():
+        updates = [str(10 ** 6 + player) for player in range(PLAYERS) for _ in range(UPDATES_PER_PLAYER)]
+        random.shuffle(updates)
+        await asyncio.gather(*(update(user_id) for user_id in updates))
+
+    asyncio.run(scenario())
+    assert counters == {str(10 ** 6 + player): UPDATES_PER_PLAYER for player in range(PLAYERS)}
+    assert peak['player'] == 1
+    assert peak['total'] > 1
+    # 沒有持有者與等待者的鎖都已回收
+    assert len(main.user_locks) == 0
+
+
+def test_concurrent_commands_keep_invariants():
+    args = argparse.Namespace(
+        users=PLAYERS, ops=20000, concurrency=256, start_money=10000, full_collection=False,
+        mix='fish=6,fish_multi=1,buy=2,fish_item=1,bag=2,new_game=1,load=1',
+    )
+    report = asyncio.run(benchmark.run(args))
+
+    assert report['invariant_errors'] == 0
+    assert sum(stats['count'] for stats in report['commands'].values()) == args.ops
+    assert report['throughput_ops_s'] > 0
+    assert len(main.user_locks) == 0
+    for user_id in range(PLAYERS):
+        user_data = main.game_data['users'].peek(str(user_id))
+        assert user_data.money >= 0
+        assert user_data.current_rod == '基本魚竿' or user_data.item_count(user_data.current_rod) > 0
@@ -0,0 +1,87 @@
+"""UserRecord 與舊的 dict/JSON 格式 (/save、/load、資料庫) 互相轉換不能遺失任何資料。"""
+import json
+
+import pytest
+
+import main
+
+LEGACY_PLAYERS = [
+    {
+        'money': 1234,
+        'items': {'基本魚竿': 1, '中級魚竿': 1, '魚餌': 3},
+        'current_rod': '中級魚竿',
+        'fish_caught': {'小魚': 5, '龍魚': 1, '破鞋': 2},
+        'total_catches': 8,
+    },
+    {
+        # 目錄裡已經沒有 (或從來沒有) 的道具與魚，以及不認得的欄位
+        'money': 0,
+        'items': {'基本魚竿': 1, '古代魚竿': 2, '魚餌': 0},
+        'current_rod': '古代魚竿',
+        'fish_caught': {'外星魚': 7, '小魚': 0},
+        'total_catches': 7,
+        'nickname': '老漁夫',
+        'settings': {'notify': True},
+    },
+    {
+        'money': 10 ** 12,
+        'items': {},
+        'current_rod': '基本魚竿',
+        'fish_caught': {},
+        'total_catches': 0,
+    },
+]
+
+
+def without_zero_counts(data):
+    data = json.loads(json.dumps(data))
+    for key in ('items', 'fish_caught'):
+        data[key] = {name: count for name, count in data[key].items() if count}
+    return data
+
+
+@pytest.mark.parametrize('legacy', LEGACY_PLAYERS)
+def test_round_trip_keeps_legacy_dicts(legacy):
+    record = main.UserRecord.from_dict(json.loads(json.dumps(legacy)))
+    assert record.to_dict() == without_zero_counts(legacy)
+    # 再經過一次 JSON (資料庫與 /save 檔) 仍然相同
+    again = main.UserRecord.from_dict(json.loads(json.dumps(record.to_dict(), ensure_ascii=False)))
+    assert again.to_dict() == record.to_dict()
+    for name, count in legacy['items'].items():
+        assert record.item_count(name) == count
+    for name, count in legacy['fish_caught'].items():
+        assert record.fish_count(name) == count
+
+
+def test_missing_fields_use_new_player_defaults():
+    record = main.UserRecord.from_dict({})
+    assert record.to_dict() == {
+        'money': 100, 'items': {'基本魚竿': 1}, 'current_rod': '基本魚竿', 'fish_caught': {}, 'total_catches': 0,
+    }
+
+
+def test_negative_counts_are_clamped():
+    record = main.UserRecord.from_dict({'items': {'基本魚竿': 1, '魚餌': -4}, 'fish_caught': {'小魚': -2, '鯉魚': 3}})
+    assert record.item_count('魚餌') == 0
+    assert record.fish_count('小魚') == 0
+    assert record.to_dict()['fish_caught'] == {'鯉魚': 3}
+
+
+def test_counts_beyond_int32_are_rejected():
+    with pytest.raises(OverflowError):
+        main.UserRecord.from_dict({'fish_caught': {'小魚': 2 ** 31}})
+    assert main._decode_user_row('1', json.dumps({'items': {'魚餌': 2 ** 40}})) is None
+
+
+def test_startup_skips_corrupt_rows(sqlite_storage, capsys):
+    good = main.UserRecord.new().to_dict() | {'money': 555}
+    sqlite_storage.write_batch([
+        ('1', json.dumps(good, ensure_ascii=False)),
+        ('2', json.dumps({'fish_caught': {'小魚': 2 ** 31}})),
+        ('3', '{not json'),
+    ])
+    main.load_persisted_users()
+    assert main.game_data['users'].peek('1').money == 555
+    assert '2' not in main.game_data['users'] and '3' not in main.game_data['users']
+    output = capsys.readouterr().out
+    assert '略過損壞的玩家資料: 2' in output and '略過損壞的玩家資料: 3' in output